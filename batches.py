@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Length-bucketed, padded NumPy batches of integer encoded words of discourse relation parts (requires *NumPy*).
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+try:
+    import numpy as np
+except ImportError:  # optional for batches
+    np = None
+
+from .words import RELATION_PARTS
+
+
+class RelationBatcher(object):
+    """Iterator over batches of padded integer matrices and length vectors of relation parts (`Arg1`, `Arg2`, `Connective`, `Punctuation`).
+
+    Token ids of all relation parts are gathered once into flat arrays, so batches are filled by vectorized copies into preallocated buffers (reused between batches unless `copy`). With `bucket` relations of similar lengths are batched together to reduce padding. Order is shuffled reproducibly by `seed` and epoch number.
+
+        batcher = RelationBatcher(train['rel_parts'], train['words_ids'], batch_size=32, seed=42)
+        for batch in batcher.epoch(0):
+            batch['Arg1'].shape = (32, 41)
+            batch['Arg1Len'] = array([36, 12, ...], dtype=int32)
+            batch['rel_ids'] = array([14905, 14887, ...])
+    """
+
+    def __init__(self, rel_parts, words_ids, rel_ids=None, parts=RELATION_PARTS, batch_size=32, max_len=None, bucket=True, shuffle=True, seed=None, pad_id=0, vocab=None, dtype='int32'):
+        if np is None:
+            raise ImportError("RelationBatcher requires numpy")
+        if rel_ids is None:
+            rel_ids = sorted(rel_parts)
+        if not isinstance(max_len, dict):
+            max_len = dict( (part, max_len)  for part in parts )
+        self.rel_ids = np.asarray(rel_ids)
+        self.parts = tuple(parts)
+        self.batch_size = batch_size
+        self.bucket = bucket
+        self.shuffle = shuffle
+        self.seed = seed
+        self.pad_id = pad_id
+
+        # gather integer encoded words of relation parts into flat arrays with offsets
+        doc_ids_cache = {}
+        self.tokens = {}
+        self.offsets = {}
+        self.lens = {}
+        self.buffers = {}
+        for part in self.parts:
+            flat = []
+            lens = np.zeros(len(rel_ids), dtype='int32')
+            for i, rel_id in enumerate(rel_ids):
+                rel = rel_parts[rel_id]
+                doc_id = rel['DocID']
+                if doc_id not in doc_ids_cache:
+                    doc_words = words_ids[doc_id]
+                    if vocab is not None:
+                        doc_words = vocab.encode_seq(doc_words)
+                    doc_ids_cache[doc_id] = np.asarray(doc_words, dtype=dtype)
+                token_ids = rel[part]
+                if max_len[part] is not None:
+                    token_ids = token_ids[:max_len[part]]
+                flat.append(doc_ids_cache[doc_id][list(token_ids)])
+                lens[i] = len(token_ids)
+            self.tokens[part] = np.concatenate(flat) if flat else np.zeros(0, dtype=dtype)
+            self.offsets[part] = np.concatenate([[0], np.cumsum(lens)]).astype('int64')
+            self.lens[part] = lens
+            self.buffers[part] = np.empty((batch_size, max(1, int(lens.max()) if len(lens) else 1)), dtype=dtype)
+        self.total_lens = sum( self.lens[part]  for part in self.parts )
+
+    def __len__(self):
+        return (len(self.rel_ids) + self.batch_size - 1) // self.batch_size
+
+    def batch_order(self, epoch=0):
+        """List of arrays of relation indexes for each batch in given epoch."""
+
+        rng = np.random.RandomState(None if self.seed is None else self.seed + epoch)
+        n = len(self.rel_ids)
+        if self.bucket:
+            # sort by total length (random tie-break), then shuffle batches
+            tie = rng.random_sample(n) if self.shuffle else np.arange(n)
+            order = np.lexsort((tie, self.total_lens))
+        elif self.shuffle:
+            order = rng.permutation(n)
+        else:
+            order = np.arange(n)
+        batches = [ order[i:i + self.batch_size]  for i in range(0, n, self.batch_size) ]
+        if self.shuffle:
+            batches = [ batches[i]  for i in rng.permutation(len(batches)) ]
+        return batches
+
+    def fill(self, idx, copy=False):
+        """Fill buffers with padded batch of relations by indexes."""
+
+        batch = {'rel_ids': self.rel_ids[idx]}
+        n = len(idx)
+        for part in self.parts:
+            lens = self.lens[part][idx]
+            width = max(1, int(lens.max()) if n else 1)
+            buf = self.buffers[part][:n, :width]
+            buf.fill(self.pad_id)
+
+            # scatter tokens of all rows at once
+            total = int(lens.sum())
+            if total:
+                rows = np.repeat(np.arange(n), lens)
+                row_starts = np.repeat(np.cumsum(lens) - lens, lens)
+                cols = np.arange(total) - row_starts
+                src = np.repeat(self.offsets[part][idx], lens) + cols
+                buf[rows, cols] = self.tokens[part][src]
+            batch[part] = buf.copy() if copy else buf
+            batch[part + 'Len'] = lens
+        return batch
+
+    def epoch(self, epoch=0, copy=False):
+        """Iterate over batches of one epoch (without `copy` arrays are overwritten by next batch)."""
+
+        for idx in self.batch_order(epoch):
+            yield self.fill(idx, copy=copy)
+
+
+### Tests
+
+def test_relation_batcher():
+    import pytest
+    if np is None:
+        pytest.skip("numpy not available")
+    from .load import Conll16stDataset
+
+    dataset = Conll16stDataset("./conll16st-en-trial", with_ids=True)
+    rel_parts = dataset['rel_parts']
+    words_ids = dataset['words_ids']
+    batcher = RelationBatcher(rel_parts, words_ids, batch_size=8, seed=42)
+    assert len(batcher) == 4
+
+    seen = []
+    for batch in batcher.epoch(0, copy=True):
+        assert batch['Arg1'].shape[0] == len(batch['rel_ids']) <= 8
+        for j, rel_id in enumerate(batch['rel_ids']):
+            seen.append(rel_id)
+            doc_id = rel_parts[rel_id]['DocID']
+            for part in RELATION_PARTS:
+                n = batch[part + 'Len'][j]
+                assert n == len(rel_parts[rel_id][part])
+                assert list(batch[part][j, :n]) == [ words_ids[doc_id][t]  for t in rel_parts[rel_id][part] ]
+                assert (batch[part][j, n:] == 0).all()
+    assert sorted(seen) == dataset['rel_ids']
+
+    # reproducible shuffling by seed and epoch
+    order0 = [ list(idx)  for idx in batcher.batch_order(0) ]
+    assert order0 == [ list(idx)  for idx in RelationBatcher(rel_parts, words_ids, batch_size=8, seed=42).batch_order(0) ]
+    assert order0 != [ list(idx)  for idx in batcher.batch_order(1) ]
+
+    # buckets reduce padding
+    padded = lambda b: sum( batch['Arg1'].size + batch['Arg2'].size  for batch in b.epoch(0) )
+    assert padded(batcher) <= padded(RelationBatcher(rel_parts, words_ids, batch_size=8, bucket=False, seed=42))
+
+    # truncation and encoding of words with vocabulary
+    batcher = RelationBatcher(rel_parts, dataset['words'], batch_size=8, max_len=5, shuffle=False, vocab=dataset['vocabs']['words'])
+    batch = next(batcher.epoch())
+    assert batch['Arg2'].shape[1] <= 5
+    assert batch['Arg2Len'].max() <= 5
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
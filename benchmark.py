@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Benchmark loading stages of CoNLL16st datasets on a synthetic corpus and compare with stored baseline.
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+import argparse
+import codecs
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from conll16st_data.instrument import Instrument
+from conll16st_data.load import load_all
+from conll16st_data.synthetic import SCALES, generate_dataset
+
+log = logging.getLogger(__name__)
+
+def run_stages(dataset_dir, repeat=1):
+    """Benchmark stages of `load_all()` on dataset with its instrumentation (best of repeated runs, and peak memory of an extra traced run)."""
+
+    best = None
+    for _ in range(repeat):
+        instrument = Instrument()
+        load_all(dataset_dir, with_rel_senses_all=True, instrument=instrument)
+        if best is None or instrument.report()['wall'] < best.report()['wall']:
+            best = instrument
+    traced = Instrument(trace_memory=True)
+    load_all(dataset_dir, with_rel_senses_all=True, instrument=traced)
+
+    stages = {}
+    for record, traced_record in zip(best.records, traced.records):
+        stages[record['name']] = dict(record, peak_mem=traced_record['peak_mem'])
+    report = best.report()
+    stages['load_all'] = {'wall': report['wall'], 'cpu': report['cpu'], 'peak_mem': max( r['peak_mem']  for r in traced.records ), 'items': stages['load_parses']['items']}
+    for name, stats in sorted(stages.items()):
+        log.info("  {}: {:.3f}s wall, {:.3f}s cpu, {:.1f} MB peak, {} items".format(name, stats['wall'], stats['cpu'], stats['peak_mem'] / 1e6, stats['items']))
+    return stages
+
+
+def run_conv(dataset_dir, lang, stream=False):
+    """Benchmark conversion script `conv_words2jsonl.py` in a subprocess."""
+
+    fd, output_jsonl = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "conv_words2jsonl.py"), "--dataset_dir", dataset_dir, "--output_jsonl", output_jsonl, "--lang", lang]
+    if stream:
+        cmd.append("--stream")
+    wall = time.time()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(cmd, stdout=devnull, stderr=devnull)
+    wall = time.time() - wall
+    with codecs.open(output_jsonl, 'r', encoding='utf8') as f:
+        items = sum( 1  for _ in f )
+    os.remove(output_jsonl)
+    stats = {'wall': wall, 'cpu': None, 'peak_mem': None, 'items': items}
+    log.info("  {}: {:.3f}s wall, {} items".format("conv_words2jsonl" + ("_stream" if stream else ""), wall, items))
+    return stats
+
+
+def compare(results, baseline, tolerance):
+    """Compare benchmark results with baseline and return names of regressed stages."""
+
+    regressions = []
+    log.info("compare with baseline (tolerance {:.0%})".format(tolerance))
+    log.info("  {:<24} {:>10} {:>10} {:>8}".format("stage", "wall", "baseline", "ratio"))
+    for name, stats in sorted(results['stages'].items()):
+        if name not in baseline['stages']:
+            continue
+        base = baseline['stages'][name]
+        if base['wall']:
+            ratio = stats['wall'] / base['wall']
+        else:
+            ratio = float('inf') if stats['wall'] else 1.
+        flag = ""
+        if ratio > 1. + tolerance:
+            flag = " REGRESSION"
+            regressions.append(name)
+        if base['items'] != stats['items']:
+            flag += " (items {} != {})".format(stats['items'], base['items'])
+        log.info("  {:<24} {:>9.3f}s {:>9.3f}s {:>7.2f}x{}".format(name, stats['wall'], base['wall'], ratio, flag))
+    return regressions
+
+
+### Tests
+
+def test_compare():
+    baseline = {'stages': {
+        'load_parses': {'wall': 1.0, 'items': 10},
+        'extract_docs': {'wall': 2.0, 'items': 100},
+        'instant': {'wall': 0.0, 'items': 0},
+    }}
+    results = {'stages': {
+        'load_parses': {'wall': 1.1, 'items': 10},  # within tolerance
+        'extract_docs': {'wall': 3.0, 'items': 99},  # slower
+        'instant': {'wall': 0.1, 'items': 0},  # no baseline time
+        'new_stage': {'wall': 5.0, 'items': 1},  # missing in baseline
+    }}
+    assert compare(results, baseline, 0.2) == ['extract_docs', 'instant']
+    assert compare(results, baseline, 0.6) == ['instant']
+    assert compare(baseline, baseline, 0.) == []
+
+def test_run_stages():
+    stages = run_stages("./conll16st-en-trial")
+    assert stages['load_parses']['items'] == 1
+    assert stages['load_all']['items'] == 1
+    assert stages['load_all']['wall'] >= stages['extract_docs']['wall']
+
+
+if __name__ == '__main__':
+    # parse arguments
+    argp = argparse.ArgumentParser(description=__doc__.strip().split("\n", 1)[0])
+    argp.add_argument('--dataset_dir', type=str, default=None,
+        help="dataset directory to benchmark (default: generate synthetic dataset)")
+    argp.add_argument('--lang', default="en",
+        choices=["en", "zh"],
+        help="language style of synthetic dataset (en/zh)")
+    argp.add_argument('--scale', default="trial",
+        help="scale of synthetic dataset ({} or number of documents)".format("/".join(sorted(SCALES))))
+    argp.add_argument('--seed', type=int, default=0,
+        help="random seed of synthetic dataset")
+    argp.add_argument('--repeat', type=int, default=1,
+        help="repeat timings and keep best")
+    argp.add_argument('--output_json', type=str, default=None,
+        help="save results in JSON format (eg. as new baseline)")
+    argp.add_argument('--baseline_json', type=str, default=None,
+        help="compare results with baseline in JSON format")
+    argp.add_argument('--tolerance', type=float, default=0.2,
+        help="allowed relative slowdown against baseline")
+    args = argp.parse_args()
+
+    # configure logging
+    logging.basicConfig(format="[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M", level=logging.DEBUG)
+
+    # generate synthetic dataset
+    dataset_dir = args.dataset_dir
+    scale = args.scale
+    if dataset_dir is None:
+        if scale not in SCALES:
+            scale = dict(SCALES['{}-train'.format(args.lang)], docs=int(scale))
+        dataset_dir = tempfile.mkdtemp(prefix="conll16st-{}-".format(args.lang))
+        log.info("generate synthetic dataset ({})".format(dataset_dir))
+        counts = generate_dataset(dataset_dir, lang=args.lang, scale=scale, seed=args.seed)
+        log.info("  " + ", ".join( "{}: {}".format(k, v)  for k, v in sorted(counts.items()) ))
+
+    # benchmark stages
+    log.info("benchmark stages of load_all ({})".format(dataset_dir))
+    results = {
+        'dataset_dir': args.dataset_dir,
+        'lang': args.lang,
+        'scale': scale,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'stages': run_stages(dataset_dir, repeat=args.repeat),
+    }
+    log.info("benchmark conversion to JSONL")
+    results['stages']['conv_words2jsonl'] = run_conv(dataset_dir, args.lang)
+    results['stages']['conv_words2jsonl_stream'] = run_conv(dataset_dir, args.lang, stream=True)
+
+    if args.dataset_dir is None:
+        shutil.rmtree(dataset_dir)
+
+    if args.output_json:
+        with codecs.open(args.output_json, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    # compare with baseline
+    regressions = []
+    if args.baseline_json:
+        with codecs.open(args.baseline_json, 'r', encoding='utf8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        log.info("regressions: {}".format(", ".join(regressions)))
+        sys.exit(1)
+    log.info("done")
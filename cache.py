@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Persistent on-disk cache of loaded CoNLL16st/CoNLL15st datasets.
+
+Cache entries are keyed by sizes and modification times (or content hashes) of all input files and loader arguments, so any change of the dataset automatically invalidates them.
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+import hashlib
+import os
+import tempfile
+
+from six.moves import cPickle as pickle
+
+from .files import PARSES_FFMTS, RAW_FFMTS, RELATIONS_FFMTS, RELATIONSNOS_FFMTS
+
+
+CACHE_VERSION = 1  # increase on incompatible changes of cached structures
+
+
+def get_input_files(dataset_dir):
+    """List all existing input files of CoNLL16st dataset."""
+
+    fnames = []
+    for ffmt in PARSES_FFMTS + RELATIONS_FFMTS + RELATIONSNOS_FFMTS:
+        fname = ffmt.format(dataset_dir)
+        if os.path.isfile(fname):
+            fnames.append(fname)
+    for raw_ffmt in RAW_FFMTS:
+        raw_dir = os.path.dirname(raw_ffmt.format(dataset_dir, ""))
+        if os.path.isdir(raw_dir):
+            fnames.extend(sorted( os.path.join(raw_dir, n)  for n in os.listdir(raw_dir) ))
+    return fnames
+
+
+def get_fingerprint(dataset_dir, with_hashes=False):
+    """Fingerprint input files of CoNLL16st dataset by their sizes and modification times or content hashes."""
+
+    fingerprint = []
+    for fname in get_input_files(dataset_dir):
+        rel_fname = os.path.relpath(fname, dataset_dir)
+        if with_hashes:
+            h = hashlib.sha1()
+            with open(fname, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            fingerprint.append((rel_fname, h.hexdigest()))
+        else:
+            st = os.stat(fname)
+            fingerprint.append((rel_fname, st.st_size, st.st_mtime))
+    return fingerprint
+
+
+def get_cache_key(dataset_dir, with_hashes=False, **kwargs):
+    """Compute cache key from input files of CoNLL16st dataset and loader arguments."""
+
+    args = sorted( (k, sorted(v) if isinstance(v, (list, tuple, set)) else v)  for k, v in kwargs.items() )
+    key = repr((CACHE_VERSION, os.path.abspath(dataset_dir), get_fingerprint(dataset_dir, with_hashes=with_hashes), args))
+    return hashlib.sha1(key.encode('utf8')).hexdigest()
+
+
+def load_cache(cache_dir, key):
+    """Load cached data by key or return `None` if missing."""
+
+    fname = os.path.join(cache_dir, "{}.pickle".format(key))
+    try:
+        with open(fname, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def save_cache(cache_dir, key, data):
+    """Save data to cache by key (atomically replacing previous entry)."""
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    fname = os.path.join(cache_dir, "{}.pickle".format(key))
+    fd, tmp_fname = tempfile.mkstemp(prefix=".{}.".format(key), dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_fname, fname)
+    except:
+        os.remove(tmp_fname)
+        raise
+
+
+### Tests
+
+def test_cache_key():
+    dataset_dir = "./conll16st-en-trial"
+    t_fnames = ["parses.json", "relations.json", "relations-no-senses.json", "raw/wsj_1000"]
+
+    fnames = [ os.path.relpath(fname, dataset_dir)  for fname in get_input_files(dataset_dir) ]
+    assert sorted(fnames) == sorted(t_fnames)
+
+    key0 = get_cache_key(dataset_dir, doc_ids=None, filter_types=None)
+    assert key0 == get_cache_key(dataset_dir, filter_types=None, doc_ids=None)
+    assert key0 != get_cache_key(dataset_dir, doc_ids=["wsj_1000"], filter_types=None)
+    assert key0 != get_cache_key(dataset_dir, doc_ids=None, filter_types=["Explicit"])
+    assert key0 != get_cache_key(dataset_dir, with_hashes=True, doc_ids=None, filter_types=None)
+
+def test_cache_invalidation():
+    import shutil
+    from .load import load_all
+
+    dataset_dir = "./conll16st-en-trial"
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tmp_dataset_dir = os.path.join(tmp_dir, "dataset")
+        cache_dir = os.path.join(tmp_dir, "cache")
+        shutil.copytree(dataset_dir, tmp_dataset_dir)
+
+        data0 = load_all(tmp_dataset_dir, cache_dir=cache_dir)
+        assert len(os.listdir(cache_dir)) == 1
+        data1 = load_all(tmp_dataset_dir, cache_dir=cache_dir)
+        assert data1 == data0
+        assert len(os.listdir(cache_dir)) == 1
+
+        # modified input file
+        fname = os.path.join(tmp_dataset_dir, "relations.json")
+        with open(fname, 'rb') as f:
+            lines = f.readlines()
+        with open(fname, 'wb') as f:
+            f.writelines(lines[1:])
+        data2 = load_all(tmp_dataset_dir, cache_dir=cache_dir)
+        assert len(data2[6]) == len(data0[6]) - 1  # rel_ids
+        assert len(os.listdir(cache_dir)) == 2
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
@@ -11,8 +11,17 @@ import argparse
 import codecs
 import json
 import logging
+import multiprocessing
+import os
+import zlib
+from collections import deque
 
-from conll16st_data.load import Conll16stDataset
+try:
+    import zstandard
+except ImportError:  # optional for zstd compressed shards
+    zstandard = None
+
+from conll16st_data.load import Conll16stDataset, iter_documents
 
 
 # constants for CoNLL16st datasets
@@ -84,7 +93,7 @@ def target_agg_labels(dataset):
     return target
 
 def extract_sample(dataset, rel_id):
-    """Extract training sample with word sequences of text spans."""
+    """Extract training sample with word sequences of text spans (from whole dataset or document bundle)."""
 
     doc_id = dataset['rel_parts'][rel_id]['DocID']
     doc_len = len(dataset['words'][doc_id])
@@ -116,47 +125,247 @@ def extract_sample(dataset, rel_id):
     return sample
 
 
-# parse arguments
-argp = argparse.ArgumentParser(description=__doc__.strip().split("\n", 1)[0])
-argp.add_argument('--dataset_dir', type=str, default="./conll16st-en-trial",
-    help="CoNLL16st dataset directory to convert")
-argp.add_argument('--output_jsonl', type=str, default="./conll16st-en-trial.jsonl",
-    help="Converted output in JSONL format")
-argp.add_argument('--lang', default="en",
-    choices=["en", "zh"],
-    help="dataset language (en/zh)")
-args = argp.parse_args()
-
-# configure logging
-logging.basicConfig(format="[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M", level=logging.DEBUG)
-log = logging.getLogger(__name__)
-
-# load CoNLL16st dataset
-filter_types = None  #['Implicit']
-
-log.info("load dataset ({})".format(args.dataset_dir))
-dataset = Conll16stDataset(args.dataset_dir, lang=args.lang, filter_types=filter_types, with_rel_senses_all=True)
-dataset['target'] = target_agg_labels(dataset)
-log.info("  " + dataset.summary())
-
-# gold labels distribution
-log.info("gold labels distribution")
-counts = {}
-for rel_id in dataset['rel_ids']:
-    for k in dataset['target'][rel_id]:
-        try:
-            counts[k] += 1
-        except KeyError:
-            counts[k] = 1
-for name, count in sorted(counts.items(), key=lambda a: a[1], reverse=True):
-    log.info("- {}: {}".format(name, count))
-
-# convert samples and save to JSONL format
-log.info("convert ({})".format(args.output_jsonl))
-with codecs.open(args.output_jsonl, 'w', encoding='utf8') as f:
-    for rel_id in dataset['rel_ids']:
-        sample = extract_sample(dataset, rel_id)
-        f.write(json.dumps(sample, sort_keys=True, ensure_ascii=False))
-        f.write("\n")
-
-log.info("done")
+SHARD_COMPRESS_SUFFIXES = {'none': "", 'gzip': ".gz", 'zstd': ".zst"}
+
+
+def compress_data(data, compress='none'):
+    """Compress bytes as a standalone gzip member or zstd frame (that can be concatenated)."""
+
+    if compress == 'gzip':
+        c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress(data) + c.flush()
+    elif compress == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def encode_batch(args):
+    """Extract, serialize and compress samples from a batch of documents (in worker process)."""
+
+    docs, compress = args
+    lines = []
+    counts = {}
+    for doc in docs:
+        for rel_id in doc['rel_ids']:
+            sample = extract_sample(doc, rel_id)
+            lines.append(json.dumps(sample, sort_keys=True, ensure_ascii=False))
+            for k in doc['target'][rel_id]:
+                counts[k] = counts.get(k, 0) + 1
+    data = u"".join( line + u"\n"  for line in lines ).encode('utf8')
+    return compress_data(data, compress), len(lines), counts
+
+
+def iter_batches(docs, batch_size):
+    """Group documents into batches with only data needed by `extract_sample()`."""
+
+    batch = []
+    for doc in docs:
+        batch.append({
+            'words': doc['words'],
+            'rel_ids': doc['rel_ids'],
+            'rel_parts': doc['rel_parts'],
+            'target': target_agg_labels(doc),
+        })
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _imap_bounded(pool, fn, iterable, max_pending):
+    """Like `pool.imap()`, but reads at most `max_pending` items ahead of consumed results (unlike its task feeder that exhausts the iterable)."""
+
+    pending = deque()
+    for args in iterable:
+        pending.append(pool.apply_async(fn, (args,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def convert_sharded(docs, output_prefix, shards, compress='none', workers=None, batch_size=8):
+    """Convert samples in parallel to `shards` JSONL files (optionally compressed) with manifest of counts per shard.
+
+    Batches of documents are assigned to shards round robin, each batch is serialized and compressed by a worker process, and appended to its shard as a standalone gzip member or zstd frame. Output is deterministic for any number of workers, and documents are read only a few batches ahead of written ones (memory stays bounded when streaming).
+    """
+
+    suffix = ".jsonl" + SHARD_COMPRESS_SUFFIXES[compress]
+    paths = [ "{}-{:05d}-of-{:05d}{}".format(output_prefix, i, shards, suffix)  for i in range(shards) ]
+    manifest = {
+        'format': "jsonl",
+        'compress': compress,
+        'samples': 0,
+        'labels': {},
+        'shards': [ {'path': os.path.basename(path), 'samples': 0, 'bytes': 0}  for path in paths ],
+    }
+
+    fs = [ open(path, 'wb')  for path in paths ]
+    pool = None
+    try:
+        batches = ( (batch, compress)  for batch in iter_batches(docs, batch_size) )
+        if workers is not None and workers > 1:
+            pool = multiprocessing.Pool(workers)
+            results = _imap_bounded(pool, encode_batch, batches, 2 * workers)
+        else:
+            results = ( encode_batch(args)  for args in batches )
+        for i, (data, count, counts) in enumerate(results):
+            shard = manifest['shards'][i % shards]
+            fs[i % shards].write(data)
+            shard['samples'] += count
+            shard['bytes'] += len(data)
+            manifest['samples'] += count
+            for k, v in counts.items():
+                manifest['labels'][k] = manifest['labels'].get(k, 0) + v
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for f in fs:
+            f.close()
+
+    with codecs.open("{}.manifest.json".format(output_prefix), 'w', encoding='utf8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+    return manifest
+
+
+### Tests
+
+def _square(x):
+    return x * x
+
+def test_imap_bounded():
+    consumed = []
+
+    def _items():
+        for i in range(200):
+            consumed.append(i)
+            yield i
+
+    pool = multiprocessing.Pool(2)
+    try:
+        results = _imap_bounded(pool, _square, _items(), 4)
+        assert next(results) == 0
+        assert len(consumed) == 4
+        assert next(results) == 1
+        assert len(consumed) == 5
+        assert list(results) == [ i * i  for i in range(2, 200) ]
+    finally:
+        pool.terminate()
+
+def test_convert_sharded():
+    import gzip
+    import shutil
+    import tempfile
+    from conll16st_data.synthetic import generate_dataset
+
+    def _read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        synthetic_dir = os.path.join(tmp_dir, "synthetic")
+        generate_dataset(synthetic_dir, scale={'docs': 6, 'sentences': 6, 'words': 12, 'rels': 0.8}, vocab_size=100)
+        for dataset_dir, t_samples in [("./conll16st-en-trial", 29), (synthetic_dir, None)]:
+            outputs = []
+            for workers in [None, 2]:
+                output_dir = tempfile.mkdtemp(dir=tmp_dir)
+                output_prefix = os.path.join(output_dir, "out")
+                docs = iter_documents(dataset_dir, with_rel_senses_all=True, outputs=['words'])
+                manifest = convert_sharded(docs, output_prefix, 2, compress='gzip', workers=workers, batch_size=2)
+                paths = [ os.path.join(output_dir, shard['path'])  for shard in manifest['shards'] ]
+                assert manifest == json.loads(_read(output_prefix + ".manifest.json").decode('utf8'))
+
+                # decoded line counts match manifest
+                for shard, path in zip(manifest['shards'], paths):
+                    assert shard['bytes'] == os.path.getsize(path)
+                    with gzip.open(path, 'rb') as f:
+                        lines = f.read().decode('utf8').splitlines()
+                    assert len(lines) == shard['samples']
+                    for line in lines:
+                        assert sorted(json.loads(line)) == ['arg1_words', 'arg2_words', 'conn_words', 'doc_id', 'gold_labels', 'punc_words', 'rel_id']
+                assert manifest['samples'] == sum( shard['samples']  for shard in manifest['shards'] )
+                if t_samples is not None:
+                    assert manifest['samples'] == t_samples
+                outputs.append((manifest, [ _read(path)  for path in paths ]))
+
+            # identical output for any number of workers
+            assert outputs[0] == outputs[1]
+            if t_samples is None:
+                assert all( shard['samples'] > 0  for shard in outputs[0][0]['shards'] )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    # parse arguments
+    argp = argparse.ArgumentParser(description=__doc__.strip().split("\n", 1)[0])
+    argp.add_argument('--dataset_dir', type=str, default="./conll16st-en-trial",
+        help="CoNLL16st dataset directory to convert")
+    argp.add_argument('--output_jsonl', type=str, default="./conll16st-en-trial.jsonl",
+        help="Converted output in JSONL format")
+    argp.add_argument('--lang', default="en",
+        choices=["en", "zh"],
+        help="dataset language (en/zh)")
+    argp.add_argument('--stream', action='store_true',
+        help="stream dataset document by document in constant memory (samples ordered by document, not globally by relation id)")
+    argp.add_argument('--shards', type=int, default=0,
+        help="stream and write output in given number of shards with manifest (named by --output_jsonl without extension)")
+    argp.add_argument('--compress', default="none",
+        choices=sorted(SHARD_COMPRESS_SUFFIXES),
+        help="compression of output shards (zstd requires zstandard)")
+    argp.add_argument('--workers', type=int, default=None,
+        help="number of worker processes for serializing shards")
+    args = argp.parse_args()
+    if args.compress == 'zstd' and zstandard is None:
+        argp.error("zstd compression requires zstandard package")
+    if args.compress != 'none' and args.shards < 1:
+        argp.error("compression requires output in shards")
+
+    # configure logging
+    logging.basicConfig(format="[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M", level=logging.DEBUG)
+    log = logging.getLogger(__name__)
+
+    # load CoNLL16st dataset
+    filter_types = None  #['Implicit']
+
+    if args.stream or args.shards > 0:
+        log.info("stream dataset ({})".format(args.dataset_dir))
+        docs = iter_documents(args.dataset_dir, lang=args.lang, filter_types=filter_types, with_rel_senses_all=True, outputs=['words'])
+    else:
+        log.info("load dataset ({})".format(args.dataset_dir))
+        dataset = Conll16stDataset(args.dataset_dir, lang=args.lang, filter_types=filter_types, with_rel_senses_all=True)
+        log.info("  " + dataset.summary())
+        docs = [dataset]
+
+    # convert samples and save to JSONL format
+    if args.shards > 0:
+        output_prefix = os.path.splitext(args.output_jsonl)[0]
+        log.info("convert ({}-*-of-{:05d}.jsonl{})".format(output_prefix, args.shards, SHARD_COMPRESS_SUFFIXES[args.compress]))
+        manifest = convert_sharded(docs, output_prefix, args.shards, compress=args.compress, workers=args.workers)
+        counts = manifest['labels']
+        log.info("  samples: {}, bytes: {}".format(manifest['samples'], sum( shard['bytes']  for shard in manifest['shards'] )))
+    else:
+        log.info("convert ({})".format(args.output_jsonl))
+        counts = {}
+        with codecs.open(args.output_jsonl, 'w', encoding='utf8') as f:
+            for doc in docs:
+                doc['target'] = target_agg_labels(doc)
+                for rel_id in doc['rel_ids']:
+                    sample = extract_sample(doc, rel_id)
+                    f.write(json.dumps(sample, sort_keys=True, ensure_ascii=False))
+                    f.write("\n")
+
+                    for k in doc['target'][rel_id]:
+                        try:
+                            counts[k] += 1
+                        except KeyError:
+                            counts[k] = 1
+
+    # gold labels distribution
+    log.info("gold labels distribution")
+    for name, count in sorted(counts.items(), key=lambda a: a[1], reverse=True):
+        log.info("- {}: {}".format(name, count))
+
+    log.info("done")
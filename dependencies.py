@@ -7,7 +7,24 @@ Process word/token dependencies from CoNLL16st corpus (from `parses.json`).
 __author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
 __license__ = "GPLv3+"
 
+from array import array
+from bisect import bisect_left
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 from .files import load_parses
+from .vocab import Vocab
+
+
+def _dependency_token_id(part, sentence_offset, dep_split="-"):
+    """Convert governor/dependent of dependency relation (eg. "Inc.-4") to token id within document (root = -1)."""
+
+    _, part_id = part.rsplit(dep_split, 1)
+    if part_id == "0":
+        return -1
+    return sentence_offset + int(part_id) - 1
 
 
 def get_dependencies(parses):
@@ -16,7 +33,6 @@ def get_dependencies(parses):
         # ["nn", "Inc.-4", "Kemper-1"] is represented as:
         dependencies["wsj_1000"][3][0] = "nn"
     """
-    dep_split = "-"
 
     dependencies = {}
     for doc_id in parses:
@@ -33,24 +49,187 @@ def get_dependencies(parses):
 
             for dependency, part1, part2 in sentence_dict['dependencies']:
                 # governor of the dependency relation
-                _, part1_id = part1.rsplit(dep_split, 1)
-                if part1_id == "0":
-                    part1_id = -1
-                else:
-                    part1_id = sentence_offset + int(part1_id) - 1
+                part1_id = _dependency_token_id(part1, sentence_offset)
 
                 # dependent of the dependency relation
-                _, part2_id = part2.rsplit(dep_split, 1)
-                if part2_id == "0":
-                    part2_id = -1
-                else:
-                    part2_id = sentence_offset + int(part2_id) - 1
+                part2_id = _dependency_token_id(part2, sentence_offset)
 
                 # save dependency
                 dependencies[doc_id][part1_id][part2_id] = dependency
     return dependencies
 
 
+class DependencyGraph(Mapping):
+    """Compact word/token dependency graph of one document in CSR arrays with interned label ids.
+
+    Rows are token ids shifted by one (row 0 is root governor = -1). Dependents of governor `g` are `gov_deps[gov_offsets[g + 1]:gov_offsets[g + 2]]` (sorted) with label ids in `gov_labels`, and governors of dependent `d` are in `dep_govs`/`dep_labels` by `dep_offsets` (reverse index). It is also a read-only dict compatible with `get_dependencies()`.
+
+        graph.children(3) = (0, 1, 2)
+        graph.head(0) = 3
+        graph.label(3, 0) = "nn"
+        graph[3][0] = "nn"
+    """
+
+    def __init__(self, gov_offsets, gov_deps, gov_labels, dep_offsets, dep_govs, dep_labels, labels):
+        self.gov_offsets = gov_offsets
+        self.gov_deps = gov_deps
+        self.gov_labels = gov_labels
+        self.dep_offsets = dep_offsets
+        self.dep_govs = dep_govs
+        self.dep_labels = dep_labels
+        self.labels = labels
+
+    @classmethod
+    def from_edges(cls, token_count, edges, labels):
+        """Build graph from list of (governor id, dependent id, label) edges (later duplicates override earlier)."""
+
+        edge_labels = {}
+        for gov, dep, label in edges:
+            edge_labels[(gov, dep)] = labels.encode(label)
+
+        def _csr(pairs):
+            offsets = array('i', [0] * (token_count + 2))
+            targets = array('i')
+            label_ids = array('i')
+            for (row, target), label_id in pairs:
+                offsets[row + 2] += 1
+                targets.append(target)
+                label_ids.append(label_id)
+            for i in range(1, len(offsets)):
+                offsets[i] += offsets[i - 1]
+            return offsets, targets, label_ids
+
+        gov_csr = _csr(sorted(edge_labels.items()))
+        dep_csr = _csr(sorted( ((dep, gov), label_id)  for (gov, dep), label_id in edge_labels.items() ))
+        return cls(*(gov_csr + dep_csr + (labels,)))
+
+    def children(self, token_id):
+        """Dependents of governor token id (root = -1)."""
+
+        return tuple(self.gov_deps[self.gov_offsets[token_id + 1]:self.gov_offsets[token_id + 2]])
+
+    def heads(self, token_id):
+        """All governors of dependent token id (root = -1)."""
+
+        return tuple(self.dep_govs[self.dep_offsets[token_id + 1]:self.dep_offsets[token_id + 2]])
+
+    def head(self, token_id):
+        """First governor of dependent token id (root = -1) or `None`."""
+
+        b = self.dep_offsets[token_id + 1]
+        if b == self.dep_offsets[token_id + 2]:
+            return None
+        return self.dep_govs[b]
+
+    def label(self, gov_id, dep_id):
+        """Label of dependency relation between governor and dependent token ids or `None`."""
+
+        b = self.gov_offsets[gov_id + 1]
+        e = self.gov_offsets[gov_id + 2]
+        i = bisect_left(self.gov_deps, dep_id, b, e)
+        if i < e and self.gov_deps[i] == dep_id:
+            return self.labels.decode(self.gov_labels[i])
+        return None
+
+    def path(self, token1_id, token2_id):
+        """Shortest path of token ids between two tokens over first governors (through their lowest common governor) or `None`."""
+
+        up1 = [token1_id]
+        seen = {token1_id: 0}
+        while up1[-1] != -1:
+            head = self.head(up1[-1])
+            if head is None or head in seen:  # detached or cyclic
+                break
+            seen[head] = len(up1)
+            up1.append(head)
+
+        up2 = [token2_id]
+        visited = set(up2)
+        while up2[-1] not in seen:
+            head = self.head(up2[-1])
+            if head is None or head in visited:
+                return None
+            visited.add(head)
+            up2.append(head)
+        return up1[:seen[up2[-1]] + 1] + up2[-2::-1]
+
+    def __getitem__(self, gov_id):
+        if not -1 <= gov_id < len(self.gov_offsets) - 2:
+            raise KeyError(gov_id)
+        b = self.gov_offsets[gov_id + 1]
+        e = self.gov_offsets[gov_id + 2]
+        return { self.gov_deps[i]: self.labels.decode(self.gov_labels[i])  for i in range(b, e) }
+
+    def __iter__(self):
+        return iter(range(-1, len(self.gov_offsets) - 2))
+
+    def __len__(self):
+        return len(self.gov_offsets) - 1
+
+
+def get_dependency_graphs(parses, labels=None):
+    """Extract compact word/token dependency graphs by document id from CoNLL16st corpus (with shared vocabulary of labels).
+
+        # ["nn", "Inc.-4", "Kemper-1"] is represented as:
+        dependency_graphs["wsj_1000"].label(3, 0) = "nn"
+        dependency_graphs["wsj_1000"][3][0] = "nn"
+    """
+    if labels is None:
+        labels = Vocab(unknown=None)
+
+    dependency_graphs = {}
+    for doc_id in parses:
+        token_id = 0  # token number within document
+
+        edges = []
+        for sentence_dict in parses[doc_id]['sentences']:
+            sentence_offset = token_id  # first token number in sentence
+            token_id += len(sentence_dict['words'])
+
+            for dependency, part1, part2 in sentence_dict['dependencies']:
+                edges.append((_dependency_token_id(part1, sentence_offset), _dependency_token_id(part2, sentence_offset), dependency))
+
+        dependency_graphs[doc_id] = DependencyGraph.from_edges(token_id, edges, labels)
+    return dependency_graphs
+
+
+def get_dependency_labels(parses, labels=None):
+    """Vocabulary of dependency labels in order of first occurrence in CoNLL16st corpus (same ids as when extracting graphs)."""
+    if labels is None:
+        labels = Vocab(unknown=None)
+
+    for doc_id in parses:
+        for sentence_dict in parses[doc_id]['sentences']:
+            for dependency in sentence_dict['dependencies']:
+                labels.encode(dependency[0])
+    return labels
+
+
+def share_dependency_labels(dependency_graphs, doc_ids=None, labels=None):
+    """Re-encode label ids of dependency graphs (eg. extracted in separate processes) into one shared vocabulary of labels in-place.
+
+    Vocabularies are merged in order of `doc_ids` (or sorted document ids), so label ids equal those of graphs extracted at once.
+    """
+    if doc_ids is None:
+        doc_ids = sorted(dependency_graphs)
+    if labels is None:
+        labels = Vocab(unknown=None)
+
+    maps = {}  # label id maps by id of vocabulary
+    for doc_id in doc_ids:
+        graph = dependency_graphs[doc_id]
+        if graph.labels is labels:
+            continue
+        key = id(graph.labels)
+        if key not in maps:
+            maps[key] = array('i', [ labels.encode(label)  for label in graph.labels.id_to_str ])
+        label_map = maps[key]
+        graph.gov_labels = array('i', [ label_map[i]  for i in graph.gov_labels ])
+        graph.dep_labels = array('i', [ label_map[i]  for i in graph.dep_labels ])
+        graph.labels = labels
+    return labels
+
+
 ### Tests
 
 def test_dependencies():
@@ -72,6 +251,51 @@ def test_dependencies():
     assert dependencies[t_doc_id][t_dep1_governor][t_dep1_dependent] == t_dep1
     assert dependencies[t_doc_id][t_dep2_governor][t_dep2_dependent] == t_dep2
 
+def test_share_dependency_labels():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    parses = load_parses(dataset_dir)
+    graphs = get_dependency_graphs(parses)
+    labels = get_dependency_labels(parses)
+    assert labels.id_to_str == graphs[t_doc_id].labels.id_to_str
+
+    # graphs with separate vocabularies of labels in different order
+    other_labels = Vocab(["punct", "xnew"], unknown=None)
+    other_graphs = get_dependency_graphs(parses, labels=other_labels)
+    other_graphs["other"] = get_dependency_graphs(parses)[t_doc_id]
+    assert other_graphs[t_doc_id].gov_labels != graphs[t_doc_id].gov_labels
+    shared = share_dependency_labels(other_graphs, labels=labels)
+    assert shared is labels
+    for doc_id in ["other", t_doc_id]:
+        assert other_graphs[doc_id].labels is labels
+        assert other_graphs[doc_id].gov_labels == graphs[t_doc_id].gov_labels
+        assert other_graphs[doc_id].dep_labels == graphs[t_doc_id].dep_labels
+        assert other_graphs[doc_id] == graphs[t_doc_id]
+    assert labels.id_to_str[-1] == "xnew"
+
+def test_dependency_graphs():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+    t_children = (0, 1, 2)  #= "Kemper-1", "Financial-2", "Services-3" of "Inc.-4"
+    t_path = [0, 3, 15, 5]  #= "Kemper-1", "Inc.-4", "cut-16", "charging-6"
+
+    parses = load_parses(dataset_dir)
+    dependencies = get_dependencies(parses)
+    graphs = get_dependency_graphs(parses)
+    graph = graphs[t_doc_id]
+    assert graph == dependencies[t_doc_id]
+    assert graph.children(3) == t_children
+    assert graph.children(-1) == tuple(sorted(dependencies[t_doc_id][-1]))
+    assert graph.head(0) == 3
+    assert graph.head(15) == -1
+    assert graph.heads(15) == (-1,)
+    assert graph.label(3, 0) == "nn"
+    assert graph.label(0, 3) is None
+    assert graph.path(0, 5) == t_path
+    assert graph.path(0, 0) == [0]
+    assert graph.path(3, 0) == [3, 0]
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['-s', __file__])
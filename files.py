@@ -9,6 +9,177 @@ __license__ = "GPLv3+"
 
 import codecs
 import json
+import multiprocessing
+import os
+import re
+from multiprocessing.pool import ThreadPool
+
+from .lazy import LazyDict
+
+
+PARSES_FFMTS = [
+    "{}/parses.json",             # CoNLL16st filenames
+    "{}/pdtb-parses.json",        # CoNLL15st filenames
+    "{}/pdtb_trial_parses.json",  # CoNLL15st trial filenames
+]
+RAW_FFMTS = [
+    "{}/raw/{}",  # CoNLL16st/CoNLL15st filenames
+]
+RELATIONS_FFMTS = [
+    "{}/relations.json",        # CoNLL16st filenames
+    "{}/pdtb-data.json",        # CoNLL15st filenames
+    "{}/pdtb_trial_data.json",  # CoNLL15st trial filenames
+]
+RELATIONSNOS_FFMTS = [
+    "{}/relations-no-senses.json",  # CoNLL16st filenames
+]
+RAW_THREADS = 8  # default number of threads overlapping reads of raw texts
+
+_json_ws_re = re.compile(r'[ \t\n\r]*')
+_json_skip_re = re.compile(r'(?:[^"{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')  # till next brace outside of strings
+_json_end_re = re.compile(r'\}[ \t\n\r]*(?:,[ \t\n\r]*"|\})')  # candidates for end of object value
+_relation_docid_re = re.compile(r'"DocID"[ \t]*:[ \t]*"((?:[^"\\]|\\.)*)"')
+_relation_type_re = re.compile(r'"Type"[ \t]*:[ \t]*"((?:[^"\\]|\\.)*)"')
+
+
+def _iter_json_object(f, keys=None, chunk_size=1 << 20, raw_values=False):
+    """Walk top-level JSON object from file incrementally and yield its (key, value) pairs.
+
+    Object values of keys not in `keys` are skipped by only counting braces, without building their Python objects. With `raw_values` all values are skipped and yielded as undecoded JSON strings. Memory is bounded by the largest value.
+    """
+    decoder = json.JSONDecoder()
+    m = {'buf': "", 'eof': False}  # mutable in helper functions
+
+    def _fill():
+        # extend buffer, return False on end of file
+        if m['eof']:
+            return False
+        chunk = f.read(max(chunk_size, len(m['buf'])))  # grow reads for large values
+        if not chunk:
+            m['eof'] = True
+            return False
+        m['buf'] += chunk
+        return True
+
+    def _skip_ws(pos):
+        while True:
+            pos = _json_ws_re.match(m['buf'], pos).end()
+            if pos < len(m['buf']) or not _fill():
+                return pos
+
+    def _expect(pos, chars):
+        pos = _skip_ws(pos)
+        if pos >= len(m['buf']) or m['buf'][pos] not in chars:
+            raise ValueError("Invalid JSON object at {} (expected '{}')".format(pos, chars))
+        return pos + 1, m['buf'][pos]
+
+    def _decode(pos):
+        while True:
+            try:
+                value, end = decoder.raw_decode(m['buf'], pos)
+                if end < len(m['buf']) or not _fill():
+                    return value, end
+            except ValueError:
+                if not _fill():
+                    raise
+
+    def _skip_slow(pos):
+        # skip object value brace by brace
+        depth = 0
+        while True:
+            pos = _json_skip_re.match(m['buf'], pos).end()
+            if pos >= len(m['buf']) or m['buf'][pos] == '"':  # incomplete string or value
+                if not _fill():
+                    raise ValueError("Invalid JSON object at {} (unexpected end)".format(pos))
+                continue
+            if m['buf'][pos] == "{":
+                depth += 1
+            else:
+                depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
+
+    def _skip(pos):
+        # skip object value by counting braces outside of strings up to candidate ends
+        start = pos
+        depth = 0
+        quoted = False
+        while True:
+            match = _json_end_re.search(m['buf'], pos)
+            if match is None:
+                if not _fill():
+                    raise ValueError("Invalid JSON object at {} (unexpected end)".format(pos))
+                continue
+            end = match.start() + 1
+            segment = m['buf'][pos:end]
+            if '\\"' in segment:  # escaped quotes need exact parsing
+                return _skip_slow(start)
+            parts = segment.split('"')
+            outside = "".join(parts[1::2] if quoted else parts[0::2])
+            depth += outside.count("{") - outside.count("}")
+            if len(parts) % 2 == 0:
+                quoted = not quoted
+            pos = end
+            if depth == 0 and not quoted:
+                return pos
+
+    pos, _ = _expect(0, "{")
+    pos = _skip_ws(pos)
+    if m['buf'][pos:pos + 1] == "}":
+        return
+    while True:
+        key, pos = _decode(_skip_ws(pos))
+        pos, _ = _expect(pos, ":")
+        pos = _skip_ws(pos)
+        if raw_values:
+            start = pos
+            if m['buf'][pos:pos + 1] == "{":
+                pos = _skip(pos)
+            else:
+                _, pos = _decode(pos)
+            if keys is None or key in keys:
+                yield key, m['buf'][start:pos]
+        elif keys is None or key in keys:
+            value, pos = _decode(pos)
+            yield key, value
+        elif m['buf'][pos:pos + 1] == "{":
+            pos = _skip(pos)
+        else:
+            _, pos = _decode(pos)
+        pos, c = _expect(pos, ",}")
+        if c == "}":
+            break
+
+        # drop already processed part of buffer
+        m['buf'] = m['buf'][pos:]
+        pos = 0
+
+
+def iter_parses(dataset_dir, doc_ids=None, parses_ffmts=None):
+    """Iterate over parses and tags untouched by document id from CoNLL16st corpus.
+
+    Parses file is processed incrementally, documents not in `doc_ids` are skipped without decoding them.
+
+        for doc_id, parse in iter_parses(dataset_dir, doc_ids=["wsj_1000"]):
+            parse['sentences'][0]['words'][0] = ['Kemper', {...}]
+    """
+    if parses_ffmts is None:
+        parses_ffmts = PARSES_FFMTS
+    if doc_ids is not None:
+        doc_ids = set(doc_ids)
+
+    for parses_ffmt in parses_ffmts:
+        try:
+            f = codecs.open(parses_ffmt.format(dataset_dir), 'r', encoding='utf8')
+        except IOError:
+            continue
+        try:
+            for doc_id, parse in _iter_json_object(f, keys=doc_ids):
+                yield doc_id, parse
+        finally:
+            f.close()
+        break
 
 
 def load_parses(dataset_dir, doc_ids=None, parses_ffmts=None):
@@ -20,11 +191,12 @@ def load_parses(dataset_dir, doc_ids=None, parses_ffmts=None):
         ]
     """
     if parses_ffmts is None:
-        parses_ffmts = [
-            "{}/parses.json",             # CoNLL16st filenames
-            "{}/pdtb-parses.json",        # CoNLL15st filenames
-            "{}/pdtb_trial_parses.json",  # CoNLL15st trial filenames
-        ]
+        parses_ffmts = PARSES_FFMTS
+
+    # load only parses of specified documents
+    if doc_ids is not None:
+        parses = dict(iter_parses(dataset_dir, doc_ids=doc_ids, parses_ffmts=parses_ffmts))
+        return { doc_id: parses[doc_id]  for doc_id in doc_ids }
 
     # load all parses
     parses = {}
@@ -36,48 +208,198 @@ def load_parses(dataset_dir, doc_ids=None, parses_ffmts=None):
             break
         except IOError:
             pass
-
-    # filter by document id
-    if doc_ids is not None:
-        parses = { doc_id: parses[doc_id]  for doc_id in doc_ids }
     return parses
 
 
-def load_raws(dataset_dir, doc_ids, raw_ffmts=None):
+def _read_raw(dataset_dir, doc_id, raw_ffmts):
+    """Read raw text file once and decode it in memory (utf8 with fallback to latin-1 encoding)."""
+
+    for raw_ffmt in raw_ffmts:
+        try:
+            with open(raw_ffmt.format(dataset_dir, doc_id), 'rb') as f:
+                data = f.read()
+        except IOError:
+            continue  # try other filenames
+        try:
+            raw = data.decode('utf8')
+        except UnicodeDecodeError:
+            raw = data.decode('latin-1')
+        if raw:
+            return raw
+        break
+    raise IOError("Failed to load raw text ({})!".format(doc_id))
+
+
+def load_raws(dataset_dir, doc_ids, raw_ffmts=None, threads=None, lazy=False, cache_size=None):
     """Load raw text untouched by document id from CoNLL16st corpus.
 
+    Files are read by a pool of `threads` (default `RAW_THREADS`) to overlap file I/O. With `lazy` a read-only dict is returned that loads each raw text only on first access (and keeps at most `cache_size` of them).
+
         raws["wsj_1000"] = ".START \n\nKemper Financial Services Inc., charging..."
     """
     if raw_ffmts is None:
-        raw_ffmts = [
-            "{}/raw/{}",  # CoNLL16st/CoNLL15st filenames
-        ]
+        raw_ffmts = RAW_FFMTS
+    doc_ids = list(doc_ids)
+
+    # load raw texts on first access
+    if lazy:
+        return LazyDict(doc_ids, lambda doc_id: _read_raw(dataset_dir, doc_id, raw_ffmts), maxsize=cache_size)
 
     # load all raw texts
-    raws = {}
-    for doc_id in doc_ids:
-        raws[doc_id] = None
-        for raw_ffmt in raw_ffmts:
-            try:
-                # open using utf8 encoding
-                f = codecs.open(raw_ffmt.format(dataset_dir, doc_id), 'r', encoding='utf8')
-                try:
-                    raws[doc_id] = f.read()
-                except UnicodeDecodeError:
-                    f.close()
-                    # fallback to latin-1 encoding
-                    f = codecs.open(raw_ffmt.format(dataset_dir, doc_id), 'r', encoding='latin-1')
-                    raws[doc_id] = f.read()
-                f.close()
-                break  # skip other filenames
-            except IOError:
-                pass
-        if not raws[doc_id]:
-            raise IOError("Failed to load raw text ({})!".format(doc_id))
-    return raws
-
-
-def load_relations_gold(dataset_dir, with_senses=True, with_rawtext=False, doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, relations_ffmts=None):
+    if threads is None:
+        threads = RAW_THREADS
+    threads = min(threads, len(doc_ids))
+    if threads <= 1:
+        texts = [ _read_raw(dataset_dir, doc_id, raw_ffmts)  for doc_id in doc_ids ]
+    else:
+        pool = ThreadPool(threads)
+        try:
+            texts = pool.map(lambda doc_id: _read_raw(dataset_dir, doc_id, raw_ffmts), doc_ids)
+        finally:
+            pool.close()
+            pool.join()
+    return dict(zip(doc_ids, texts))
+
+
+def _relations_ffmts(with_senses=True):
+    relations_ffmts = []
+    relations_ffmts += RELATIONS_FFMTS
+    if not with_senses:
+        relations_ffmts += RELATIONSNOS_FFMTS
+    return relations_ffmts
+
+
+def _open_relations(dataset_dir, relations_ffmts):
+    """Open first existing relations file in binary mode (or return `None`)."""
+
+    for relations_ffmt in relations_ffmts:
+        try:
+            return open(relations_ffmt.format(dataset_dir), 'rb')
+        except IOError:
+            pass
+    return None
+
+
+def find_relations(dataset_dir, with_senses=True, relations_ffmts=None):
+    """Path of first existing relations file of CoNLL16st corpus (or `None`), the one opened by `load_relations_gold()`."""
+    if relations_ffmts is None:
+        relations_ffmts = _relations_ffmts(with_senses)
+
+    for relations_ffmt in relations_ffmts:
+        fname = relations_ffmt.format(dataset_dir)
+        if os.path.isfile(fname):
+            return fname
+    return None
+
+
+def _iter_relation_lines(f, offsets=None, with_offsets=False):
+    """Iterate over decoded non-empty JSON lines of relations file (optionally only at byte `offsets`)."""
+
+    def _lines():
+        if offsets is None:
+            offset = 0
+            for line in f:
+                yield offset, line
+                offset += len(line)
+        else:
+            for offset in offsets:
+                f.seek(offset)
+                yield offset, f.readline()
+
+    for line_offset, line in _lines():
+        line = line.decode('utf8')
+        if line.startswith('\x1b[?1034h'):  # ignore shell escape sequence in some datasets
+            line = line[8:]
+        if not line.strip():
+            continue
+        if with_offsets:
+            yield line_offset, line
+        else:
+            yield line
+
+
+def _prefilter_relation(line, doc_ids=None, filter_types=None):
+    """Check cheaply from undecoded JSON line if relation may pass document id and relation type filters."""
+
+    # top-level keys usually follow long arguments, so search from end
+    if doc_ids:
+        m = _relation_docid_re.match(line, max(0, line.rfind('"DocID"')))
+        if m and "\\" not in m.group(1) and m.group(1) not in doc_ids:
+            return False
+    if filter_types:
+        m = _relation_type_re.match(line, max(0, line.rfind('"Type"')))
+        if m and m.group(1) and "\\" not in m.group(1) and m.group(1) not in filter_types:
+            return False
+    return True
+
+
+def _decode_relation(line, doc_ids=None, filter_types=None, filter_senses=None):
+    """Decode, filter, and fix inconsistent structure of relation from JSON line (or return `None` if filtered out)."""
+
+    relation = json.loads(line)
+
+    # filter by document id
+    if doc_ids and relation['DocID'] not in doc_ids:
+        return None
+
+    # filter by relation type
+    if filter_types and relation['Type'] and relation['Type'] not in filter_types:
+        return None
+
+    # filter by relation senses
+    if filter_senses and relation['Sense']:
+        relation['Sense'] = list(set(relation['Sense']).intersection(filter_senses))
+        if not relation['Sense']:
+            return None
+
+    # fix inconsistent structure
+    if 'TokenList' not in relation['Arg1']:
+        relation['Arg1']['TokenList'] = []
+    if 'TokenList' not in relation['Arg2']:
+        relation['Arg2']['TokenList'] = []
+    if 'TokenList' not in relation['Connective']:
+        relation['Connective']['TokenList'] = []
+    if 'Punctuation' not in relation:
+        relation['Punctuation'] = {'CharacterSpanList': [], 'PunctuationType': "", 'RawText': "", 'TokenList': []}
+    if 'PunctuationType' not in relation['Punctuation']:
+        relation['Punctuation']['PunctuationType'] = ""
+    if 'TokenList' not in relation['Punctuation']:
+        relation['Punctuation']['TokenList'] = []
+    return relation
+
+
+def _decode_relations(args):
+    """Decode chunk of JSON lines with relations (in worker process)."""
+
+    lines, doc_ids, filter_types, filter_senses = args
+    return [ _decode_relation(line, doc_ids, filter_types, filter_senses)  for line in lines ]
+
+
+def _finish_relation(relation, with_senses, with_rawtext, filter_fn):
+    """Apply lambda filter and remove type, sense, and raw text information from decoded relation."""
+
+    if relation is None:
+        return None
+
+    # filter by lambda expression on relation
+    if filter_fn and filter_fn(relation):
+        return None
+
+    # remove type and sense information
+    if not with_senses:
+        relation['Sense'] = []
+        relation['Type'] = ""
+
+    # remove raw text fields
+    if not with_rawtext:
+        relation['Arg1']['RawText'] = None
+        relation['Arg2']['RawText'] = None
+        relation['Connective']['RawText'] = None
+        relation['Punctuation']['RawText'] = None
+    return relation
+
+
+def load_relations_gold(dataset_dir, with_senses=True, with_rawtext=False, doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, relations_ffmts=None, workers=None):
     """Load shallow discourse relations untouched by relation id from CoNLL16st corpus.
 
         relations_gold[14905] = {
@@ -90,82 +412,104 @@ def load_relations_gold(dataset_dir, with_senses=True, with_rawtext=False, doc_i
             'Sense': ['Contingency.Condition'],
             'Type': 'Explicit',
         }
+
+    Filters by document ids and relation types are applied to undecoded lines first, so loading relations of a few documents skips decoding of others. Remaining lines are decoded in chunks by `workers` processes (if more than one).
     """
     if relations_ffmts is None:
-        relations_ffmts = []
-        relations_ffmts += [
-            "{}/relations.json",        # CoNLL16st filenames
-            "{}/pdtb-data.json",        # CoNLL15st filenames
-            "{}/pdtb_trial_data.json",  # CoNLL15st trial filenames
-        ]
-        if not with_senses:
-            relations_ffmts += [
-                "{}/relations-no-senses.json",  # CoNLL16st filenames
-            ]
+        relations_ffmts = _relations_ffmts(with_senses)
+    if doc_ids:
+        doc_ids = frozenset(doc_ids)
+    if filter_types:
+        filter_types = frozenset(filter_types)
+    if filter_senses:
+        filter_senses = frozenset(filter_senses)
 
     # load all relations
-    relations = {}
-    for relations_ffmt in relations_ffmts:
+    f = _open_relations(dataset_dir, relations_ffmts)
+    if f is None:
+        return {}
+    with f:
+        lines = [ line  for line in _iter_relation_lines(f) if _prefilter_relation(line, doc_ids, filter_types) ]
+
+    # decode and filter relations (in parallel)
+    if workers is not None and workers > 1 and len(lines) > 1:
+        chunk_size = max(1, len(lines) // (workers * 4))
+        chunks = [ (lines[i:i + chunk_size], doc_ids, filter_types, filter_senses)  for i in range(0, len(lines), chunk_size) ]
+        pool = multiprocessing.Pool(workers)
         try:
-            f = codecs.open(relations_ffmt.format(dataset_dir), 'r', encoding='utf8')
-            for line in f:
-                if line.startswith('\x1b[?1034h'):  # ignore shell escape sequence in some datasets
-                    line = line[8:]
-                relation = json.loads(line)
-
-                # filter by document id
-                if doc_ids and relation['DocID'] not in doc_ids:
-                    continue
-
-                # filter by relation type
-                if filter_types and relation['Type'] and relation['Type'] not in filter_types:
-                    continue
-
-                # filter by relation senses
-                if filter_senses and relation['Sense']:
-                    relation['Sense'] = list(set(relation['Sense']).intersection(set(filter_senses)))
-                    if not relation['Sense']:
-                        continue
-
-                # fix inconsistent structure
-                if 'TokenList' not in relation['Arg1']:
-                    relation['Arg1']['TokenList'] = []
-                if 'TokenList' not in relation['Arg2']:
-                    relation['Arg2']['TokenList'] = []
-                if 'TokenList' not in relation['Connective']:
-                    relation['Connective']['TokenList'] = []
-                if 'Punctuation' not in relation:
-                    relation['Punctuation'] = {'CharacterSpanList': [], 'PunctuationType': "", 'RawText': "", 'TokenList': []}
-                if 'PunctuationType' not in relation['Punctuation']:
-                    relation['Punctuation']['PunctuationType'] = ""
-                if 'TokenList' not in relation['Punctuation']:
-                    relation['Punctuation']['TokenList'] = []
-
-                # filter by lambda expression on relation
-                if filter_fn and filter_fn(relation):
-                    continue
-
-                # remove type and sense information
-                if not with_senses:
-                    relation['Sense'] = []
-                    relation['Type'] = ""
-
-                # remove raw text fields
-                if not with_rawtext:
-                    relation['Arg1']['RawText'] = None
-                    relation['Arg2']['RawText'] = None
-                    relation['Connective']['RawText'] = None
-                    relation['Punctuation']['RawText'] = None
-
-                # save relation
-                relations[relation['ID']] = relation
-            f.close()
-            break
-        except IOError:
-            pass
+            decoded = [ relation  for chunk in pool.imap(_decode_relations, chunks) for relation in chunk ]
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        decoded = [ _decode_relation(line, doc_ids, filter_types, filter_senses)  for line in lines ]
+
+    relations = {}
+    for relation in decoded:
+        relation = _finish_relation(relation, with_senses, with_rawtext, filter_fn)
+        if relation is not None:
+            relations[relation['ID']] = relation
     return relations
 
 
+def index_relations(dataset_dir, with_senses=True, relations_ffmts=None):
+    """Index byte offsets of relation lines by document id from CoNLL16st corpus (for `iter_relations()`).
+
+        index["wsj_1000"] = [0, 2442, 3729, ...]
+    """
+    if relations_ffmts is None:
+        relations_ffmts = _relations_ffmts(with_senses)
+
+    index = {}
+    f = _open_relations(dataset_dir, relations_ffmts)
+    if f is None:
+        return index
+    with f:
+        for offset, line in _iter_relation_lines(f, with_offsets=True):
+            m = _relation_docid_re.match(line, max(0, line.rfind('"DocID"')))
+            if m and "\\" not in m.group(1):
+                doc_id = m.group(1)
+            else:
+                doc_id = json.loads(line)['DocID']
+            index.setdefault(doc_id, []).append(offset)
+    return index
+
+
+def iter_relations(dataset_dir, with_senses=True, with_rawtext=False, doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, relations_ffmts=None, index=None):
+    """Iterate over shallow discourse relations from CoNLL16st corpus (normalized as in `load_relations_gold()`).
+
+    Relations file is read line by line. With an `index` from `index_relations()` only lines of relations in `doc_ids` are read.
+
+        for relation in iter_relations(dataset_dir, doc_ids=["wsj_1000"]):
+            relation['ID'] = 14887
+    """
+    if relations_ffmts is None:
+        relations_ffmts = _relations_ffmts(with_senses)
+    if doc_ids:
+        doc_ids = frozenset(doc_ids)
+    if filter_types:
+        filter_types = frozenset(filter_types)
+    if filter_senses:
+        filter_senses = frozenset(filter_senses)
+
+    offsets = None
+    if index is not None and doc_ids:
+        offsets = sorted( offset  for doc_id in doc_ids for offset in index.get(doc_id, ()) )
+        if not offsets:
+            return
+    f = _open_relations(dataset_dir, relations_ffmts)
+    if f is None:
+        return
+    with f:
+        for line in _iter_relation_lines(f, offsets=offsets):
+            if not _prefilter_relation(line, doc_ids, filter_types):
+                continue
+            relation = _decode_relation(line, doc_ids, filter_types, filter_senses)
+            relation = _finish_relation(relation, with_senses, with_rawtext, filter_fn)
+            if relation is not None:
+                yield relation
+
+
 def strip_relations_gold(relations):
     """Strip type and sense information from shallow discourse relations from CoNLL16st corpus."""
 
@@ -203,6 +547,35 @@ def test_parses():
     assert t_s0_dependency0 in s0['dependencies']
     assert t_s0_dependency1 in s0['dependencies']
 
+def test_parses_filtered():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    parses_all = load_parses(dataset_dir)
+    parses = load_parses(dataset_dir, doc_ids=[t_doc_id])
+    assert parses == parses_all
+    assert list(iter_parses(dataset_dir)) == [(t_doc_id, parses_all[t_doc_id])]
+    assert list(iter_parses(dataset_dir, doc_ids=["missing"])) == []
+
+def test_iter_json_object():
+    import io
+    t_obj = {
+        "doc_a": {"sentences": [{"words": [["{", {"Linkers": []}], ["}]\\\"", {"Linkers": ["arg1_1"]}]]}]},
+        "doc_b": [1, 2.5, None, True, "[{"],
+        "doc_c": 42,
+        "doc_d": {},
+    }
+    t_str = json.dumps(t_obj, indent=1)
+
+    for chunk_size in [1, 7, 1 << 20]:
+        assert dict(_iter_json_object(io.StringIO(t_str), chunk_size=chunk_size)) == t_obj
+        for keys in [["doc_a"], ["doc_b", "doc_d"], ["doc_c"], []]:
+            t_filtered = { k: t_obj[k]  for k in keys }
+            assert dict(_iter_json_object(io.StringIO(t_str), keys=set(keys), chunk_size=chunk_size)) == t_filtered
+        assert dict( (k, json.loads(v))  for k, v in _iter_json_object(io.StringIO(t_str), chunk_size=chunk_size, raw_values=True) ) == t_obj
+        assert [ k  for k, _ in _iter_json_object(io.StringIO(t_str), keys=set(["doc_b"]), chunk_size=chunk_size, raw_values=True) ] == ["doc_b"]
+    assert list(_iter_json_object(io.StringIO(u" { } "))) == []
+
 def test_raws():
     dataset_dir = "./conll16st-en-trial"
     doc_id = "wsj_1000"
@@ -211,6 +584,41 @@ def test_raws():
     raws = load_raws(dataset_dir, [doc_id])
     assert raws[doc_id].startswith(t_raw)
 
+def test_raws_threads_lazy():
+    import os
+    import shutil
+    import tempfile
+
+    dataset_dir = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(dataset_dir, "raw"))
+        t_raws = {"doc_{}".format(i): u"text \u010d {}\n\n".format(i)  for i in range(20) }
+        for doc_id, raw in t_raws.items():
+            with open(os.path.join(dataset_dir, "raw", doc_id), 'wb') as f:
+                f.write(raw.encode('utf8'))
+        with open(os.path.join(dataset_dir, "raw", "doc_latin1"), 'wb') as f:
+            f.write(b"caf\xe9")
+        t_raws["doc_latin1"] = u"caf\xe9"
+
+        for threads in [1, 4]:
+            assert load_raws(dataset_dir, sorted(t_raws), threads=threads) == t_raws
+        try:
+            load_raws(dataset_dir, ["doc_0", "missing"], threads=4)
+            assert False
+        except IOError:
+            pass
+
+        raws = load_raws(dataset_dir, sorted(t_raws) + ["missing"], lazy=True)
+        assert raws["doc_latin1"] == t_raws["doc_latin1"]
+        assert (raws.hits, raws.misses) == (0, 1)
+        try:
+            raws["missing"]
+            assert False
+        except IOError:
+            pass
+    finally:
+        shutil.rmtree(dataset_dir)
+
 def test_relations():
     dataset_dir = "./conll16st-en-trial"
     t_rel0 = {
@@ -281,6 +689,37 @@ def test_relations_filtered():
     assert rel2['Punctuation']['PunctuationType'] == t_rel2['Punctuation']['PunctuationType']
     assert rel2 == t_rel2
 
+def test_relations_fast():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+
+    for kwargs in [{}, {'doc_ids': [doc_id]}, {'filter_types': ["Implicit"]}, {'filter_senses': ["Comparison.Contrast"]}, {'with_senses': False, 'with_rawtext': True}]:
+        relations = load_relations_gold(dataset_dir, **kwargs)
+        assert relations
+        assert load_relations_gold(dataset_dir, workers=2, **kwargs) == relations
+    assert load_relations_gold(dataset_dir, doc_ids=["missing"]) == {}
+    assert load_relations_gold(dataset_dir, filter_types=["Missing"]) == {}
+
+    # prefilter only skips lines that certainly fail filters
+    t_line = u'{"Arg1": {"RawText": "\\"DocID\\": \\"x\\""}, "DocID": "wsj_1000", "Type": "Explicit"}'
+    assert _prefilter_relation(t_line, frozenset(["wsj_1000"]), frozenset(["Explicit"]))
+    assert not _prefilter_relation(t_line, frozenset(["x"]))
+    assert not _prefilter_relation(t_line, None, frozenset(["Implicit"]))
+    assert _prefilter_relation(u'{"DocID": "wsj_\\u0031000"}', frozenset(["wsj_1000"]))
+
+def test_iter_relations():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+
+    index = index_relations(dataset_dir)
+    assert sorted(index) == [doc_id]
+    assert len(index[doc_id]) == 29
+    for kwargs in [{}, {'doc_ids': [doc_id]}, {'filter_types': ["Implicit"], 'with_rawtext': True}, {'with_senses': False}]:
+        relations = load_relations_gold(dataset_dir, **kwargs)
+        assert dict( (r['ID'], r)  for r in iter_relations(dataset_dir, **kwargs) ) == relations
+        assert dict( (r['ID'], r)  for r in iter_relations(dataset_dir, index=index, **kwargs) ) == relations
+    assert list(iter_relations(dataset_dir, doc_ids=["missing"], index=index)) == []
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['-s', __file__])
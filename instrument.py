@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Per-stage instrumentation of dataset loading (wall time, CPU time, peak memory delta, item counts).
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+try:
+    import tracemalloc
+except ImportError:  # not available on Python 2
+    tracemalloc = None
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:  # Python 2
+    _cpu_time = time.clock
+
+
+def _max_rss():
+    """Peak resident memory of current process in bytes (or `None` if unknown)."""
+
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':  # in kilobytes on Linux, in bytes on Mac OS X
+        max_rss *= 1024
+    return max_rss
+
+
+class Instrument(object):
+    """Recorder of wall time, CPU time, peak memory delta and item counts of named stages.
+
+    Peak memory delta is the increase of peak resident memory of the process during a stage, or with `trace_memory` the exact peak of Python allocations above the start of a stage (slower, requires *Python 3*). Each `hooks` callable is called with the record of every finished stage.
+
+        with instrument.stage('load_parses') as record:
+            parses = load_parses(dataset_dir)
+            record['items'] = len(parses)
+
+        instrument.records[0] = {'name': 'load_parses', 'wall': 0.31, 'cpu': 0.30, 'peak_mem': 4268032, 'items': 1}
+    """
+
+    def __init__(self, hooks=None, trace_memory=False):
+        self.hooks = list(hooks or [])
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self.records = []
+
+    @contextmanager
+    def stage(self, name):
+        record = {'name': name, 'wall': None, 'cpu': None, 'peak_mem': None, 'items': None}
+        traced = False
+        if self.trace_memory:
+            traced = not tracemalloc.is_tracing()
+            if traced:
+                tracemalloc.start()
+            mem_start = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        else:
+            mem_start = _max_rss()
+        wall = time.time()
+        cpu = _cpu_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.time() - wall
+            record['cpu'] = _cpu_time() - cpu
+            if self.trace_memory:
+                record['peak_mem'] = tracemalloc.get_traced_memory()[1] - mem_start
+                if traced:
+                    tracemalloc.stop()
+            elif mem_start is not None:
+                record['peak_mem'] = _max_rss() - mem_start
+            self.records.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    def report(self):
+        """Structured report of all recorded stages with totals."""
+
+        return {
+            'stages': [ dict(record)  for record in self.records ],
+            'wall': sum( record['wall']  for record in self.records ),
+            'cpu': sum( record['cpu']  for record in self.records ),
+        }
+
+    def summary(self):
+        return ", ".join( "{}: {:.3f}s".format(record['name'], record['wall'])  for record in self.records )
+
+
+### Tests
+
+def test_instrument():
+    finished = []
+    instrument = Instrument(hooks=[finished.append])
+    with instrument.stage('a') as record:
+        record['items'] = len([ i  for i in range(1000) ])
+    with instrument.stage('b'):
+        pass
+    assert [ r['name']  for r in instrument.records ] == ['a', 'b']
+    assert finished == instrument.records
+    assert instrument.records[0]['items'] == 1000
+    assert instrument.records[0]['wall'] >= 0. and instrument.records[0]['cpu'] >= 0.
+
+    report = instrument.report()
+    assert [ r['name']  for r in report['stages'] ] == ['a', 'b']
+    assert report['wall'] == sum( r['wall']  for r in instrument.records )
+
+    # exceptions are recorded too
+    try:
+        with instrument.stage('c'):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert instrument.records[-1]['name'] == 'c'
+
+def test_instrument_trace_memory():
+    import pytest
+    if tracemalloc is None:
+        pytest.skip("tracemalloc not available")
+
+    instrument = Instrument(trace_memory=True)
+    with instrument.stage('alloc'):
+        data = [ str(i) * 100  for i in range(10000) ]
+    del data
+    assert instrument.records[0]['peak_mem'] >= 10000 * 100
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
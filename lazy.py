@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Lazy mappings computing and memoizing values on first access.
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+from collections import OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class LRUCache(object):
+    """Memo of values by key with LRU eviction to at most `maxsize` values (or unbounded if `None`) and hit/miss counters (shared by many lazy containers)."""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fn):
+        """Get memoized value by key (or compute it by `fn()` on miss)."""
+
+        try:
+            value = self.cache.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = fn()
+            self.misses += 1
+            if self.maxsize is not None:
+                while len(self.cache) >= self.maxsize > 0:
+                    self.cache.popitem(last=False)  # evict least recently used
+        if self.maxsize != 0:
+            self.cache[key] = value  # mark as most recently used
+        return value
+
+    def clear(self):
+        self.cache.clear()
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __getstate__(self):
+        return {'maxsize': self.maxsize}  # memoized values are not persisted
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+    def __repr__(self):
+        return "{}(maxsize: {}, cached: {}, hits: {}, misses: {})".format(self.__class__.__name__, self.maxsize, len(self.cache), self.hits, self.misses)
+
+
+class LazyDict(Mapping):
+    """Read-only dict with values computed by `fn(key)` on first access and memoized (with optional LRU eviction to at most `maxsize` values)."""
+
+    def __init__(self, keys, fn, maxsize=None):
+        self._keys = list(keys)
+        self._key_set = set(self._keys)
+        self.fn = fn
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        try:
+            value = self.cache.pop(key)
+            self.hits += 1
+        except KeyError:
+            if key not in self._key_set:
+                raise KeyError(key)
+            value = self.fn(key)
+            self.misses += 1
+            if self.maxsize is not None:
+                while len(self.cache) >= self.maxsize > 0:
+                    self.cache.popitem(last=False)  # evict least recently used
+        if self.maxsize != 0:
+            self.cache[key] = value  # mark as most recently used
+        return value
+
+    def __contains__(self, key):
+        return key in self._key_set
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "{}(keys: {}, cached: {}, hits: {}, misses: {})".format(self.__class__.__name__, len(self._keys), len(self.cache), self.hits, self.misses)
+
+
+### Tests
+
+def test_lazy_dict():
+    calls = []
+
+    def fn(key):
+        calls.append(key)
+        return key * 2
+
+    d = LazyDict(["a", "b", "c"], fn)
+    assert list(d) == ["a", "b", "c"]
+    assert len(d) == 3
+    assert "b" in d and "x" not in d
+    assert calls == []
+    assert d["b"] == "bb"
+    assert d["b"] == "bb"
+    assert calls == ["b"]
+    assert (d.hits, d.misses) == (1, 1)
+    assert dict(d) == {"a": "aa", "b": "bb", "c": "cc"}
+    assert calls == ["b", "a", "c"]
+    try:
+        d["x"]
+        assert False
+    except KeyError:
+        pass
+
+def test_lazy_dict_lru():
+    calls = []
+
+    def fn(key):
+        calls.append(key)
+        return key * 2
+
+    d = LazyDict(["a", "b", "c"], fn, maxsize=2)
+    d["a"]
+    d["b"]
+    d["a"]  # "b" becomes least recently used
+    d["c"]  # evicts "b"
+    assert list(d.cache) == ["a", "c"]
+    d["b"]
+    assert calls == ["a", "b", "c", "b"]
+    assert (d.hits, d.misses) == (1, 4)
+
+def test_lru_cache():
+    import pickle
+    calls = []
+
+    def fn(key):
+        calls.append(key)
+        return key * 2
+
+    c = LRUCache(maxsize=2)
+    for key in ["a", "b", "a", "c", "b"]:
+        assert c.get(key, lambda: fn(key)) == key * 2
+    assert calls == ["a", "b", "c", "b"]
+    assert list(c.cache) == ["c", "b"]
+    assert (len(c), c.hits, c.misses) == (2, 1, 4)
+
+    c = pickle.loads(pickle.dumps(c))
+    assert (c.maxsize, len(c), c.hits, c.misses) == (2, 0, 0, 0)
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
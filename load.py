@@ -7,36 +7,174 @@ Load CoNLL16st/CoNLL15st dataset.
 __author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
 __license__ = "GPLv3+"
 
-from .files import load_parses, load_raws, load_relations_gold
-from .words import get_words, get_pos_tags, get_word_metas
-from .dependencies import get_dependencies
-from .parsetrees import get_parsetrees
-from .relations import get_rel_parts, get_rel_types, get_rel_senses, get_rel_senses_all, add_relation_tags
+import multiprocessing
+import time
 
+from six.moves import intern
 
-def load_all(dataset_dir, doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False):
-    """Load whole CoNLL16st dataset by document id."""
+from .cache import get_cache_key, load_cache, save_cache
+from .files import find_relations, load_parses, load_raws, load_relations_gold, iter_parses, index_relations, iter_relations
+from .words import WordMetas, get_words, get_pos_tags, get_word_metas
+from .dependencies import get_dependencies, get_dependency_graphs, get_dependency_labels, share_dependency_labels
+from .parsetrees import PARSETREES_CACHE_SIZE, LazyParsetrees, get_parsetrees
+from .relations import TagCodec, fill_token_lists, get_rel_parts, get_rel_types, get_rel_senses, get_rel_senses_all, add_relation_tags
+from .extract import EXTRACT_OUTPUTS, extract_docs
+from .lazy import LRUCache, LazyDict
+from .instrument import Instrument
+from .vocab import Vocab, build_vocabs, encode_docs
+from .refresh import snapshot_dataset, refresh_dataset
+
+
+def _extract_docs(args):
+    """Extract data by document id from a chunk of documents (in worker process)."""
+    parses, raws, rel_types, rel_senses, columnar, codec, lazy_parsetrees, dep_labels = args
+
+    extracted = extract_docs(parses, raws, columnar=columnar, lazy_parsetrees=lazy_parsetrees, pause_gc=True, dep_labels=dep_labels)  # no other threads in worker
+    add_relation_tags(extracted['word_metas'], rel_types, rel_senses, codec=codec)
+    return tuple( extracted[k]  for k in EXTRACT_OUTPUTS )
+
+
+def _extract_docs_parallel(doc_ids, parses, raws, relations_gold, rel_types, rel_senses, columnar, workers, codec=None, lazy_parsetrees=False):
+    """Extract data by document id in chunks of documents across a process pool and merge them deterministically."""
+
+    # labels of compact dependencies in the same order as in serial extraction
+    dep_labels = get_dependency_labels(parses) if columnar else None
+
+    doc_rel_ids = {}
+    for rel_id, gold in relations_gold.items():
+        doc_rel_ids.setdefault(gold['DocID'], []).append(rel_id)
+
+    def _chunk_args(chunk_doc_ids):
+        chunk_rel_ids = [ rel_id  for doc_id in chunk_doc_ids for rel_id in doc_rel_ids.get(doc_id, []) ]
+        return (
+            { doc_id: parses[doc_id]  for doc_id in chunk_doc_ids },
+            { doc_id: raws[doc_id]  for doc_id in chunk_doc_ids },
+            { rel_id: rel_types[rel_id]  for rel_id in chunk_rel_ids if rel_id in rel_types },
+            { rel_id: rel_senses[rel_id]  for rel_id in chunk_rel_ids if rel_id in rel_senses },
+            columnar,
+            codec,
+            lazy_parsetrees,
+            dep_labels,
+        )
+
+    chunk_size = max(1, len(doc_ids) // (workers * 4))
+    chunks = [ doc_ids[i:i + chunk_size]  for i in range(0, len(doc_ids), chunk_size) ]
+
+    data = ({}, {}, {}, {}, {})
+    pool = multiprocessing.Pool(workers)
+    try:
+        for chunk_data in pool.imap(_extract_docs, (_chunk_args(c)  for c in chunks)):
+            for d, chunk_d in zip(data, chunk_data):
+                d.update(chunk_d)
+    finally:
+        pool.terminate()
+    if columnar:
+        share_dependency_labels(data[3], doc_ids, dep_labels)  # one vocabulary instead of a copy per chunk
+    return data
+
+
+def load_all(dataset_dir, doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False, columnar=False, packed_tags=False, parsetrees_cache=None, cache_dir=None, workers=None, instrument=None):
+    """Load whole CoNLL16st dataset by document id (optionally with columnar `word_metas` and compact `dependencies`, from persistent cache in `cache_dir` or extracted in parallel by `workers` processes).
+
+    With `packed_tags` relation tags in `word_metas` are packed integers of `TagCodec.from_relations(rel_types, rel_senses)`.
+
+    With `parsetrees_cache` (an `LRUCache`) `parsetrees` are `LazyParsetrees` kept as bracketed strings and parsed on first access into this shared cache.
+
+    Wall time, CPU time, peak memory delta and item counts of loading stages are recorded in `instrument` (if given).
+    """
+    if instrument is None:
+        instrument = Instrument()
+
+    # load from persistent cache (not possible with lambda filter)
+    cache_key = None
+    if cache_dir is not None and filter_fn is None:
+        with instrument.stage('load_cache') as record:
+            cache_key = get_cache_key(dataset_dir, doc_ids=doc_ids, filter_types=filter_types, filter_senses=filter_senses, with_rel_senses_all=with_rel_senses_all, columnar=columnar, packed_tags=packed_tags, lazy_parsetrees=parsetrees_cache is not None)
+            data = load_cache(cache_dir, cache_key)
+            record['items'] = len(data[0]) if data is not None else 0
+        if data is not None:
+            if parsetrees_cache is not None:
+                for parsetrees in data[5].values():
+                    parsetrees.cache = parsetrees_cache
+            return data
 
     # load all provided files untouched
+    with instrument.stage('load_parses') as record:
+        parses = load_parses(dataset_dir, doc_ids=doc_ids)
+        doc_ids = sorted(parses.keys())
+        record['items'] = len(doc_ids)
+    with instrument.stage('load_raws') as record:
+        raws = load_raws(dataset_dir, doc_ids=doc_ids)
+        record['items'] = len(raws)
+    with instrument.stage('load_relations_gold') as record:
+        relations_gold = load_relations_gold(dataset_dir, doc_ids=doc_ids, with_senses=True, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn, workers=workers)
+        record['items'] = len(relations_gold)
+    if relations_gold:
+        relationsnos_gold = relations_gold
+    else:
+        with instrument.stage('load_relationsnos_gold') as record:
+            relationsnos_gold = load_relations_gold(dataset_dir, doc_ids=doc_ids, with_senses=False, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn, workers=workers)
+            record['items'] = len(relationsnos_gold)
+    with instrument.stage('fill_token_lists') as record:
+        record['items'] = fill_token_lists(relationsnos_gold, parses)
+
+    # extract data by relation id
+    with instrument.stage('get_rel_parts') as record:
+        rel_parts = get_rel_parts(relationsnos_gold)
+        rel_ids = sorted(rel_parts.keys())
+        rel_types = get_rel_types(relations_gold)
+        if with_rel_senses_all:
+            rel_senses = get_rel_senses_all(relations_gold)
+        else:
+            rel_senses = get_rel_senses(relations_gold)
+        codec = None
+        if packed_tags:
+            codec = TagCodec.from_relations(rel_types, rel_senses)
+        record['items'] = len(rel_ids)
+
+    if workers is not None and workers > 1:
+        # extract data by document id in parallel
+        with instrument.stage('extract_docs_parallel') as record:
+            words, pos_tags, word_metas, dependencies, parsetrees = _extract_docs_parallel(doc_ids, parses, raws, relations_gold, rel_types, rel_senses, columnar, workers, codec=codec, lazy_parsetrees=parsetrees_cache is not None)
+            if parsetrees_cache is not None:
+                for trees in parsetrees.values():
+                    trees.cache = parsetrees_cache  # instead of one cache per chunk
+            record['items'] = sum( len(s)  for s in words.values() )
+    else:
+        # extract data by document id in a single pass
+        with instrument.stage('extract_docs') as record:
+            extracted = extract_docs(parses, raws, columnar=columnar, lazy_parsetrees=parsetrees_cache is not None, parsetrees_cache=parsetrees_cache)
+            words, pos_tags, word_metas, dependencies, parsetrees = ( extracted[k]  for k in EXTRACT_OUTPUTS )
+            record['items'] = sum( len(s)  for s in words.values() )
+
+        # add extra fields
+        with instrument.stage('add_relation_tags') as record:
+            add_relation_tags(word_metas, rel_types, rel_senses, codec=codec)
+            record['items'] = sum( len(s)  for s in word_metas.values() )
+
+    data = (doc_ids, words, word_metas, pos_tags, dependencies, parsetrees, rel_ids, rel_parts, rel_types, rel_senses, relations_gold)
+    if cache_key is not None:
+        with instrument.stage('save_cache') as record:
+            save_cache(cache_dir, cache_key, data)
+            record['items'] = len(doc_ids)
+    return data
+
+
+def load_all_lazy(dataset_dir, doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False, columnar=False, cache_size=None):
+    """Load whole CoNLL16st dataset by document id with data by document id extracted lazily on first access.
+
+    Data by document id (`words`, `word_metas`, `pos_tags`, `dependencies`, `parsetrees`) are read-only dicts that memoize at most `cache_size` documents each (or all if `None`).
+    """
+
+    # load all provided files untouched (except raw texts)
     parses = load_parses(dataset_dir, doc_ids=doc_ids)
     doc_ids = sorted(parses.keys())
-    raws = load_raws(dataset_dir, doc_ids=doc_ids)
     relations_gold = load_relations_gold(dataset_dir, doc_ids=doc_ids, with_senses=True, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn)
     if relations_gold:
         relationsnos_gold = relations_gold
     else:
         relationsnos_gold = load_relations_gold(dataset_dir, doc_ids=doc_ids, with_senses=False, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn)
-
-    # extract data by document id and token id
-    words = get_words(parses)
-    pos_tags = get_pos_tags(parses)
-    word_metas = get_word_metas(parses, raws)
-
-    # extract data by document id and token id pairs
-    dependencies = get_dependencies(parses)
-
-    # extract data by document id
-    parsetrees = get_parsetrees(parses)
+    fill_token_lists(relationsnos_gold, parses)
 
     # extract data by relation id
     rel_parts = get_rel_parts(relationsnos_gold)
@@ -47,25 +185,482 @@ def load_all(dataset_dir, doc_ids=None, filter_types=None, filter_senses=None, f
     else:
         rel_senses = get_rel_senses(relations_gold)
 
-    # add extra fields
-    add_relation_tags(word_metas, rel_types, rel_senses)
+    # extract data by document id lazily
+    raws = load_raws(dataset_dir, doc_ids=doc_ids, lazy=True, cache_size=0)
+
+    def _word_metas(doc_id):
+        word_metas = get_word_metas({doc_id: parses[doc_id]}, {doc_id: raws[doc_id]}, columnar=columnar)
+        add_relation_tags(word_metas, rel_types, rel_senses)
+        return word_metas[doc_id]
+
+    def _lazy(fn):
+        return LazyDict(doc_ids, lambda doc_id: fn({doc_id: parses[doc_id]})[doc_id], maxsize=cache_size)
+
+    words = _lazy(get_words)
+    pos_tags = _lazy(get_pos_tags)
+    word_metas = LazyDict(doc_ids, _word_metas, maxsize=cache_size)
+    if columnar:
+        dep_labels = Vocab(unknown=None)  # shared by all documents
+        dependencies = _lazy(lambda p: get_dependency_graphs(p, labels=dep_labels))
+    else:
+        dependencies = _lazy(get_dependencies)
+    parsetrees = _lazy(get_parsetrees)
 
     return doc_ids, words, word_metas, pos_tags, dependencies, parsetrees, rel_ids, rel_parts, rel_types, rel_senses, relations_gold
 
 
+def iter_documents(dataset_dir, lang='?', doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False, columnar=False, outputs=None):
+    """Iterate over CoNLL16st dataset document by document with memory bounded by one document.
+
+    Each document is yielded as a bundle with the same keys as `Conll16stDataset` (but containing only one document and its relations). Data by document id can be limited to `outputs` (see `extract_docs()`). Documents are yielded in order of parses file and relation ids are sorted only within each document, so concatenated bundles are ordered by document (not by relation id as in `Conll16stDataset`).
+
+        for doc in iter_documents(dataset_dir):
+            doc['doc_ids'] = ["wsj_1000"]
+            doc['words']["wsj_1000"] = ["Kemper", "Financial", "Services", "Inc.", ",", "charging", ...]
+    """
+
+    # index relations by document id (without senses only if missing)
+    with_senses = True
+    index = index_relations(dataset_dir, with_senses=True)
+    if not index:
+        with_senses = False
+        index = index_relations(dataset_dir, with_senses=False)
+
+    for doc_id, parse in iter_parses(dataset_dir, doc_ids=doc_ids):
+        # load provided files untouched
+        parses = {doc_id: parse}
+        raws = None
+        if outputs is None or 'word_metas' in outputs:
+            raws = load_raws(dataset_dir, doc_ids=[doc_id], threads=1)
+        relationsnos_gold = dict( (relation['ID'], relation)  for relation in iter_relations(dataset_dir, with_senses=with_senses, doc_ids=[doc_id], filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn, index=index) )
+        fill_token_lists(relationsnos_gold, parses)
+        relations_gold = relationsnos_gold if with_senses else {}
+
+        # extract data by relation id
+        rel_parts = get_rel_parts(relationsnos_gold)
+        rel_types = get_rel_types(relations_gold)
+        if with_rel_senses_all:
+            rel_senses = get_rel_senses_all(relations_gold)
+        else:
+            rel_senses = get_rel_senses(relations_gold)
+
+        # extract data by document id
+        extracted = extract_docs(parses, raws, outputs=outputs, columnar=columnar)
+        if 'word_metas' in extracted:
+            add_relation_tags(extracted['word_metas'], rel_types, rel_senses)
+
+        doc = {
+            'lang': lang,
+            'doc_ids': [doc_id],
+            'rel_ids': sorted(rel_parts.keys()),
+            'rel_parts': rel_parts,
+            'rel_types': rel_types,
+            'rel_senses': rel_senses,
+            'relations_gold': relations_gold,
+        }
+        doc.update(extracted)
+        yield doc
+
+
 class Conll16stDataset(dict):
     """CoNLL16st dataset holder as dict."""
 
-    def __init__(self, dataset_dir, lang='?', doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False):
+    def __init__(self, dataset_dir, lang='?', doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False, columnar=False, packed_tags=False, lazy_parsetrees=False, cache_dir=None, workers=None, with_ids=False, vocabs=None, hooks=None, incremental=False):
         self.dataset_dir = dataset_dir
+        self.filter_doc_ids = doc_ids
         self.filter_types = filter_types
         self.filter_senses = filter_senses
         self.filter_fn = filter_fn
+        self.with_rel_senses_all = with_rel_senses_all
+        self.columnar = columnar
+        self.instrument = Instrument(hooks=hooks)
+
+        # shared LRU cache of lazily parsed parse trees
+        self.parsetrees_cache = None
+        if lazy_parsetrees:
+            self.parsetrees_cache = LRUCache(maxsize=PARSETREES_CACHE_SIZE)
+
+        # snapshot of input files for incremental refresh (before loading them)
+        self.state = None
+        if incremental:
+            with self.instrument.stage('snapshot') as record:
+                self.state = snapshot_dataset(dataset_dir)
+                record['items'] = len(self.state['parses']['docs'])
+
+        # relations file with senses (or without senses) to be opened
+        self.relations_fname = find_relations(dataset_dir, with_senses=False)
+        self.with_senses = self.relations_fname is not None and self.relations_fname == find_relations(dataset_dir, with_senses=True)
 
         self['lang'] = lang
-        self['doc_ids'], self['words'], self['word_metas'], self['pos_tags'], self['dependencies'], self['parsetrees'], self['rel_ids'], self['rel_parts'], self['rel_types'], self['rel_senses'], self['relations_gold'] = load_all(dataset_dir, doc_ids=doc_ids, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn, with_rel_senses_all=with_rel_senses_all)
+        self['doc_ids'], self['words'], self['word_metas'], self['pos_tags'], self['dependencies'], self['parsetrees'], self['rel_ids'], self['rel_parts'], self['rel_types'], self['rel_senses'], self['relations_gold'] = load_all(dataset_dir, doc_ids=doc_ids, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn, with_rel_senses_all=with_rel_senses_all, columnar=columnar, packed_tags=packed_tags, parsetrees_cache=self.parsetrees_cache, cache_dir=cache_dir, workers=workers, instrument=self.instrument)
         if not self['doc_ids']:
             raise IOError("Failed to load dataset ({})!".format(dataset_dir))
 
+        # codec of packed integer relation tags
+        if packed_tags:
+            self['tag_codec'] = TagCodec.from_relations(self['rel_types'], self['rel_senses'])
+
+        # integer encoded words/tokens and POS tags (optionally with given/frozen vocabularies)
+        if with_ids or vocabs is not None:
+            with self.instrument.stage('add_ids') as record:
+                self.add_ids(vocabs=vocabs)
+                record['items'] = sum( len(s)  for s in self['words_ids'].values() )
+
+    def add_ids(self, vocabs=None, doc_ids=None):
+        """Add shared vocabularies and integer encoded words/tokens and POS tags by document id (or update them only for `doc_ids`)."""
+
+        words = self['words']
+        pos_tags = self['pos_tags']
+        if doc_ids is not None:
+            words = dict( (doc_id, words[doc_id])  for doc_id in doc_ids )
+            pos_tags = dict( (doc_id, pos_tags[doc_id])  for doc_id in doc_ids )
+        self['vocabs'] = build_vocabs(words, pos_tags, self['rel_types'], self['rel_senses'], vocabs=vocabs)
+        for doc_id in words:
+            self['vocabs']['words'].intern_seq(words[doc_id])
+            self['vocabs']['pos_tags'].intern_seq(pos_tags[doc_id])
+        if doc_ids is None:
+            self['words_ids'] = {}
+            self['pos_ids'] = {}
+        self['words_ids'].update(encode_docs(words, self['vocabs']['words']))
+        self['pos_ids'].update(encode_docs(pos_tags, self['vocabs']['pos_tags']))
+
+    def refresh(self):
+        """Incrementally update dataset to current state of its input files (only if loaded with `incremental=True`) and return diff of changes (see `refresh_dataset()`)."""
+
+        with self.instrument.stage('refresh') as record:
+            diff = refresh_dataset(self)
+            record['items'] = len(diff['docs_added']) + len(diff['docs_changed']) + len(diff['rels_added']) + len(diff['rels_changed'])
+        return diff
+
+    def report(self):
+        """Structured report of loading stages (wall time, CPU time, peak memory delta, item counts) and dataset counts."""
+
+        report = self.instrument.report()
+        report['dataset_dir'] = self.dataset_dir
+        report['counts'] = {
+            'doc_ids': len(self['doc_ids']),
+            'words': sum( len(s)  for s in self['words'].values() ),
+            'rel_ids': len(self['rel_ids']),
+        }
+        return report
+
     def summary(self):
         return "lang: {}, doc_ids: {}, words: {}, rel_ids: {}, relation tokens: {}".format(self['lang'], len(self['doc_ids']), sum([ len(s) for s in self['words'].values() ]), len(self['rel_ids']), sum([ self['rel_parts'][rel_id]['TokenCount'] for rel_id in self['rel_parts'] ]))
+
+
+class LazyConll16stDataset(Conll16stDataset):
+    """CoNLL16st dataset holder as dict with data by document id extracted lazily on first access."""
+
+    def __init__(self, dataset_dir, lang='?', doc_ids=None, filter_types=None, filter_senses=None, filter_fn=None, with_rel_senses_all=False, columnar=False, cache_size=None, hooks=None):
+        self.dataset_dir = dataset_dir
+        self.filter_types = filter_types
+        self.filter_senses = filter_senses
+        self.filter_fn = filter_fn
+        self.instrument = Instrument(hooks=hooks)
+
+        self['lang'] = lang
+        with self.instrument.stage('load_all_lazy'):
+            self['doc_ids'], self['words'], self['word_metas'], self['pos_tags'], self['dependencies'], self['parsetrees'], self['rel_ids'], self['rel_parts'], self['rel_types'], self['rel_senses'], self['relations_gold'] = load_all_lazy(dataset_dir, doc_ids=doc_ids, filter_types=filter_types, filter_senses=filter_senses, filter_fn=filter_fn, with_rel_senses_all=with_rel_senses_all, columnar=columnar, cache_size=cache_size)
+        if not self['doc_ids']:
+            raise IOError("Failed to load dataset ({})!".format(dataset_dir))
+
+
+
+def _intern_tree(node):
+    if isinstance(node, tuple):
+        return tuple( _intern_tree(child)  for child in node )
+    if isinstance(node, str):
+        return intern(node)
+    return node
+
+
+def intern_dataset(dataset, dep_labels=None):
+    """Replace all strings of dataset in-place with interned instances (words, POS tags, document ids, relation tags, types and senses, parse tree and dependency labels), so equal strings of different datasets are shared.
+
+    Columnar dependency graphs are re-encoded with shared vocabulary `dep_labels` (if given).
+    """
+
+    def _by_doc_id(d):
+        return dict( (intern(doc_id), v)  for doc_id, v in d.items() )
+
+    # data by document id
+    dataset['doc_ids'] = [ intern(doc_id)  for doc_id in dataset['doc_ids'] ]
+    for k in EXTRACT_OUTPUTS + ('words_ids', 'pos_ids'):
+        if k in dataset:
+            dataset[k] = _by_doc_id(dataset[k])
+    for doc_id in dataset['doc_ids']:
+        words = dataset['words'][doc_id]
+        words[:] = [ intern(w)  for w in words ]
+        pos_tags = dataset['pos_tags'][doc_id]
+        pos_tags[:] = [ intern(p)  for p in pos_tags ]
+        metas = dataset['word_metas'][doc_id]
+        if isinstance(metas, WordMetas):
+            metas.doc_id = doc_id
+            metas.texts[:] = words
+            if isinstance(metas.tags, list):  # packed tags are integers
+                metas.tags[:] = [ intern(t)  for t in metas.tags ]
+        else:
+            for meta, w in zip(metas, words):
+                meta['Text'] = w
+                meta['DocID'] = doc_id
+                if 'RelationTags' in meta:
+                    meta['RelationTags'] = _intern_tree(meta['RelationTags'])
+        dependencies = dataset['dependencies'][doc_id]
+        if isinstance(dependencies, dict):
+            for deps in dependencies.values():
+                for dep_id in deps:
+                    deps[dep_id] = intern(deps[dep_id])
+        if not isinstance(dataset['parsetrees'][doc_id], LazyParsetrees):  # keep unparsed
+            dataset['parsetrees'][doc_id] = [ _intern_tree(tree)  for tree in dataset['parsetrees'][doc_id] ]
+    if dep_labels is not None and not any(( isinstance(d, dict)  for d in dataset['dependencies'].values() )):
+        share_dependency_labels(dataset['dependencies'], dataset['doc_ids'], dep_labels)
+
+    # data by relation id
+    for rel_id, rel_type in dataset['rel_types'].items():
+        dataset['rel_types'][rel_id] = intern(rel_type)
+    for rel_id, rel_sense in dataset['rel_senses'].items():
+        if isinstance(rel_sense, tuple):
+            dataset['rel_senses'][rel_id] = tuple( intern(s)  for s in rel_sense )
+        else:
+            dataset['rel_senses'][rel_id] = intern(rel_sense)
+    for rel in dataset['rel_parts'].values():
+        rel['DocID'] = intern(rel['DocID'])
+    for gold in dataset['relations_gold'].values():
+        gold['DocID'] = intern(gold['DocID'])
+        gold['Type'] = intern(gold['Type'])
+        gold['Sense'] = [ intern(s)  for s in gold['Sense'] ]
+    return dataset
+
+
+def _load_split(args):
+    """Load one split of CoNLL16st dataset with its strings interned (in worker process)."""
+
+    name, dataset_dir, kwargs = args
+    wall = time.time()
+    dataset = intern_dataset(Conll16stDataset(dataset_dir, **kwargs))
+    return name, dataset, time.time() - wall
+
+
+def load_splits(splits, workers=None, vocabs=None, **kwargs):
+    """Load multiple CoNLL16st datasets (eg. train, dev, test, blind-test) concurrently by `workers` processes with shared strings and vocabularies.
+
+    All strings of all datasets are interned into one shared pool, columnar dependency graphs share one label vocabulary, and words are integer encoded with shared vocabularies (extended in order of `splits`, unless given frozen `vocabs`). Other arguments are passed to `Conll16stDataset` (they must be picklable with multiple workers). Returns datasets by split name and merged statistics.
+
+        datasets, stats = load_splits({'train': "./conll16st-en-03-29-16-train", 'dev': "./conll16st-en-03-29-16-dev"}, lang='en')
+        datasets['train']['vocabs'] is datasets['dev']['vocabs']
+        stats['splits']['dev'] = {'dataset_dir': "./conll16st-en-03-29-16-dev", 'doc_ids': ..., 'words': ..., 'rel_ids': ..., 'relation_tokens': ..., 'wall': ...}
+        stats['total'] = {'doc_ids': ..., 'words': ..., 'rel_ids': ..., 'relation_tokens': ...}
+        stats['vocabs'] = {'words': ..., 'pos_tags': ..., 'rel_types': ..., 'rel_senses': ...}
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(splits))
+    tasks = [ (name, splits[name], kwargs)  for name in splits ]
+
+    wall = time.time()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            loaded = pool.map(_load_split, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        loaded = [ _load_split(task)  for task in tasks ]
+
+    # share strings and vocabularies across splits (in order of splits)
+    datasets = {}
+    stats = {'splits': {}, 'total': {}, 'vocabs': {}}
+    dep_labels = Vocab(unknown=None)
+    for name, dataset, split_wall in loaded:
+        intern_dataset(dataset, dep_labels=dep_labels)
+        dataset.add_ids(vocabs=vocabs)
+        vocabs = dataset['vocabs']
+        datasets[name] = dataset
+        stats['splits'][name] = {
+            'dataset_dir': dataset.dataset_dir,
+            'doc_ids': len(dataset['doc_ids']),
+            'words': sum( len(s)  for s in dataset['words'].values() ),
+            'rel_ids': len(dataset['rel_ids']),
+            'relation_tokens': sum( rel['TokenCount']  for rel in dataset['rel_parts'].values() ),
+            'wall': split_wall,
+        }
+    for k in ['doc_ids', 'words', 'rel_ids', 'relation_tokens']:
+        stats['total'][k] = sum( split_stats[k]  for split_stats in stats['splits'].values() )
+    stats['vocabs'] = dict( (k, len(vocab))  for k, vocab in (vocabs or {}).items() )
+    stats['wall'] = time.time() - wall
+    return datasets, stats
+
+
+### Tests
+
+def test_load_all_parallel():
+    dataset_dir = "./conll16st-en-trial"
+
+    data = load_all(dataset_dir, with_rel_senses_all=True)
+    data_parallel = load_all(dataset_dir, with_rel_senses_all=True, workers=2)
+    assert data_parallel == data
+
+def test_load_all_parallel_chunks():
+    import shutil
+    import tempfile
+    from .synthetic import generate_dataset
+
+    dataset_dir = tempfile.mkdtemp()
+    try:
+        counts = generate_dataset(dataset_dir, scale={'docs': 8, 'sentences': 6, 'words': 12, 'rels': 0.8}, vocab_size=100)
+        for columnar, packed_tags in [(False, False), (True, True)]:
+            data = load_all(dataset_dir, with_rel_senses_all=True, columnar=columnar, packed_tags=packed_tags, workers=1)
+            data_parallel = load_all(dataset_dir, with_rel_senses_all=True, columnar=columnar, packed_tags=packed_tags, workers=3)  # in 8 chunks
+            assert len(data[0]) == counts['docs'] == 8
+            assert len(data[6]) == counts['rels'] > 0
+            assert data_parallel == data
+            assert list(data_parallel[1]) == data[0]  # merged in order of document ids
+            if columnar:
+                # one vocabulary of dependency labels with same ids
+                assert len(set( id(graph.labels)  for graph in data_parallel[4].values() )) == 1
+                for doc_id in data[0]:
+                    assert data_parallel[4][doc_id].gov_labels == data[4][doc_id].gov_labels
+                    assert data_parallel[4][doc_id].dep_labels == data[4][doc_id].dep_labels
+                    assert data_parallel[4][doc_id].labels.id_to_str == data[4][doc_id].labels.id_to_str
+    finally:
+        shutil.rmtree(dataset_dir)
+
+def test_dataset_ids():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    train = Conll16stDataset(dataset_dir, with_ids=True)
+    assert train['vocabs']['words'].decode_seq(train['words_ids'][t_doc_id]) == train['words'][t_doc_id]
+    assert train['vocabs']['pos_tags'].decode_seq(train['pos_ids'][t_doc_id]) == train['pos_tags'][t_doc_id]
+    assert train['vocabs']['rel_types'].encode("Explicit") > 0
+
+    for vocab in train['vocabs'].values():
+        vocab.freeze()
+    test = Conll16stDataset(dataset_dir, vocabs=train['vocabs'])
+    assert test['vocabs'] is train['vocabs']
+    assert test['words_ids'] == train['words_ids']
+
+def test_load_all_columnar():
+    dataset_dir = "./conll16st-en-trial"
+
+    data = load_all(dataset_dir)
+    data_columnar = load_all(dataset_dir, columnar=True)
+    assert data_columnar == data
+
+def test_lazy_dataset():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    dataset = Conll16stDataset(dataset_dir)
+    lazy = LazyConll16stDataset(dataset_dir, cache_size=1)
+    assert lazy['doc_ids'] == dataset['doc_ids']
+    assert lazy['rel_parts'] == dataset['rel_parts']
+    for k in ['words', 'word_metas', 'pos_tags', 'dependencies', 'parsetrees']:
+        assert lazy[k].misses == 0, k
+        assert lazy[k][t_doc_id] == dataset[k][t_doc_id], k
+        assert lazy[k][t_doc_id] == dataset[k][t_doc_id], k
+        assert (lazy[k].hits, lazy[k].misses) == (1, 1), k
+    assert lazy.summary() == dataset.summary()
+
+def test_dataset_report():
+    dataset_dir = "./conll16st-en-trial"
+
+    finished = []
+    dataset = Conll16stDataset(dataset_dir, with_ids=True, hooks=[lambda record: finished.append(record['name'])])
+    report = dataset.report()
+    assert [ r['name']  for r in report['stages'] ] == ['load_parses', 'load_raws', 'load_relations_gold', 'fill_token_lists', 'get_rel_parts', 'extract_docs', 'add_relation_tags', 'add_ids']
+    assert finished == [ r['name']  for r in report['stages'] ]
+    assert report['stages'][0]['items'] == 1
+    assert report['stages'][2]['items'] == 29
+    assert report['stages'][3]['items'] == 0
+    assert report['stages'][5]['items'] == 896
+    assert report['counts'] == {'doc_ids': 1, 'words': 896, 'rel_ids': 29}
+    assert report['wall'] >= max( r['wall']  for r in report['stages'] )
+
+def test_dataset_packed_tags():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    dataset = Conll16stDataset(dataset_dir)
+    for columnar in [False, True]:
+        packed = Conll16stDataset(dataset_dir, columnar=columnar, packed_tags=True)
+        codec = packed['tag_codec']
+        assert [ tuple( codec.to_tag(c)  for c in m['RelationTags'] )  for m in packed['word_metas'][t_doc_id] ] == [ m['RelationTags']  for m in dataset['word_metas'][t_doc_id] ]
+
+def test_dataset_lazy_parsetrees():
+    import shutil
+    import tempfile
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    dataset = Conll16stDataset(dataset_dir)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for kwargs in [{}, {'workers': 2}, {'cache_dir': cache_dir}, {'cache_dir': cache_dir}]:
+            lazy = Conll16stDataset(dataset_dir, lazy_parsetrees=True, **kwargs)
+            cache = lazy.parsetrees_cache
+            assert isinstance(lazy['parsetrees'][t_doc_id], LazyParsetrees)
+            assert lazy['parsetrees'][t_doc_id].cache is cache
+            assert len(cache) == 0
+            assert lazy['parsetrees'][t_doc_id][32] == dataset['parsetrees'][t_doc_id][32]
+            assert (cache.hits, cache.misses) == (0, 1)
+            assert lazy['parsetrees'] == dataset['parsetrees']
+            for k in dataset:
+                assert lazy[k] == dataset[k], k
+    finally:
+        shutil.rmtree(cache_dir)
+
+def test_iter_documents():
+    dataset_dir = "./conll16st-en-trial"
+
+    dataset = Conll16stDataset(dataset_dir, lang='en', with_rel_senses_all=True)
+    docs = list(iter_documents(dataset_dir, lang='en', with_rel_senses_all=True))
+    assert len(docs) == 1
+    for k in dataset:
+        assert docs[0][k] == dataset[k], k
+    assert list(iter_documents(dataset_dir, doc_ids=["missing"])) == []
+
+    docs = list(iter_documents(dataset_dir, outputs=['words']))
+    assert docs[0]['words'] == dataset['words']
+    assert 'word_metas' not in docs[0]
+
+def test_load_splits():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    dataset = Conll16stDataset(dataset_dir, with_ids=True)
+    for workers in [1, 2]:
+        datasets, stats = load_splits({'train': dataset_dir, 'dev': dataset_dir}, workers=workers, lang='en')
+        assert sorted(datasets) == ['dev', 'train']
+        train, dev = datasets['train'], datasets['dev']
+        for k in ['doc_ids', 'words', 'word_metas', 'pos_tags', 'dependencies', 'parsetrees', 'rel_ids', 'rel_parts', 'rel_types', 'rel_senses', 'relations_gold', 'words_ids', 'pos_ids']:
+            assert train[k] == dataset[k], k
+            assert dev[k] == dataset[k], k
+        assert train['lang'] == 'en'
+
+        # shared strings and vocabularies
+        assert train['vocabs'] is dev['vocabs']
+        assert all(( a is b  for a, b in zip(train['words'][t_doc_id], dev['words'][t_doc_id]) ))
+        assert train['word_metas'][t_doc_id][0]['Text'] is dev['words'][t_doc_id][0]
+        assert train['rel_parts'][14905]['DocID'] is dev['doc_ids'][0]
+        assert train['parsetrees'][t_doc_id][0][0][0] is dev['parsetrees'][t_doc_id][0][0][0]
+        assert train['word_metas'][t_doc_id][0]['RelationTags'][0] is dev['word_metas'][t_doc_id][0]['RelationTags'][0]
+
+        assert stats['splits']['dev']['words'] == 896
+        assert stats['total'] == {'doc_ids': 2, 'words': 2 * 896, 'rel_ids': 2 * 29, 'relation_tokens': 2 * 1064}
+        assert stats['vocabs']['words'] == len(dataset['vocabs']['words'])
+
+    # shared tags and dependency labels of columnar datasets
+    dataset = Conll16stDataset(dataset_dir, columnar=True)
+    datasets, stats = load_splits({'train': dataset_dir, 'dev': dataset_dir}, workers=1, lang='en', columnar=True)
+    train, dev = datasets['train'], datasets['dev']
+    assert train['dependencies'] == dataset['dependencies']
+    assert dev['dependencies'] == dataset['dependencies']
+    assert train['dependencies'][t_doc_id].labels is dev['dependencies'][t_doc_id].labels
+    t_tags = train['word_metas'][t_doc_id].tags
+    assert t_tags and all(( a is b  for a, b in zip(t_tags, dev['word_metas'][t_doc_id].tags) ))
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
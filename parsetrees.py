@@ -7,61 +7,361 @@ Process parse trees from CoNLL16st corpus (from `parses.json`).
 __author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
 __license__ = "GPLv3+"
 
-import pyparsing
-import six
+import re
+from array import array
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
 from .files import load_parses
+from .lazy import LRUCache
+from .vocab import Vocab
 
 
-def get_parsetrees(parses):
-    """Extract parse trees of token ids by document id from CoNLL16st corpus.
+_parsetree_token_re = re.compile(r"\([ \t\n\r]*([^() \t\n\r]+)[ \t\n\r]+[^() \t\n\r]+[ \t\n\r]*\)|([()]|[^() \t\n\r]+)")  # leaf label or other token
+_parsetree_leaf_re = re.compile(r"\([ \t\n\r]*[^() \t\n\r]+[ \t\n\r]+[^() \t\n\r]+[ \t\n\r]*\)")  # leaf with token
 
-        # "( (S (NP (NNP Kemper) (NNP Financial) (NNPS Services)..." is represented as:
+PARSETREES_CACHE_SIZE = 10000  # default number of memoized lazy parse trees
+
+
+def parse_parsetree(parsetree_str, token_id=0):
+    """Parse bracketed parse tree string into nested tuples with tokens replaced by consecutive token ids.
+
+    Returns parse tree of first bracketed expression and next unused token id.
+
+        # "( (S (NP (NNP Kemper) (NNP Financial)..." is represented as:
+        (u'S', (u'NP', (u'NNP', 0), (u'NNP', 1), ...
+    """
+
+    stack = []
+    for leaf_label, token in _parsetree_token_re.findall(parsetree_str):
+        if leaf_label:  # leaf with token found
+            node = (leaf_label, token_id)
+            token_id += 1
+        elif token == "(":
+            stack.append([])
+            continue
+        elif token == ")":
+            if not stack:
+                break
+            node = tuple(stack.pop())
+        elif stack:
+            stack[-1].append(token)
+            continue
+        else:
+            break
+
+        if not stack:
+            return node, token_id
+        stack[-1].append(node)
+    raise ValueError("Invalid parse tree ({})!".format(parsetree_str))
+
+
+def count_parsetree_leaves(parsetree_str):
+    """Count leaves with tokens in bracketed parse tree string (without parsing it, equals token ids consumed by `parse_parsetree()` of a single bracketed expression)."""
+
+    return len(_parsetree_leaf_re.findall(parsetree_str))
+
+
+class LazyParsetrees(Sequence):
+    """Read-only list of parse trees of one document by sentence id, kept as bracketed strings and parsed by `parse_parsetree()` only on first access.
+
+    First token id of each sentence is precomputed by counting leaves, so any tree can be parsed independently. Parsed trees are memoized in an `LRUCache` (possibly shared by all documents, with hit/miss counters). Compares equal to the list of eagerly parsed trees.
+
+        parsetrees["wsj_1000"] = LazyParsetrees(sentences: 33)
         parsetrees["wsj_1000"][0] = (u'S', (u'NP', (u'NNP', 0), (u'NNP', 1), (u'NNPS', 2), ...
+        parsetrees["wsj_1000"].cache = LRUCache(maxsize: 10000, cached: 1, hits: 0, misses: 1)
     """
-    sub_begin = "("
-    sub_end = ")"
-    m = {}  # mutable in helper function
 
-    def _is_list(o, list_types=(list, tuple, set)):
-        return any(( isinstance(o, t)  for t in list_types ))
+    def __init__(self, parsetree_strs, cache=None):
+        self.parsetree_strs = list(parsetree_strs)
+        self.token_starts = array('i', [0])  # first token id of each sentence (and end)
+        for parsetree_str in self.parsetree_strs:
+            self.token_starts.append(self.token_starts[-1] + count_parsetree_leaves(parsetree_str))
+        if cache is None:
+            cache = LRUCache(maxsize=PARSETREES_CACHE_SIZE)
+        self.cache = cache
+        self._key = object()  # distinguishes documents in shared cache
 
-    def _is_string(o, string_types=six.string_types):
-        return any(( isinstance(o, t)  for t in string_types ))
+    def _parse(self, sentence_id):
+        return parse_parsetree(self.parsetree_strs[sentence_id], self.token_starts[sentence_id])[0]
 
-    def _is_token_leaf(o):
-        return len(o) == 2 and _is_string(o[0]) and not _is_list(o[1])
+    def __getitem__(self, sentence_id):
+        if isinstance(sentence_id, slice):
+            return [ self[i]  for i in range(*sentence_id.indices(len(self))) ]
+        if sentence_id < 0:
+            sentence_id += len(self.parsetree_strs)
+        if not 0 <= sentence_id < len(self.parsetree_strs):
+            raise IndexError("sentence id out of range")
+        return self.cache.get((self._key, sentence_id), lambda: self._parse(sentence_id))
 
-    def _replace_tokens(tree):
-        if _is_list(tree):
-            if _is_token_leaf(tree):  # leaf with token found
-                tree[1] = m['token_id']
-                m['token_id'] += 1
-                return tuple(tree)
-            else:
-                return tuple( _replace_tokens(t)  for t in tree )
-        else:
-            return tree
+    def __len__(self):
+        return len(self.parsetree_strs)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, LazyParsetrees)) or len(self) != len(other):
+            return False
+        return all( a == b  for a, b in zip(self, other) )
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}(sentences: {})".format(self.__class__.__name__, len(self.parsetree_strs))
+
+
+def get_parsetrees(parses, lazy=False, cache=None):
+    """Extract parse trees of token ids by document id from CoNLL16st corpus (or `LazyParsetrees` sharing one LRU `cache` if `lazy`).
+
+        # "( (S (NP (NNP Kemper) (NNP Financial) (NNPS Services)..." is represented as:
+        parsetrees["wsj_1000"][0] = (u'S', (u'NP', (u'NNP', 0), (u'NNP', 1), (u'NNPS', 2), ...
+    """
+
+    if lazy:
+        if cache is None:
+            cache = LRUCache(maxsize=PARSETREES_CACHE_SIZE)
+        return dict( (doc_id, LazyParsetrees([ sentence_dict['parsetree']  for sentence_dict in parses[doc_id]['sentences'] ], cache=cache))  for doc_id in parses )
 
     parsetrees = {}
     for doc_id in parses:
-        m['token_id'] = 0  # token number within document
+        token_id = 0  # token number within document
 
         parsetrees[doc_id] = []
         for sentence_dict in parses[doc_id]['sentences']:
-            parsetree_str = sentence_dict['parsetree']
-
-            # parse as list
-            parsetree = pyparsing.nestedExpr(sub_begin, sub_end, ignoreExpr=None).parseString(parsetree_str).asList()
-
-            # replace with token ids
-            parsetree = _replace_tokens(parsetree[0])
+            # parse with token ids
+            parsetree, token_id = parse_parsetree(sentence_dict['parsetree'], token_id)
 
             # save
             parsetrees[doc_id].append(parsetree)
     return parsetrees
 
 
+class ParseTree(object):
+    """Compact parse tree of one sentence in flat arrays with interned label ids.
+
+    Nodes are numbered in preorder (root = 0) with `parents` (root = -1), `label_ids` (in shared vocabulary `labels`, unlabeled = ""), `depths` and `postorders`. Descendants of node `n` are nodes `n + 1` to `ends[n] - 1`, so ancestry is tested in O(1). Token ids of each node span from `token_begins[n]` to `token_ends[n] - 1` and leaf (POS tag) nodes of tokens are in `token_nodes` (from token id `token_start`). Lowest common ancestors are found in O(log n) with binary lifting. Stray words inside non-leaf brackets are ignored.
+
+        # "( (S (NP (NNP Kemper) (NNP Financial)..." is represented as:
+        tree.label(1) = "S"
+        tree.token_node(0) = 3
+        tree.lca(3, 4) = 2
+        tree.path_string(0, 5) = "NNP^NP^SvSvVPvVBG"
+        tree.covering(0, 3) = 2
+        tree.production(2) = "NP -> NNP NNP NNPS NNP"
+    """
+
+    def __init__(self, parents, label_ids, depths, postorders, ends, token_begins, token_ends, token_nodes, token_start, labels):
+        self.parents = parents
+        self.label_ids = label_ids
+        self.depths = depths
+        self.postorders = postorders
+        self.ends = ends
+        self.token_begins = token_begins
+        self.token_ends = token_ends
+        self.token_nodes = token_nodes
+        self.token_start = token_start
+        self.labels = labels
+        self._up = None  # ancestors at 2^k steps (on first use)
+
+    @classmethod
+    def from_string(cls, parsetree_str, token_id=0, labels=None):
+        """Build compact parse tree of first bracketed expression in string with tokens numbered from `token_id` (same as `parse_parsetree()`)."""
+        if labels is None:
+            labels = Vocab(unknown=None)
+        encode = labels.encode
+        unlabeled_id = encode("")
+
+        parents = array('i')
+        label_ids = array('i')
+        depths = array('i')
+        postorders = array('i')
+        ends = array('i')
+        token_begins = array('i')
+        token_ends = array('i')
+        token_nodes = array('i')
+        token_start = token_id
+        stack = []  # open nodes
+        opened = False  # last token was "("
+        postorder = 0
+        n = 0  # next node
+        for leaf_label, token in _parsetree_token_re.findall(parsetree_str):
+            if leaf_label:  # leaf with token found
+                parents.append(stack[-1] if stack else -1)
+                depths.append(len(stack))
+                label_ids.append(encode(leaf_label))
+                postorders.append(postorder)
+                ends.append(n + 1)
+                token_begins.append(token_id)
+                token_nodes.append(n)
+                token_id += 1
+                token_ends.append(token_id)
+                postorder += 1
+                n += 1
+                opened = False
+                if not stack:
+                    break
+            elif token == "(":
+                parents.append(stack[-1] if stack else -1)
+                depths.append(len(stack))
+                label_ids.append(unlabeled_id)
+                postorders.append(-1)
+                ends.append(-1)
+                token_begins.append(token_id)
+                token_ends.append(-1)
+                stack.append(n)
+                n += 1
+                opened = True
+            elif token == ")":
+                if not stack:
+                    break
+                m = stack.pop()
+                postorders[m] = postorder
+                ends[m] = n
+                token_ends[m] = token_id
+                postorder += 1
+                opened = False
+                if not stack:
+                    break
+            elif stack:
+                if opened:  # label of node
+                    label_ids[stack[-1]] = encode(token)
+                opened = False
+            else:
+                break
+        if not parents or stack:
+            raise ValueError("Invalid parse tree ({})!".format(parsetree_str))
+        return cls(parents, label_ids, depths, postorders, ends, token_begins, token_ends, token_nodes, token_start, labels)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def label(self, node):
+        """Label of node."""
+
+        return self.labels.decode(self.label_ids[node])
+
+    def children(self, node):
+        """Child nodes of node."""
+
+        children = []
+        c = node + 1
+        while c < self.ends[node]:
+            children.append(c)
+            c = self.ends[c]
+        return tuple(children)
+
+    def token_node(self, token_id):
+        """Leaf (POS tag) node of token id."""
+
+        i = token_id - self.token_start
+        if not 0 <= i < len(self.token_nodes):
+            raise IndexError("token id not in sentence ({})".format(token_id))
+        return self.token_nodes[i]
+
+    def is_ancestor(self, node1, node2):
+        """Is first node an ancestor of (or same as) second node."""
+
+        return node1 <= node2 < self.ends[node1]
+
+    def lca(self, node1, node2):
+        """Lowest common ancestor of two nodes."""
+
+        if self.is_ancestor(node1, node2):
+            return node1
+        if self.is_ancestor(node2, node1):
+            return node2
+        if self._up is None:
+            self._up = [self.parents]
+            while (1 << len(self._up)) < len(self.parents):
+                prev = self._up[-1]
+                self._up.append(array('i', ( prev[p] if p >= 0 else -1  for p in prev )))
+        for up in reversed(self._up):
+            a = up[node1]
+            if a >= 0 and not self.is_ancestor(a, node2):
+                node1 = a
+        return self.parents[node1]
+
+    def token_lca(self, token1_id, token2_id):
+        """Lowest common ancestor of leaf nodes of two token ids."""
+
+        return self.lca(self.token_node(token1_id), self.token_node(token2_id))
+
+    def path(self, token1_id, token2_id):
+        """Path of nodes from leaf node of first token id up to their lowest common ancestor and down to leaf node of second token id."""
+
+        node1 = self.token_node(token1_id)
+        node2 = self.token_node(token2_id)
+        top = self.lca(node1, node2)
+        up = [node1]
+        while up[-1] != top:
+            up.append(self.parents[up[-1]])
+        down = []
+        while node2 != top:
+            down.append(node2)
+            node2 = self.parents[node2]
+        return up + down[::-1]
+
+    def path_string(self, token1_id, token2_id, up="^", down="v"):
+        """Labels on path between two token ids joined with ASCII separators for steps up and down (eg. "NNP^NP^SvVPvVBD")."""
+
+        path = self.path(token1_id, token2_id)
+        top = path.index(min(path))  # lowest common ancestor has smallest preorder number
+        names = self.labels.decode_seq( self.label_ids[n]  for n in path )
+        return up.join(names[:top + 1]) + "".join( down + name  for name in names[top + 1:] )
+
+    def covering(self, token_min, token_max):
+        """Minimal constituent node covering all token ids from `token_min` to `token_max` (inclusive)."""
+
+        return self.token_lca(token_min, token_max)
+
+    def production(self, node):
+        """Production rule of node (eg. "S -> NP VP .")."""
+
+        return "{} -> {}".format(self.label(node), " ".join( self.label(c)  for c in self.children(node) ))
+
+    def productions(self, token_min=None, token_max=None):
+        """Production rules of labeled non-leaf nodes in preorder (optionally only of nodes within token ids from `token_min` to `token_max`)."""
+
+        token_min = self.token_start if token_min is None else token_min
+        token_max = self.token_start + len(self.token_nodes) - 1 if token_max is None else token_max
+        unlabeled_id = self.labels.encode("")
+        return [ self.production(n)  for n in range(len(self.parents)) if self.ends[n] > n + 1 and self.label_ids[n] != unlabeled_id and token_min <= self.token_begins[n] and self.token_ends[n] <= token_max + 1 ]
+
+    def to_tuple(self, node=0):
+        """Convert (sub)tree into nested tuples (same as `parse_parsetree()`)."""
+
+        label = self.label(node)
+        head = (label,) if label else ()
+        if self.ends[node] == node + 1 and self.token_ends[node] > self.token_begins[node]:
+            return head + (self.token_begins[node],)
+        return head + tuple( self.to_tuple(c)  for c in self.children(node) )
+
+
+def get_compact_parsetrees(parses, labels=None):
+    """Extract compact parse trees of token ids by document id and sentence id from CoNLL16st corpus (with shared vocabulary of labels).
+
+        # "( (S (NP (NNP Kemper) (NNP Financial) (NNPS Services)..." is represented as:
+        compact_parsetrees["wsj_1000"][0].to_tuple() = ((u'S', (u'NP', (u'NNP', 0), (u'NNP', 1), (u'NNPS', 2), ...
+        compact_parsetrees["wsj_1000"][0].path_string(0, 5) = "NNP^NP^SvSvVPvVBG"
+    """
+    if labels is None:
+        labels = Vocab(unknown=None)
+
+    compact_parsetrees = {}
+    for doc_id in parses:
+        token_id = 0  # token number within document
+
+        compact_parsetrees[doc_id] = []
+        for sentence_dict in parses[doc_id]['sentences']:
+            tree = ParseTree.from_string(sentence_dict['parsetree'], token_id, labels)
+            token_id += len(tree.token_nodes)
+            compact_parsetrees[doc_id].append(tree)
+    return compact_parsetrees
+
+
 ### Tests
 
 def test_parsetrees():
@@ -89,6 +389,146 @@ def test_parsetrees():
     assert s32[-1][-2][-1][-1][-1] == t_s32_p1
     assert s32[-1][-2][-1][-1][-2][-1] == t_s32_p2
 
+def test_lazy_parsetrees():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    parses = load_parses(dataset_dir)
+    parsetrees = get_parsetrees(parses)
+    cache = LRUCache(maxsize=2)
+    lazy = get_parsetrees(parses, lazy=True, cache=cache)
+    assert sorted(lazy) == sorted(parsetrees)
+    assert lazy[t_doc_id].cache is cache
+    assert len(cache) == 0
+    assert lazy[t_doc_id][32] == parsetrees[t_doc_id][32]
+    assert lazy[t_doc_id][-1] is lazy[t_doc_id][32]
+    assert lazy[t_doc_id][0:2] == parsetrees[t_doc_id][0:2]
+    assert (len(cache), cache.hits, cache.misses) == (2, 2, 3)
+    assert lazy == parsetrees
+    assert lazy[t_doc_id] != parsetrees[t_doc_id][1:]
+    try:
+        lazy[t_doc_id][33]
+        assert False
+    except IndexError:
+        pass
+
+    # token ids continue after empty parse trees
+    trees = LazyParsetrees(["( (S (NP (NNP Kemper))) )", "(())\n", "( (X (NN a b c) (-LRB- -LRB-)) )"])
+    assert list(trees.token_starts) == [0, 1, 1, 2]
+    assert trees[2] == ((u'X', (u'NN', u'a', u'b', u'c'), (u'-LRB-', 1)),)
+
+def test_parse_parsetree():
+    t_trees = [
+        ("( (S (NP (NNP Kemper)) (VP (VBD cut) (PRT (RP off)))) )", 0, ((u'S', (u'NP', (u'NNP', 0)), (u'VP', (u'VBD', 1), (u'PRT', (u'RP', 2)))),), 3),
+        ("(NN x) (VB y)", 5, (u'NN', 5), 6),
+        ("\n (X (NN a b c) (Y) (-LRB- -LRB-))\n", 0, (u'X', (u'NN', u'a', u'b', u'c'), (u'Y',), (u'-LRB-', 0)), 1),
+        ("(())\n", 7, ((),), 7),
+    ]
+
+    for parsetree_str, token_id, t_parsetree, t_token_id in t_trees:
+        assert parse_parsetree(parsetree_str, token_id) == (t_parsetree, t_token_id)
+    for parsetree_str in ["", "x (A)", ")(", "(A (B"]:
+        try:
+            parse_parsetree(parsetree_str)
+            assert False, parsetree_str
+        except ValueError:
+            pass
+
+def test_compact_parsetrees():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    parses = load_parses(dataset_dir)
+    parsetrees = get_parsetrees(parses)
+    compact_parsetrees = get_compact_parsetrees(parses)
+    for doc_id in parsetrees:
+        assert [ tree.to_tuple()  for tree in compact_parsetrees[doc_id] ] == parsetrees[doc_id]
+
+    # "( (S (NP (NNP Kemper) (NNP Financial) (NNPS Services) (NNP Inc.)) (, ,) (S (VP (VBG charging) ..."
+    tree = compact_parsetrees[t_doc_id][0]
+    assert tree.label(0) == "" and tree.label(1) == "S"
+    assert tree.children(1)[:3] == (2, 7, 8)
+    assert tree.token_node(0) == 3
+    assert tree.lca(3, 4) == 2
+    assert tree.lca(3, 3) == 3
+    assert tree.lca(2, 3) == 2
+    assert tree.token_lca(0, 5) == 1
+    assert tree.path(0, 2) == [3, 2, 5]
+    assert tree.path_string(0, 5) == "NNP^NP^SvSvVPvVBG"
+    assert tree.path_string(2, 0, up="<", down=">") == "NNPS<NP>NNP"
+    assert tree.covering(0, 3) == 2
+    assert tree.covering(3, 4) == 1
+    assert tree.production(1) == "S -> NP , S , VP ."
+    assert tree.productions()[:2] == ["S -> NP , S , VP .", "NP -> NNP NNP NNPS NNP"]
+    assert tree.productions(0, 3) == ["NP -> NNP NNP NNPS NNP"]
+    assert all( tree.postorders[c] < tree.postorders[1]  for c in range(2, tree.ends[1]) )
+    assert tree.token_begins[1] == 0 and tree.token_ends[1] == 30 == len(tree.token_nodes)
+    try:
+        tree.token_node(30)
+        assert False
+    except IndexError:
+        pass
+
+    # token ids of later sentences and labels shared by all trees
+    tree = compact_parsetrees[t_doc_id][32]
+    assert tree.token_start == 877
+    assert tree.label(tree.token_node(895)) == "."
+    assert tree.labels is compact_parsetrees[t_doc_id][0].labels
+
+    # brute-force lowest common ancestors
+    for a in range(len(tree)):
+        for b in range(len(tree)):
+            ancestors = set()
+            n = a
+            while n >= 0:
+                ancestors.add(n)
+                n = tree.parents[n]
+            n = b
+            while n not in ancestors:
+                n = tree.parents[n]
+            assert tree.lca(a, b) == n
+
+def test_parsetree_from_string():
+    t_trees = [
+        ("( (S (NP (NNP Kemper)) (VP (VBD cut) (PRT (RP off)))) )", 0, ((u'S', (u'NP', (u'NNP', 0)), (u'VP', (u'VBD', 1), (u'PRT', (u'RP', 2)))),), 3),
+        ("(NN x) (VB y)", 5, (u'NN', 5), 6),
+        ("\n (X (Y) (-LRB- -LRB-))\n", 0, (u'X', (u'Y',), (u'-LRB-', 0)), 1),
+        ("(())\n", 7, ((),), 7),
+    ]
+
+    for parsetree_str, token_id, t_parsetree, t_token_id in t_trees:
+        tree = ParseTree.from_string(parsetree_str, token_id)
+        assert tree.to_tuple() == t_parsetree
+        assert tree.token_start + len(tree.token_nodes) == t_token_id
+    for parsetree_str in ["", "x (A)", ")(", "(A (B"]:
+        try:
+            ParseTree.from_string(parsetree_str)
+            assert False, parsetree_str
+        except ValueError:
+            pass
+
+def test_parsetrees_pyparsing():
+    import pytest
+    pyparsing = pytest.importorskip("pyparsing")
+    dataset_dir = "./conll16st-en-trial"
+
+    def _replace_tokens(tree, m):
+        if isinstance(tree, list):
+            if len(tree) == 2 and not isinstance(tree[0], list) and not isinstance(tree[1], list):
+                tree[1] = m['token_id']
+                m['token_id'] += 1
+                return tuple(tree)
+            return tuple( _replace_tokens(t, m)  for t in tree )
+        return tree
+
+    parses = load_parses(dataset_dir)
+    parsetrees = get_parsetrees(parses)
+    for doc_id in parses:
+        m = {'token_id': 0}
+        for i, sentence_dict in enumerate(parses[doc_id]['sentences']):
+            parsetree = pyparsing.nestedExpr("(", ")", ignoreExpr=None).parseString(sentence_dict['parsetree']).asList()
+            assert parsetrees[doc_id][i] == _replace_tokens(parsetree[0], m)
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['-s', __file__])
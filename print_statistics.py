@@ -1,69 +1,255 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 # pylint: disable=C0103,W0621
-"""Print basic statistics of CoNLL 2016 datasets."""
+"""Print basic statistics of CoNLL 2016 datasets.
+
+By default only relations are loaded (or a whole dataset is reused from persistent cache with `--cache_dir`). Multiple datasets are processed in parallel and printed side-by-side.
+"""
+
+import argparse
+import codecs
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+from conll16st_data.files import load_relations_gold
+from conll16st_data.load import Conll16stDataset
+from conll16st_data.relations import get_rel_parts, get_rel_types, get_rel_senses_all
+
+
+OFFICIAL_DATASETS = [
+    "conll16st-en-03-29-16-train",
+    "conll16st-en-03-29-16-dev",
+    "conll16st-en-03-29-16-test",
+    "conll15st-en-03-29-16-blind-test",
+    "conll16st-zh-01-08-2016-train",
+    "conll16st-zh-01-08-2016-dev",
+    "conll16st-zh-01-08-2016-test",
+    "conll16st-zh-04-27-2016-blind-test",
+]
+LENGTH_FIELDS = ['Arg1Len', 'Arg2Len', 'ConnectiveLen', 'Arg1Tokens', 'Arg2Tokens', 'TokenCount', 'SentenceCount']
+
+
+def count_types(rel_ids, rel_types):
+    return Counter( rel_types[rel_id]  for rel_id in rel_ids if rel_id in rel_types )
+
+
+def count_senses(rel_ids, rel_senses):
+    return Counter( s  for rel_id in rel_ids for s in rel_senses.get(rel_id, ()) )
+
+
+def count_tsenses(rel_ids, rel_types, rel_senses):
+    return Counter( "{}:{}".format(rel_types[rel_id], s)  for rel_id in rel_ids if rel_id in rel_types for s in rel_senses.get(rel_id, ()) )
+
+
+def get_lengths(rel_ids, rel_parts, relations_gold):
+    """Lengths of relations by field (characters of parts, tokens of parts, all tokens, and sentences)."""
+
+    lengths = dict( (field, [])  for field in LENGTH_FIELDS )
+    for rel_id in rel_ids:
+        rel = rel_parts[rel_id]
+        lengths['Arg1Len'].append(rel['Arg1Len'])
+        lengths['Arg2Len'].append(rel['Arg2Len'])
+        lengths['ConnectiveLen'].append(rel['ConnectiveLen'])
+        lengths['Arg1Tokens'].append(len(rel['Arg1']))
+        lengths['Arg2Tokens'].append(len(rel['Arg2']))
+        lengths['TokenCount'].append(rel['TokenCount'])
+        if rel_id in relations_gold:
+            gold = relations_gold[rel_id]
+            lengths['SentenceCount'].append(len(set( t[3]  for part in ['Arg1', 'Arg2', 'Connective', 'Punctuation'] for t in gold[part]['TokenList'] )))
+    return lengths
+
+
+def summarize(values):
+    """Summary of distribution of values (count, mean, minimum, median, 90th percentile, maximum, and histogram)."""
+
+    if not values:
+        return {'count': 0, 'mean': None, 'min': None, 'p50': None, 'p90': None, 'max': None, 'hist': {}}
+    values = sorted(values)
+    n = len(values)
+    return {
+        'count': n,
+        'mean': float(sum(values)) / n,
+        'min': values[0],
+        'p50': values[(n - 1) // 2],
+        'p90': values[min(n - 1, int(0.9 * n))],
+        'max': values[-1],
+        'hist': dict(Counter(values)),
+    }
+
+
+def get_statistics(dataset_dir, cache_dir=None):
+    """Compute statistics of dataset from relations only (or from whole dataset reused from persistent cache in `cache_dir`)."""
+
+    wall = time.time()
+    stats = {'dataset_dir': dataset_dir, 'name': os.path.basename(os.path.normpath(dataset_dir))}
+    if cache_dir is not None:
+        # whole dataset from persistent cache
+        dataset = Conll16stDataset(dataset_dir, with_rel_senses_all=True, cache_dir=cache_dir)
+        rel_ids, rel_parts, rel_types, rel_senses, relations_gold = dataset['rel_ids'], dataset['rel_parts'], dataset['rel_types'], dataset['rel_senses'], dataset['relations_gold']
+        stats['doc_ids'] = len(dataset['doc_ids'])
+        stats['words'] = sum( len(s)  for s in dataset['words'].values() )
+    else:
+        # only relations (without senses if missing)
+        relations_gold = load_relations_gold(dataset_dir, with_senses=True)
+        relationsnos_gold = relations_gold
+        if not relations_gold:
+            relationsnos_gold = load_relations_gold(dataset_dir, with_senses=False)
+        rel_parts = get_rel_parts(relationsnos_gold)
+        rel_ids = sorted(rel_parts)
+        rel_types = get_rel_types(relations_gold)
+        rel_senses = get_rel_senses_all(relations_gold)
+        relations_gold = relationsnos_gold
+        stats['doc_ids'] = None
+        stats['words'] = None
+
+    stats['rel_doc_ids'] = len(set( rel_parts[rel_id]['DocID']  for rel_id in rel_ids ))  # documents with relations
+    stats['rel_ids'] = len(rel_ids)
+    stats['relation_tokens'] = sum( rel_parts[rel_id]['TokenCount']  for rel_id in rel_ids )
+    stats['types'] = dict(count_types(rel_ids, rel_types))
+    stats['senses'] = dict(count_senses(rel_ids, rel_senses))
+    stats['tsenses'] = dict(count_tsenses(rel_ids, rel_types, rel_senses))
+    stats['lengths'] = dict( (field, summarize(values))  for field, values in get_lengths(rel_ids, rel_parts, relations_gold).items() )
+    stats['wall'] = time.time() - wall
+    return stats
+
+
+def _get_statistics(args):
+    return get_statistics(*args)
+
+
+def print_statistics(stats):
+    """Print statistics of one dataset."""
+
+    print("dataset '{}' ({:.2f}s)".format(stats['dataset_dir'], stats['wall']))
+    print("doc_ids: {}, words: {}, doc_ids with relations: {}, rel_ids: {}, relation tokens: {}".format(stats['doc_ids'], stats['words'], stats['rel_doc_ids'], stats['rel_ids'], stats['relation_tokens']))
 
-from .load import Conll16stDataset
-
-
-def count_types(data):
     print("\nTypes:")
-
-    counts = {}
-    for rel_id in data['rel_ids']:
-        rel_type = data['rel_types'][rel_id]
-        try:
-            counts[rel_type] += 1
-        except KeyError:
-            counts[rel_type] = 1
-
-    for name, count in sorted(counts.items(), key=lambda a: a[0]):
+    for name, count in sorted(stats['types'].items(), key=lambda a: a[0]):
         print("- {}: {}".format(name, count))
 
-
-def count_senses(data):
     print("\nSenses:")
-
-    counts = {}
-    for rel_id in data['rel_ids']:
-        rel_senses = data['rel_senses'][rel_id]
-        for s in rel_senses:
-            try:
-                counts[s] += 1
-            except KeyError:
-                counts[s] = 1
-
-    for name, count in sorted(counts.items(), key=lambda a: a[0]):
+    for name, count in sorted(stats['senses'].items(), key=lambda a: a[0]):
         print("- {}: {}".format(name, count))
 
-def count_tsenses(data):
     print("\nSenses with prepended types:")
-
-    counts = {}
-    for rel_id in data['rel_ids']:
-        rel_type = data['rel_types'][rel_id]
-        rel_senses = data['rel_senses'][rel_id]
-        for s in rel_senses:
-            k = "{}:{}".format(rel_type, s)
-            try:
-                counts[k] += 1
-            except KeyError:
-                counts[k] = 1
-
-    for name, count in sorted(counts.items(), key=lambda a: a[1], reverse=True):
+    for name, count in sorted(stats['tsenses'].items(), key=lambda a: (-a[1], a[0])):
         print("- {}: {}".format(name, count))
 
+    print("\nLengths (mean/p50/p90/max):")
+    for field in LENGTH_FIELDS:
+        print("- {}: {}".format(field, _format_length(stats['lengths'][field])))
+    print("")
 
-if __name__ == '__main__':
-    import sys
-    data_dir = sys.argv[1]
 
-    print("load dataset '{}'".format(data_dir))
-    data = Conll16stDataset(data_dir, with_rel_senses_all=True)
-    print(data.summary())
+def _format_length(summary):
+    if not summary['count']:
+        return "-"
+    return "{:.1f}/{}/{}/{}".format(summary['mean'], summary['p50'], summary['p90'], summary['max'])
+
+
+def print_table(all_stats):
+    """Print statistics of multiple datasets side-by-side."""
+
+    rows = [("doc_ids", [ s['doc_ids']  for s in all_stats ])]
+    rows.append(("words", [ s['words']  for s in all_stats ]))
+    rows.append(("doc_ids with relations", [ s['rel_doc_ids']  for s in all_stats ]))
+    rows.append(("rel_ids", [ s['rel_ids']  for s in all_stats ]))
+    rows.append(("relation tokens", [ s['relation_tokens']  for s in all_stats ]))
+    for key, title in [('types', "type"), ('senses', "sense"), ('tsenses', "type:sense")]:
+        names = sorted(set( name  for s in all_stats for name in s[key] ))
+        rows.extend( ("{} {}".format(title, name), [ s[key].get(name, 0)  for s in all_stats ])  for name in names )
+    rows.extend( ("{} (mean/p50/p90/max)".format(field), [ _format_length(s['lengths'][field])  for s in all_stats ])  for field in LENGTH_FIELDS )
+
+    headers = [ s['name']  for s in all_stats ]
+    width0 = max( len(title)  for title, _ in rows )
+    widths = [ max([len(h)] + [ len(str(values[i]))  for _, values in rows ])  for i, h in enumerate(headers) ]
+    print("  ".join([" " * width0] + [ h.rjust(w)  for h, w in zip(headers, widths) ]))
+    for title, values in rows:
+        print("  ".join([title.ljust(width0)] + [ ("-" if v is None else str(v)).rjust(w)  for v, w in zip(values, widths) ]))
+
+
+### Tests
+
+def test_summarize():
+    assert summarize([]) == {'count': 0, 'mean': None, 'min': None, 'p50': None, 'p90': None, 'max': None, 'hist': {}}
+    summary = summarize([3, 1, 2, 2, 10])
+    assert summary == {'count': 5, 'mean': 3.6, 'min': 1, 'p50': 2, 'p90': 10, 'max': 10, 'hist': {1: 1, 2: 2, 3: 1, 10: 1}}
+
+def test_get_statistics():
+    import shutil
+    import tempfile
+    dataset_dir = "./conll16st-en-trial"
+
+    stats = get_statistics(dataset_dir)
+    assert stats['name'] == "conll16st-en-trial"
+    assert stats['doc_ids'] is None and stats['words'] is None
+    assert stats['rel_doc_ids'] == 1
+    assert stats['rel_ids'] == 29
+    assert stats['relation_tokens'] == 1064
+    assert sum(stats['types'].values()) == 29
+    assert sum(stats['senses'].values()) >= 29
+    assert sum(stats['tsenses'].values()) == sum(stats['senses'].values())
+    for field in LENGTH_FIELDS:
+        assert stats['lengths'][field]['count'] == 29, field
+        assert sum(stats['lengths'][field]['hist'].values()) == 29, field
+    assert stats['lengths']['TokenCount']['mean'] == 1064. / 29
+    assert stats['lengths']['Arg1Tokens']['min'] > 0
+
+    # same relation statistics from whole dataset (with counts of all documents and words)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        stats_cached = get_statistics(dataset_dir, cache_dir=cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+    assert stats_cached['doc_ids'] == 1 and stats_cached['words'] == 896
+    for k in ['rel_doc_ids', 'rel_ids', 'relation_tokens', 'types', 'senses', 'tsenses', 'lengths']:
+        assert stats_cached[k] == stats[k], k
+
+    # printed side-by-side
+    print_table([stats, stats_cached])
 
-    count_types(data)
-    count_senses(data)
-    count_tsenses(data)
-    print("")
 
+if __name__ == '__main__':
+    # parse arguments
+    argp = argparse.ArgumentParser(description=__doc__.strip().split("\n", 1)[0])
+    argp.add_argument('dataset_dirs', nargs='*',
+        help="CoNLL16st dataset directories")
+    argp.add_argument('--official', type=str, default=None,
+        help="add all official EN/ZH datasets from given data directory (eg. ./data/)")
+    argp.add_argument('--cache_dir', type=str, default=None,
+        help="reuse whole datasets from persistent cache (instead of loading only relations)")
+    argp.add_argument('--workers', type=int, default=None,
+        help="number of worker processes (default: number of CPUs)")
+    argp.add_argument('--output_json', type=str, default=None,
+        help="save statistics in JSON format")
+    args = argp.parse_args()
+    dataset_dirs = list(args.dataset_dirs)
+    if args.official:
+        dataset_dirs.extend( os.path.join(args.official, name)  for name in OFFICIAL_DATASETS )
+    if not dataset_dirs:
+        argp.error("no dataset directories given")
+
+    # compute statistics (in parallel)
+    tasks = [ (dataset_dir, args.cache_dir)  for dataset_dir in dataset_dirs ]
+    workers = min(args.workers or multiprocessing.cpu_count(), len(tasks))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            all_stats = pool.map(_get_statistics, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        all_stats = [ _get_statistics(task)  for task in tasks ]
+
+    if len(all_stats) == 1:
+        print_statistics(all_stats[0])
+    else:
+        print_table(all_stats)
+
+    if args.output_json:
+        with codecs.open(args.output_json, 'w', encoding='utf8') as f:
+            json.dump(all_stats, f, indent=2, sort_keys=True)
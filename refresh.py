@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Incremental refresh of loaded CoNLL16st datasets (detect changed documents and relations, and recompute only affected data).
+
+Snapshots of a dataset contain content hashes of documents in `parses.json`, sizes and modification times of raw texts in `raw/`, and content hashes of lines in `relations.json`. Unchanged files are not read again.
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+import codecs
+import hashlib
+import json
+import os
+import re
+
+from .files import PARSES_FFMTS, RAW_FFMTS, find_relations, load_parses, load_raws, _iter_json_object, _relations_ffmts, _open_relations, _iter_relation_lines, _relation_docid_re, _decode_relation, _finish_relation
+from .words import RELATION_PARTS
+from .relations import fill_token_lists, get_rel_parts, get_rel_types, get_rel_senses, get_rel_senses_all, add_relation_tags
+from .extract import EXTRACT_OUTPUTS, extract_docs
+
+_relation_id_re = re.compile(r'"ID"[ \t]*:[ \t]*(\d+)')
+
+
+def _file_stat(fname):
+    st = os.stat(fname)
+    return (st.st_size, st.st_mtime)
+
+
+def _digest(s):
+    return hashlib.sha1(s.encode('utf8')).hexdigest()
+
+
+def snapshot_parses(dataset_dir, prev=None, parses_ffmts=None):
+    """Snapshot parses file by content hashes of undecoded documents (reused from `prev` snapshot if file is unchanged).
+
+        snapshot['docs']["wsj_1000"] = "5d1f2b..."
+    """
+    if parses_ffmts is None:
+        parses_ffmts = PARSES_FFMTS
+
+    for parses_ffmt in parses_ffmts:
+        fname = parses_ffmt.format(dataset_dir)
+        if not os.path.isfile(fname):
+            continue
+        stat = _file_stat(fname)
+        if prev is not None and prev['fname'] == fname and prev['stat'] == stat:
+            return prev
+
+        docs = {}
+        with codecs.open(fname, 'r', encoding='utf8') as f:
+            for doc_id, value in _iter_json_object(f, raw_values=True):
+                docs[doc_id] = _digest(value)
+        return {'fname': fname, 'stat': stat, 'docs': docs}
+    return {'fname': None, 'stat': None, 'docs': {}}
+
+
+def snapshot_raws(dataset_dir, raw_ffmts=None):
+    """Snapshot raw texts by their sizes and modification times by document id.
+
+        snapshot["wsj_1000"] = (5683, 1458937405.0)
+    """
+    if raw_ffmts is None:
+        raw_ffmts = RAW_FFMTS
+
+    snapshot = {}
+    for raw_ffmt in raw_ffmts:
+        raw_dir = os.path.dirname(raw_ffmt.format(dataset_dir, ""))
+        if not os.path.isdir(raw_dir):
+            continue
+        for doc_id in os.listdir(raw_dir):
+            if doc_id not in snapshot:
+                snapshot[doc_id] = _file_stat(raw_ffmt.format(dataset_dir, doc_id))
+    return snapshot
+
+
+def snapshot_relations(dataset_dir, prev=None, relations_ffmts=None, with_lines_of=None):
+    """Snapshot relations file by content hashes of lines with their document and relation ids (reused from `prev` snapshot if file is unchanged).
+
+    Returns snapshot and undecoded lines by content hash that are new since `prev` snapshot or belong to documents in `with_lines_of`.
+
+        snapshot['lines']["9a1b3c..."] = ("wsj_1000", 14905)
+    """
+    if relations_ffmts is None:
+        relations_ffmts = _relations_ffmts(with_senses=False)
+    prev_lines = prev['lines'] if prev is not None else {}
+
+    f = _open_relations(dataset_dir, relations_ffmts)
+    if f is None:
+        return {'fname': None, 'stat': None, 'lines': {}}, {}
+    with f:
+        stat = _file_stat(f.name)
+        if prev is not None and prev['fname'] == f.name and prev['stat'] == stat and not with_lines_of:
+            return prev, {}
+
+        snapshot = {'fname': f.name, 'stat': stat, 'lines': {}}
+        lines = {}
+        for line in _iter_relation_lines(f):
+            h = _digest(line)
+            if h in prev_lines:
+                doc_id, rel_id = prev_lines[h]
+            else:
+                # document and relation ids from undecoded line (top-level keys usually follow long arguments)
+                m_doc = _relation_docid_re.match(line, max(0, line.rfind('"DocID"')))
+                m_id = _relation_id_re.match(line, max(0, line.rfind('"ID"')))
+                if m_doc and "\\" not in m_doc.group(1) and m_id:
+                    doc_id, rel_id = m_doc.group(1), int(m_id.group(1))
+                else:
+                    relation = json.loads(line)
+                    doc_id, rel_id = relation['DocID'], relation['ID']
+            snapshot['lines'][h] = (doc_id, rel_id)
+            if h not in prev_lines or (with_lines_of and doc_id in with_lines_of):
+                lines[h] = line
+    return snapshot, lines
+
+
+def snapshot_dataset(dataset_dir):
+    """Snapshot all input files of CoNLL16st dataset (for `refresh_dataset()`)."""
+
+    return {
+        'parses': snapshot_parses(dataset_dir),
+        'raws': snapshot_raws(dataset_dir),
+        'relations': snapshot_relations(dataset_dir)[0],
+    }
+
+
+def refresh_dataset(dataset):
+    """Incrementally update loaded `Conll16stDataset` in-place to current state of its input files and return diff of changes.
+
+    Only added or changed documents are loaded and extracted again (`words`, `word_metas`, `pos_tags`, `dependencies`, `parsetrees`), only new or changed lines of relations are decoded (`rel_parts`, `rel_types`, `rel_senses`, `relations_gold`), and relation tags are recomputed only for documents with affected relations.
+
+        diff = {
+            'docs_added': ["wsj_2300"], 'docs_changed': ["wsj_1000"], 'docs_removed': [],
+            'rels_added': [35708], 'rels_changed': [14905], 'rels_removed': [14887],
+            'docs_retagged': ["wsj_1000", "wsj_2300"],
+        }
+    """
+    if getattr(dataset, 'state', None) is None:
+        raise ValueError("Missing snapshot of dataset (load it with incremental=True)!")
+    dataset_dir = dataset.dataset_dir
+    state = dataset.state
+
+    # detect added, changed, and removed documents
+    parses_state = snapshot_parses(dataset_dir, prev=state['parses'])
+    raws_state = snapshot_raws(dataset_dir)
+    old_doc_ids = set(dataset['doc_ids'])
+    new_doc_ids = set(parses_state['docs'])
+    if dataset.filter_doc_ids is not None:
+        new_doc_ids &= set(dataset.filter_doc_ids)
+    docs_added = sorted(new_doc_ids - old_doc_ids)
+    docs_removed = sorted(old_doc_ids - new_doc_ids)
+    docs_changed = sorted( doc_id  for doc_id in new_doc_ids & old_doc_ids if parses_state['docs'][doc_id] != state['parses']['docs'].get(doc_id) or raws_state.get(doc_id) != state['raws'].get(doc_id) )
+
+    # detect and decode added and changed relations (including unchanged lines of added documents)
+    relations_state, lines = snapshot_relations(dataset_dir, prev=state['relations'], with_lines_of=frozenset(docs_added))
+    if relations_state['fname'] != state['relations']['fname']:
+        # relations file appeared or was replaced (eg. by one with senses)
+        relations_state, lines = snapshot_relations(dataset_dir, with_lines_of=frozenset(new_doc_ids))
+        dataset.relations_fname = relations_state['fname']
+        dataset.with_senses = relations_state['fname'] is not None and relations_state['fname'] == find_relations(dataset_dir, with_senses=True)
+    removed_rel_ids = set( rel_id  for h, (_, rel_id) in state['relations']['lines'].items() if h not in relations_state['lines'] )
+    removed_rel_ids.update( rel_id  for rel_id, rel in dataset['rel_parts'].items() if rel['DocID'] in docs_removed )
+    filter_types = frozenset(dataset.filter_types) if dataset.filter_types else None
+    filter_senses = frozenset(dataset.filter_senses) if dataset.filter_senses else None
+    decoded = {}
+    for h in sorted(lines):
+        relation = _decode_relation(lines[h], frozenset(new_doc_ids), filter_types, filter_senses)
+        relation = _finish_relation(relation, dataset.with_senses, False, dataset.filter_fn)
+        if relation is not None:
+            decoded[relation['ID']] = relation
+    old_rel_ids = set(dataset['rel_parts'])
+    rels_added = sorted(set(decoded) - old_rel_ids)
+    rels_changed = sorted(set(decoded) & old_rel_ids)
+    rels_removed = sorted((removed_rel_ids & old_rel_ids) - set(decoded))
+
+    # load added and changed documents untouched
+    extract_doc_ids = sorted(docs_added + docs_changed)
+    parses = load_parses(dataset_dir, doc_ids=extract_doc_ids) if extract_doc_ids else {}
+    raws = load_raws(dataset_dir, doc_ids=extract_doc_ids) if extract_doc_ids else {}
+
+    # update data by relation id
+    fill_doc_ids = set( rel['DocID']  for rel in decoded.values() for part in RELATION_PARTS if not rel[part]['TokenList'] and rel[part]['CharacterSpanList'] )
+    fill_doc_ids -= set(parses)
+    fill_parses = parses
+    if fill_doc_ids:
+        fill_parses = dict(parses)
+        fill_parses.update(load_parses(dataset_dir, doc_ids=sorted(fill_doc_ids)))
+    fill_token_lists(decoded, fill_parses)
+    docs_retagged = set(extract_doc_ids)
+    for rel_id in rels_changed + rels_removed:
+        docs_retagged.add(dataset['rel_parts'][rel_id]['DocID'])
+        for k in ['rel_parts', 'rel_types', 'rel_senses', 'relations_gold']:
+            dataset[k].pop(rel_id, None)
+    docs_retagged.update( rel['DocID']  for rel in decoded.values() )
+    dataset['rel_parts'].update(get_rel_parts(decoded))
+    if dataset.with_senses:
+        dataset['relations_gold'].update(decoded)
+        dataset['rel_types'].update(get_rel_types(decoded))
+        if dataset.with_rel_senses_all:
+            dataset['rel_senses'].update(get_rel_senses_all(decoded))
+        else:
+            dataset['rel_senses'].update(get_rel_senses(decoded))
+    dataset['rel_ids'] = sorted(dataset['rel_parts'])
+
+    # update data by document id
+    for doc_id in docs_removed:
+        for k in EXTRACT_OUTPUTS + ('words_ids', 'pos_ids'):
+            if k in dataset:
+                dataset[k].pop(doc_id, None)
+    if extract_doc_ids:
+        dep_labels = None  # extend vocabulary of labels of compact dependencies
+        if dataset.columnar:
+            dep_labels = next(( graph.labels  for graph in dataset['dependencies'].values() ), None)
+        extracted = extract_docs(parses, raws, columnar=dataset.columnar, lazy_parsetrees=dataset.parsetrees_cache is not None, parsetrees_cache=dataset.parsetrees_cache, dep_labels=dep_labels)
+        for k in EXTRACT_OUTPUTS:
+            dataset[k].update(extracted[k])
+    dataset['doc_ids'] = sorted(new_doc_ids)
+    docs_retagged = sorted(docs_retagged & new_doc_ids)
+    add_relation_tags(dict( (doc_id, dataset['word_metas'][doc_id])  for doc_id in docs_retagged ), dataset['rel_types'], dataset['rel_senses'], codec=dataset.get('tag_codec'))
+    if 'vocabs' in dataset:
+        dataset.add_ids(vocabs=dataset['vocabs'], doc_ids=extract_doc_ids)
+
+    dataset.state = {'parses': parses_state, 'raws': raws_state, 'relations': relations_state}
+    return {
+        'docs_added': docs_added,
+        'docs_changed': docs_changed,
+        'docs_removed': docs_removed,
+        'rels_added': rels_added,
+        'rels_changed': rels_changed,
+        'rels_removed': rels_removed,
+        'docs_retagged': docs_retagged,
+    }
+
+
+### Tests
+
+def _rewrite_relations(dataset_dir, fn):
+    fname = os.path.join(dataset_dir, "relations.json")
+    with codecs.open(fname, 'r', encoding='utf8') as f:
+        relations = [ json.loads(line)  for line in f if line.strip() ]
+    relations = fn(relations)
+    with codecs.open(fname, 'w', encoding='utf8') as f:
+        for relation in relations:
+            f.write(json.dumps(relation) + "\n")
+    return relations
+
+def _assert_same_dataset(dataset, t_dataset, keys=('doc_ids', 'words', 'word_metas', 'pos_tags', 'dependencies', 'parsetrees', 'rel_ids', 'rel_parts', 'rel_types', 'rel_senses', 'relations_gold')):
+    for k in keys:
+        assert dataset[k] == t_dataset[k], k
+
+def test_refresh_unchanged():
+    from .load import Conll16stDataset
+    dataset_dir = "./conll16st-en-trial"
+
+    dataset = Conll16stDataset(dataset_dir, incremental=True)
+    diff = dataset.refresh()
+    assert all(( not v  for v in diff.values() ))
+    assert dataset.report()['stages'][-1]['name'] == 'refresh'
+
+def test_refresh_changes():
+    import shutil
+    import tempfile
+    from .load import Conll16stDataset
+
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+    doc_id_new = "wsj_9999"
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tmp_dataset_dir = os.path.join(tmp_dir, "dataset")
+        shutil.copytree(dataset_dir, tmp_dataset_dir)
+        dataset = Conll16stDataset(tmp_dataset_dir, incremental=True, with_ids=True)
+        words_count = len(dataset['vocabs']['words'])
+
+        # add modified copy of document
+        fname = os.path.join(tmp_dataset_dir, "parses.json")
+        with codecs.open(fname, 'r', encoding='utf8') as f:
+            parses = json.load(f)
+        parses[doc_id_new] = json.loads(json.dumps(parses[doc_id]))
+        parses[doc_id_new]['sentences'][0]['words'][0][0] = "Kemperer"
+        with codecs.open(fname, 'w', encoding='utf8') as f:
+            json.dump(parses, f)
+        shutil.copy(os.path.join(tmp_dataset_dir, "raw", doc_id), os.path.join(tmp_dataset_dir, "raw", doc_id_new))
+
+        # change sense of one relation, remove another, and add relation to new document
+        def _change(relations):
+            relations[0]['Sense'] = ["Comparison.Contrast"]
+            del relations[1]
+            relations.append(dict(relations[2], DocID=doc_id_new, ID=99999))
+            return relations
+        relations = _rewrite_relations(tmp_dataset_dir, _change)
+
+        diff = dataset.refresh()
+        assert diff['docs_added'] == [doc_id_new]
+        assert diff['docs_changed'] == []
+        assert diff['rels_added'] == [99999]
+        assert diff['rels_changed'] == [relations[0]['ID']]
+        assert len(diff['rels_removed']) == 1
+        assert diff['docs_retagged'] == [doc_id, doc_id_new]
+        _assert_same_dataset(dataset, Conll16stDataset(tmp_dataset_dir))
+        assert dataset['words_ids'][doc_id_new][0] == words_count
+        assert dataset['vocabs']['words'].decode(words_count) == "Kemperer"
+
+        # remove document
+        del parses[doc_id_new]
+        with codecs.open(fname, 'w', encoding='utf8') as f:
+            json.dump(parses, f)
+        diff = dataset.refresh()
+        assert diff['docs_removed'] == [doc_id_new]
+        assert diff['rels_removed'] == [99999]
+        _assert_same_dataset(dataset, Conll16stDataset(tmp_dataset_dir))
+        assert doc_id_new not in dataset['words_ids']
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_refresh_relations_added():
+    import shutil
+    import tempfile
+    from .load import Conll16stDataset
+
+    dataset_dir = "./conll16st-en-trial"
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tmp_dataset_dir = os.path.join(tmp_dir, "dataset")
+        shutil.copytree(dataset_dir, tmp_dataset_dir)
+        relations = []
+        _rewrite_relations(tmp_dataset_dir, lambda r: relations.extend(r) or [])
+        dataset = Conll16stDataset(tmp_dataset_dir, incremental=True)
+        assert dataset['rel_ids'] == []
+        assert dataset.with_senses
+
+        # relations are added to corpus later
+        _rewrite_relations(tmp_dataset_dir, lambda _: relations)
+        diff = dataset.refresh()
+        assert len(diff['rels_added']) == len(relations) == 29
+        assert diff['docs_retagged'] == ["wsj_1000"]
+        t_dataset = Conll16stDataset(tmp_dataset_dir)
+        assert len(t_dataset['rel_types']) == 29
+        _assert_same_dataset(dataset, t_dataset)
+
+        # without relations file with senses
+        os.remove(os.path.join(tmp_dataset_dir, "relations.json"))
+        diff = dataset.refresh()
+        assert not dataset.with_senses
+        assert len(diff['rels_changed']) == 29
+        t_dataset = Conll16stDataset(tmp_dataset_dir)
+        assert t_dataset['rel_types'] == {} and len(t_dataset['rel_ids']) == 29
+        _assert_same_dataset(dataset, t_dataset)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_refresh_columnar_packed():
+    import shutil
+    import tempfile
+    from .load import Conll16stDataset
+
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tmp_dataset_dir = os.path.join(tmp_dir, "dataset")
+        shutil.copytree(dataset_dir, tmp_dataset_dir)
+        dataset = Conll16stDataset(tmp_dataset_dir, incremental=True, columnar=True, packed_tags=True)
+
+        # change type of relation with only character spans of arguments
+        def _change(relations):
+            relations[0]['Type'] = "AltLex"
+            for part in ['Arg1', 'Arg2']:
+                del relations[0][part]['TokenList']
+            return relations
+        relations = _rewrite_relations(tmp_dataset_dir, _change)
+
+        diff = dataset.refresh()
+        assert diff['rels_changed'] == [relations[0]['ID']]
+        assert diff['docs_retagged'] == [doc_id]
+        t_dataset = Conll16stDataset(tmp_dataset_dir, columnar=True)
+        _assert_same_dataset(dataset, t_dataset, keys=('doc_ids', 'words', 'rel_ids', 'rel_parts', 'rel_types', 'rel_senses', 'relations_gold'))
+
+        # add document with new dependency label
+        fname = os.path.join(tmp_dataset_dir, "parses.json")
+        with codecs.open(fname, 'r', encoding='utf8') as f:
+            parses = json.load(f)
+        parses["wsj_9999"] = json.loads(json.dumps(parses[doc_id]))
+        parses["wsj_9999"]['sentences'][0]['dependencies'][0][0] = "xnew"
+        with codecs.open(fname, 'w', encoding='utf8') as f:
+            json.dump(parses, f)
+        shutil.copy(os.path.join(tmp_dataset_dir, "raw", doc_id), os.path.join(tmp_dataset_dir, "raw", "wsj_9999"))
+        diff = dataset.refresh()
+        assert diff['docs_added'] == ["wsj_9999"]
+        _assert_same_dataset(dataset, Conll16stDataset(tmp_dataset_dir, columnar=True), keys=('doc_ids', 'words', 'dependencies'))
+        labels = dataset['dependencies'][doc_id].labels
+        assert dataset['dependencies']["wsj_9999"].labels is labels
+        assert "xnew" in labels
+        codec = dataset['tag_codec']
+        assert [ tuple( codec.to_tag(c)  for c in m['RelationTags'] )  for m in dataset['word_metas'][doc_id] ] == [ m['RelationTags']  for m in t_dataset['word_metas'][doc_id] ]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
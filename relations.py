@@ -7,8 +7,15 @@ Process shallow discourse relations from CoNLL16st corpus (from `relations.json`
 __author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
 __license__ = "GPLv3+"
 
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # optional for vectorized tag filtering
+    np = None
+
 from .files import load_parses, load_raws, load_relations_gold
-from .words import get_word_metas
+from .words import RELATION_PARTS, CharOffsetIndex, WordMetas, get_word_metas
 
 
 def rtsip_to_tag(rel_type, rel_sense, rel_id, rel_part):
@@ -42,6 +49,274 @@ def strip_sense_level(rel_sense, level=None):
     return rel_sense
 
 
+class TagCodec(object):
+    """Encoding of discourse relation tags as packed integers (relation type id, sense id at each level, relation id, and part id).
+
+    Bit layout from most significant bits: type id (4 bits), sense ids of levels 1-3 (8 bits each, 0 for missing level), relation id (24 bits), and part id (2 bits, index into `RELATION_PARTS`). Sense ids at each level index sense prefixes (eg. "Contingency", "Contingency.Condition"), so filtering tags by string prefixes becomes masking of integers. Strings are materialized only on demand.
+
+        codec.encode("Explicit", "Contingency.Condition", 14905, "Arg2") = 4415226439909
+        codec.to_tag(4415226439909) = "Explicit:Contingency.Condition:14905:Arg2"
+        codec.match(codes, ["Explicit:Contingency"]) = array([True, False, ...])
+    """
+
+    PART_BITS = 2
+    REL_ID_BITS = 24
+    SENSE_BITS = 8
+    SENSE_LEVELS = 3
+    TYPE_BITS = 4
+
+    REL_ID_SHIFT = PART_BITS
+    SENSE_SHIFTS = (PART_BITS + REL_ID_BITS + 2 * SENSE_BITS, PART_BITS + REL_ID_BITS + SENSE_BITS, PART_BITS + REL_ID_BITS)  # levels 1-3
+    TYPE_SHIFT = PART_BITS + REL_ID_BITS + SENSE_BITS * SENSE_LEVELS
+
+    PART_MASK = (1 << PART_BITS) - 1
+    REL_ID_MASK = ((1 << REL_ID_BITS) - 1) << REL_ID_SHIFT
+    SENSE_MASKS = (((1 << SENSE_BITS) - 1) << SENSE_SHIFTS[0], ((1 << SENSE_BITS) - 1) << SENSE_SHIFTS[1], ((1 << SENSE_BITS) - 1) << SENSE_SHIFTS[2])
+    TYPE_MASK = ((1 << TYPE_BITS) - 1) << TYPE_SHIFT
+
+    def __init__(self, types=(), senses=()):
+        self.types = []  # type id to relation type
+        self.type_ids = {}
+        self.sense_prefixes = [ [None]  for _ in range(self.SENSE_LEVELS) ]  # sense id at each level to sense prefix (0 for missing level)
+        self.sense_prefix_ids = [ {}  for _ in range(self.SENSE_LEVELS) ]
+        for rel_type in types:
+            self.type_id(rel_type)
+        for rel_sense in senses:
+            self.sense_ids(rel_sense)
+
+    @classmethod
+    def from_relations(cls, rel_types, rel_senses):
+        """Build codec with (sorted) relation types and senses by relation id."""
+
+        senses = set()
+        for rel_sense_all in rel_senses.values():
+            if isinstance(rel_sense_all, str):  # only first sense
+                rel_sense_all = (rel_sense_all,)
+            senses.update(rel_sense_all)
+        return cls(sorted(set(rel_types.values())), sorted(senses))
+
+    def type_id(self, rel_type):
+        """Get (or add) id of relation type."""
+
+        if rel_type not in self.type_ids:
+            if len(self.types) >= 1 << self.TYPE_BITS:
+                raise ValueError("Too many relation types for tag codec ({})!".format(rel_type))
+            self.type_ids[rel_type] = len(self.types)
+            self.types.append(rel_type)
+        return self.type_ids[rel_type]
+
+    def sense_ids(self, rel_sense):
+        """Get (or add) ids of relation sense at each level."""
+
+        levels = rel_sense.split(".")
+        if len(levels) > self.SENSE_LEVELS:
+            raise ValueError("Too many levels of relation sense for tag codec ({})!".format(rel_sense))
+        ids = []
+        for level in range(self.SENSE_LEVELS):
+            if level >= len(levels):
+                ids.append(0)
+                continue
+            prefix = ".".join(levels[:level + 1])
+            prefix_ids = self.sense_prefix_ids[level]
+            if prefix not in prefix_ids:
+                if len(self.sense_prefixes[level]) >= 1 << self.SENSE_BITS:
+                    raise ValueError("Too many relation senses for tag codec ({})!".format(rel_sense))
+                prefix_ids[prefix] = len(self.sense_prefixes[level])
+                self.sense_prefixes[level].append(prefix)
+            ids.append(prefix_ids[prefix])
+        return tuple(ids)
+
+    def encode(self, rel_type, rel_sense, rel_id, rel_part=None):
+        """Encode relation type, sense, id, and part (or `None` for part id 0) to packed integer tag."""
+
+        if not 0 <= rel_id < 1 << self.REL_ID_BITS:
+            raise ValueError("Relation id out of range for tag codec ({})!".format(rel_id))
+        code = self.type_id(rel_type) << self.TYPE_SHIFT
+        for sense_id, shift in zip(self.sense_ids(rel_sense), self.SENSE_SHIFTS):
+            code |= sense_id << shift
+        code |= rel_id << self.REL_ID_SHIFT
+        if rel_part is not None:
+            code |= RELATION_PARTS.index(rel_part)
+        return code
+
+    def decode(self, code):
+        """Decode packed integer tag to relation type, sense, id, and part."""
+
+        code = int(code)
+        rel_type = self.types[code >> self.TYPE_SHIFT]
+        rel_sense = None
+        for level, (mask, shift) in enumerate(zip(self.SENSE_MASKS, self.SENSE_SHIFTS)):
+            sense_id = (code & mask) >> shift
+            if sense_id:
+                rel_sense = self.sense_prefixes[level][sense_id]
+        rel_id = (code & self.REL_ID_MASK) >> self.REL_ID_SHIFT
+        rel_part = RELATION_PARTS[code & self.PART_MASK]
+        return rel_type, rel_sense, rel_id, rel_part
+
+    def to_tag(self, code):
+        """Materialize packed integer tag as string tag."""
+
+        return rtsip_to_tag(*self.decode(code))
+
+    def from_tag(self, tag):
+        """Encode string tag as packed integer tag."""
+
+        return self.encode(*tag_to_rtsip(tag))
+
+    def prefix_conditions(self, prefix):
+        """Convert string tag prefix to list of alternative conditions `(mask, value, rel_id_ranges)` on packed integer tags.
+
+        A tag matches a condition if `tag & mask == value` and its relation id is within any of `rel_id_ranges` (if not `None`).
+        """
+
+        pieces = prefix.split(":")
+        if len(pieces) > 4:
+            return []
+        complete, partial = pieces[:-1], pieces[-1]
+        mask = value = 0
+
+        # complete fields
+        if len(complete) > 0:
+            if complete[0] not in self.type_ids:
+                return []
+            mask |= self.TYPE_MASK
+            value |= self.type_ids[complete[0]] << self.TYPE_SHIFT
+        if len(complete) > 1:
+            levels = complete[1].split(".")
+            if len(levels) > self.SENSE_LEVELS:
+                return []
+            for level in range(self.SENSE_LEVELS):
+                sense_id = 0
+                if level < len(levels):
+                    sense_id = self.sense_prefix_ids[level].get(".".join(levels[:level + 1]))
+                    if sense_id is None:
+                        return []
+                mask |= self.SENSE_MASKS[level]
+                value |= sense_id << self.SENSE_SHIFTS[level]
+        if len(complete) > 2:
+            if not complete[2].isdigit() or str(int(complete[2])) != complete[2]:
+                return []
+            mask |= self.REL_ID_MASK
+            value |= int(complete[2]) << self.REL_ID_SHIFT
+
+        # alternatives of last partial field
+        if len(complete) == 0:
+            if not partial:
+                return [(0, 0, None)]
+            return [ (self.TYPE_MASK, type_id << self.TYPE_SHIFT, None)  for rel_type, type_id in sorted(self.type_ids.items()) if rel_type.startswith(partial) ]
+        if len(complete) == 1:
+            if not partial:
+                return [(mask, value, None)]
+            levels = partial.split(".")
+            level = len(levels) - 1
+            if level >= self.SENSE_LEVELS:
+                return []
+            if level > 0:  # complete levels of partial sense
+                sense_id = self.sense_prefix_ids[level - 1].get(".".join(levels[:level]))
+                if sense_id is None:
+                    return []
+                mask |= self.SENSE_MASKS[level - 1]
+                value |= sense_id << self.SENSE_SHIFTS[level - 1]
+            return [ (mask | self.SENSE_MASKS[level], value | (sense_id << self.SENSE_SHIFTS[level]), None)  for sense_prefix, sense_id in sorted(self.sense_prefix_ids[level].items()) if sense_prefix.startswith(partial) ]
+        if len(complete) == 2:
+            if not partial:
+                return [(mask, value, None)]
+            if not partial.isdigit():
+                return []
+            if partial.startswith("0"):
+                return [(mask, value, [(0, 1)])] if partial == "0" else []
+            # relation ids with given decimal prefix
+            ranges = []
+            lo, hi = int(partial), int(partial) + 1
+            while lo < 1 << self.REL_ID_BITS:
+                ranges.append((lo, min(hi, 1 << self.REL_ID_BITS)))
+                lo, hi = lo * 10, hi * 10
+            return [(mask, value, ranges)]
+        return [ (mask | self.PART_MASK, value | part_id, None)  for part_id, rel_part in enumerate(RELATION_PARTS) if rel_part.startswith(partial) ]
+
+    def match(self, codes, prefixes=None):
+        """Mask of packed integer tags matching any of specified string prefixes (vectorized for NumPy arrays)."""
+
+        conditions = None
+        if prefixes is not None:
+            conditions = [ c  for p in prefixes for c in self.prefix_conditions(p) ]
+
+        if np is not None and isinstance(codes, np.ndarray):
+            if conditions is None:
+                return np.ones(codes.shape, dtype=bool)
+            found = np.zeros(codes.shape, dtype=bool)
+            rel_ids = (codes & self.REL_ID_MASK) >> self.REL_ID_SHIFT
+            for mask, value, ranges in conditions:
+                m = (codes & mask) == value
+                if ranges is not None:
+                    in_ranges = np.zeros(codes.shape, dtype=bool)
+                    for lo, hi in ranges:
+                        in_ranges |= (rel_ids >= lo) & (rel_ids < hi)
+                    m &= in_ranges
+                found |= m
+            return found
+
+        if conditions is None:
+            return [ True  for _ in codes ]
+
+        def _match(code):
+            for mask, value, ranges in conditions:
+                if code & mask == value:
+                    if ranges is None:
+                        return True
+                    rel_id = (code & self.REL_ID_MASK) >> self.REL_ID_SHIFT
+                    if any(( lo <= rel_id < hi  for lo, hi in ranges )):
+                        return True
+            return False
+        return [ _match(code)  for code in codes ]
+
+    def encode_relations(self, rel_types, rel_senses):
+        """Packed integer tags (with part id 0) of all relation senses by relation id."""
+
+        rel_codes = {}
+        for rel_id, rel_type in rel_types.items():
+            if rel_id not in rel_senses:
+                continue  # skip missing relations
+            rel_sense_all = rel_senses[rel_id]
+            if isinstance(rel_sense_all, str):  # only first sense
+                rel_sense_all = (rel_sense_all,)
+            rel_codes[rel_id] = tuple( self.encode(rel_type, rel_sense, rel_id)  for rel_sense in rel_sense_all )
+        return rel_codes
+
+    def filter(self, codes, prefixes=None):
+        """Filter packed integer tags matching specified string prefixes (like `filter_tags()`)."""
+
+        if prefixes is None:
+            return codes
+        found = self.match(codes, prefixes)
+        if np is not None and isinstance(codes, np.ndarray):
+            return codes[found]
+        return tuple( code  for code, m in zip(codes, found) if m )
+
+
+def fill_token_lists(relations_gold, parses, char_indexes=None):
+    """Fill missing token lists of discourse relation parts from their character spans (for relation files with only `CharacterSpanList`).
+
+    Character offset indexes of documents (see `CharOffsetIndex`) are built on first use and stored in `char_indexes` (if given). Returns number of filled relation parts.
+    """
+    if char_indexes is None:
+        char_indexes = {}
+
+    filled = 0
+    for gold in relations_gold.values():
+        for part in RELATION_PARTS:
+            span = gold[part]
+            if span['TokenList'] or not span['CharacterSpanList']:
+                continue
+            doc_id = gold['DocID']
+            if doc_id not in char_indexes:
+                char_indexes[doc_id] = CharOffsetIndex(parses[doc_id])
+            index = char_indexes[doc_id]
+            span['TokenList'] = index.token_list(index.spans_to_tokens(span['CharacterSpanList']))
+            filled += 1
+    return filled
+
+
 def get_rel_parts(relations_gold):
     """Extract only discourse relation parts/spans of token ids by relation id from CoNLL16st corpus.
 
@@ -102,6 +377,122 @@ def get_rel_parts(relations_gold):
     return rel_parts
 
 
+class RelationIndex(object):
+    """Index of discourse relations of one document by token ids and token spans.
+
+    Contains an inverted index of token id to relation ids and parts, and a static interval tree over relation spans `[TokenMin, TokenMax]` (sorted by start, with maximal end of each implicit subtree) for logarithmic queries.
+
+        index.by_token(894) = ((14904, 'Arg2'), (14905, 'Arg2'))
+        index.overlapping(890, 900) = [14904, 14905]
+    """
+
+    def __init__(self, rel_parts, sentence_offsets=None):
+        self.rel_parts = rel_parts
+        self.sentence_offsets = sentence_offsets  # first token id of each sentence
+
+        # inverted index of token ids
+        self.token_rels = {}
+        for rel_id in sorted(rel_parts):
+            for part in RELATION_PARTS:
+                for token_id in rel_parts[rel_id][part]:
+                    self.token_rels.setdefault(token_id, []).append((rel_id, part))
+        for token_id in self.token_rels:
+            self.token_rels[token_id] = tuple(self.token_rels[token_id])
+
+        # interval tree over relation spans
+        spans = sorted( (rel['TokenMin'], rel['TokenMax'], rel_id)  for rel_id, rel in rel_parts.items() )
+        self.starts = [ s[0]  for s in spans ]
+        self.ends = [ s[1]  for s in spans ]
+        self.rel_ids = [ s[2]  for s in spans ]
+        self.max_ends = list(self.ends)
+
+        def _build(lo, hi):
+            if lo >= hi:
+                return -1
+            mid = (lo + hi) // 2
+            self.max_ends[mid] = max(self.ends[mid], _build(lo, mid), _build(mid + 1, hi))
+            return self.max_ends[mid]
+        _build(0, len(spans))
+
+    def by_token(self, token_id):
+        """Relation ids and parts containing given token id."""
+
+        return self.token_rels.get(token_id, ())
+
+    def overlapping(self, token_begin, token_end):
+        """Relation ids with spans overlapping token ids `token_begin..token_end` (inclusive, sorted by span start)."""
+
+        found = []
+
+        def _query(lo, hi):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            if self.max_ends[mid] < token_begin:  # whole subtree ends before
+                return
+            _query(lo, mid)
+            if self.starts[mid] > token_end:  # right subtree starts after
+                return
+            if self.ends[mid] >= token_begin:
+                found.append(self.rel_ids[mid])
+            _query(mid + 1, hi)
+        _query(0, len(self.starts))
+        return found
+
+    def within(self, token_begin, token_end):
+        """Relation ids with spans completely within token ids `token_begin..token_end` (inclusive, sorted by span start)."""
+
+        lo = bisect_left(self.starts, token_begin)
+        hi = bisect_right(self.starts, token_end)
+        return [ self.rel_ids[i]  for i in range(lo, hi) if self.ends[i] <= token_end ]
+
+    def in_sentence(self, sentence_id, partial=False):
+        """Relation ids with spans completely within (or `partial` overlapping) given sentence."""
+
+        if self.sentence_offsets is None:
+            raise ValueError("Missing sentence offsets in relation index!")
+        token_begin = self.sentence_offsets[sentence_id]
+        if sentence_id + 1 < len(self.sentence_offsets):
+            token_end = self.sentence_offsets[sentence_id + 1] - 1
+        else:
+            token_end = max(self.max_ends[len(self.max_ends) // 2], token_begin) if self.max_ends else token_begin  # maximal end at root
+        if partial:
+            return self.overlapping(token_begin, token_end)
+        return self.within(token_begin, token_end)
+
+    def adjacent(self, rel_id):
+        """Other relation ids with spans overlapping or directly touching span of given relation."""
+
+        rel = self.rel_parts[rel_id]
+        return [ r  for r in self.overlapping(rel['TokenMin'] - 1, rel['TokenMax'] + 1) if r != rel_id ]
+
+
+def get_rel_indexes(rel_parts, word_metas=None):
+    """Build indexes of discourse relations by document id (optionally with sentence offsets from word metadata).
+
+        rel_indexes["wsj_1000"].overlapping(890, 900) = [14904, 14905]
+    """
+
+    doc_rel_parts = {}
+    for rel_id, rel in rel_parts.items():
+        doc_rel_parts.setdefault(rel['DocID'], {})[rel_id] = rel
+    if word_metas is not None:
+        for doc_id in word_metas:
+            doc_rel_parts.setdefault(doc_id, {})
+
+    rel_indexes = {}
+    for doc_id in doc_rel_parts:
+        sentence_offsets = None
+        if word_metas is not None and doc_id in word_metas:
+            metas = word_metas[doc_id]
+            if isinstance(metas, WordMetas):
+                sentence_offsets = sorted(set(metas.sentence_offsets))
+            else:
+                sentence_offsets = sorted(set( m['SentenceOffset']  for m in metas ))
+        rel_indexes[doc_id] = RelationIndex(doc_rel_parts[doc_id], sentence_offsets=sentence_offsets)
+    return rel_indexes
+
+
 def get_rel_types(relations_gold, filter_types=None):
     """Extract discourse relation types by relation id from CoNLL16st corpus.
 
@@ -150,31 +541,80 @@ def get_rel_senses_all(relations_gold, level=None, filter_senses=None):
     return rel_senses_all
 
 
-def add_relation_tags(word_metas, rel_types, rel_senses):
-    """Add discourse relation tags to metadata of words/tokens.
+def get_relation_tags(rel_ids, rel_parts, rel_types, rel_senses):
+    """Get discourse relation tags of one word/token from its relation ids and parts."""
+
+    tags = []
+    for rel_id, rel_part in zip(rel_ids, rel_parts):
+        if rel_id not in rel_types or rel_id not in rel_senses:
+            continue  # skip missing relations
+
+        rel_type = rel_types[rel_id]
+        rel_sense_all = rel_senses[rel_id]
+        if isinstance(rel_sense_all, str):  # only first sense
+            rel_sense_all = (rel_sense_all,)
+        for rel_sense in rel_sense_all:
+            tags.append(rtsip_to_tag(rel_type, rel_sense, rel_id, rel_part))
+    return tuple(tags)
+
+
+_part_ids = dict( (rel_part, part_id)  for part_id, rel_part in enumerate(RELATION_PARTS) )
+
+
+def get_relation_tag_codes(rel_ids, rel_parts, rel_codes):
+    """Get packed integer discourse relation tags of one word/token from its relation ids and parts (with `rel_codes` from `TagCodec.encode_relations()`)."""
+
+    codes = []
+    for rel_id, rel_part in zip(rel_ids, rel_parts):
+        if rel_id not in rel_codes:
+            continue  # skip missing relations
+
+        part_id = _part_ids[rel_part]
+        for code in rel_codes[rel_id]:
+            codes.append(code | part_id)
+    return tuple(codes)
+
+
+def _relation_tag_codes_columnar(metas, rel_codes):
+    """Iterate over packed integer discourse relation tags of all words/tokens in columnar `WordMetas` (directly from its arrays)."""
+
+    rel_offsets, rel_ids, rel_parts = metas.rel_offsets, metas.rel_ids, metas.rel_parts
+    for i in range(len(metas)):
+        codes = []
+        for j in range(rel_offsets[i], rel_offsets[i + 1]):
+            for code in rel_codes.get(rel_ids[j], ()):
+                codes.append(code | rel_parts[j])
+        yield codes
+
+
+def add_relation_tags(word_metas, rel_types, rel_senses, codec=None):
+    """Add discourse relation tags to metadata of words/tokens (as dicts or columnar `WordMetas`, optionally as packed integer tags of `codec`).
 
         word_metas['wsj_1000'][0] = {
             ...
             'RelationTags': ("Explicit:Expansion.Conjunction:14890:Arg1",),
         }
     """
+    rel_codes = None
+    if codec is not None:
+        rel_codes = codec.encode_relations(rel_types, rel_senses)
 
     for doc_id in word_metas:
-        for meta in word_metas[doc_id]:
-            tags = []
-            for rel_id, rel_part in zip(meta['RelationIDs'], meta['RelationParts']):
-                if rel_id not in rel_types or rel_id not in rel_senses:
-                    continue  # skip missing relations
-
-                rel_type = rel_types[rel_id]
-                rel_sense_all = rel_senses[rel_id]
-                if isinstance(rel_sense_all, str):  # only first sense
-                    rel_sense_all = (rel_sense_all,)
-                for rel_sense in rel_sense_all:
-                    tags.append(rtsip_to_tag(rel_type, rel_sense, rel_id, rel_part))
+        metas = word_metas[doc_id]
+        if isinstance(metas, WordMetas):
+            # save to columnar metadata
+            if rel_codes is not None:
+                metas.set_relation_tags(_relation_tag_codes_columnar(metas, rel_codes), packed=True)
+            else:
+                metas.set_relation_tags( get_relation_tags(metas.relation_ids(i), metas.relation_parts(i), rel_types, rel_senses)  for i in range(len(metas)) )
+            continue
 
+        for meta in metas:
             # save to metadata
-            meta['RelationTags'] = tuple(tags)
+            if rel_codes is not None:
+                meta['RelationTags'] = get_relation_tag_codes(meta['RelationIDs'], meta['RelationParts'], rel_codes)
+            else:
+                meta['RelationTags'] = get_relation_tags(meta['RelationIDs'], meta['RelationParts'], rel_types, rel_senses)
 
 
 ### Tests
@@ -268,6 +708,107 @@ def test_relation_tags():
     assert word_metas[doc_id][t_meta1_id]['RelationTags'] == t_meta1_tags
     assert word_metas[doc_id][t_meta2_id]['RelationTags'] == t_meta2_tags
 
+def test_relation_tags_columnar():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+
+    parses = load_parses(dataset_dir)
+    raws = load_raws(dataset_dir, [doc_id])
+    relations_gold = load_relations_gold(dataset_dir)
+    rel_types = get_rel_types(relations_gold)
+    rel_senses = get_rel_senses_all(relations_gold)
+    word_metas = get_word_metas(parses, raws)
+    add_relation_tags(word_metas, rel_types, rel_senses)
+    word_metas_columnar = get_word_metas(parses, raws, columnar=True)
+    add_relation_tags(word_metas_columnar, rel_types, rel_senses)
+    assert word_metas_columnar[doc_id] == word_metas[doc_id]
+
+def test_rel_indexes():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+    t_token_rels = ((14904, 'Arg2'), (14905, 'Arg2'))
+
+    parses = load_parses(dataset_dir)
+    raws = load_raws(dataset_dir, [doc_id])
+    word_metas = get_word_metas(parses, raws)
+    relations_gold = load_relations_gold(dataset_dir)
+    rel_parts = get_rel_parts(relations_gold)
+    rel_indexes = get_rel_indexes(rel_parts, word_metas)
+    index = rel_indexes[doc_id]
+
+    assert index.by_token(894) == t_token_rels
+    assert index.by_token(895) == ()
+    for meta in word_metas[doc_id]:
+        assert tuple(sorted(index.by_token(meta['TokenID']))) == tuple(sorted(zip(meta['RelationIDs'], meta['RelationParts'])))
+
+    def _brute(fn):
+        return sorted( rel_id  for rel_id, rel in rel_parts.items() if fn(rel) )
+
+    for b, e in [(0, 0), (0, 895), (100, 120), (877, 877), (500, 400), (890, 2000)]:
+        assert sorted(index.overlapping(b, e)) == _brute(lambda rel: rel['TokenMin'] <= e and rel['TokenMax'] >= b), (b, e)
+        assert sorted(index.within(b, e)) == _brute(lambda rel: rel['TokenMin'] >= b and rel['TokenMax'] <= e), (b, e)
+    assert sorted(index.in_sentence(32)) == _brute(lambda rel: rel['TokenMin'] >= 877)
+    assert sorted(index.in_sentence(0, partial=True)) == _brute(lambda rel: rel['TokenMin'] <= 29)
+    for rel_id, rel in rel_parts.items():
+        t_adjacent = _brute(lambda r: r['ID'] != rel_id and r['TokenMin'] <= rel['TokenMax'] + 1 and r['TokenMax'] >= rel['TokenMin'] - 1)
+        assert sorted(index.adjacent(rel_id)) == t_adjacent
+
+def test_fill_token_lists():
+    import copy
+    dataset_dir = "./conll16st-en-trial"
+
+    parses = load_parses(dataset_dir)
+    relations_gold = load_relations_gold(dataset_dir)
+    relations_spans = copy.deepcopy(relations_gold)
+    for gold in relations_spans.values():
+        for part in RELATION_PARTS:
+            gold[part]['TokenList'] = []
+    filled = fill_token_lists(relations_spans, parses)
+    assert filled == sum( 1  for gold in relations_gold.values() for part in RELATION_PARTS if gold[part]['TokenList'] )
+    assert relations_spans == relations_gold
+    assert get_rel_parts(relations_spans) == get_rel_parts(relations_gold)
+    assert fill_token_lists(relations_spans, parses) == 0
+
+
+def test_tag_codec():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+
+    parses = load_parses(dataset_dir)
+    raws = load_raws(dataset_dir, [doc_id])
+    relations_gold = load_relations_gold(dataset_dir)
+    rel_types = get_rel_types(relations_gold)
+    rel_senses = get_rel_senses_all(relations_gold)
+    codec = TagCodec.from_relations(rel_types, rel_senses)
+    word_metas = get_word_metas(parses, raws)
+    add_relation_tags(word_metas, rel_types, rel_senses)
+    word_metas_packed = get_word_metas(parses, raws)
+    add_relation_tags(word_metas_packed, rel_types, rel_senses, codec=codec)
+    word_metas_columnar = get_word_metas(parses, raws, columnar=True)
+    add_relation_tags(word_metas_columnar, rel_types, rel_senses, codec=codec)
+
+    tags = [ t  for m in word_metas[doc_id] for t in m['RelationTags'] ]
+    codes = [ c  for m in word_metas_packed[doc_id] for c in m['RelationTags'] ]
+    assert list(word_metas_columnar[doc_id].tags) == codes
+    assert [ codec.to_tag(c)  for c in codes ] == tags
+    assert [ codec.from_tag(t)  for t in tags ] == codes
+    assert codec.decode(codec.from_tag("Explicit:Contingency.Condition:14905:Arg2")) == ("Explicit", "Contingency.Condition", 14905, "Arg2")
+
+    # filtering by any prefix is same as for string tags
+    prefixes = set( t[:i]  for t in tags for i in range(len(t) + 1) )
+    prefixes.update(["Implicit:", "Explicit:Contingency.Cause", "Explicit:Contingency:", "Explicit:Expansion.Conjunction:0", "Explicit:Expansion.Conjunction:14890:Arg1:"])
+    for prefix in sorted(prefixes):
+        assert [ codec.to_tag(c)  for c in codec.filter(codes, [prefix]) ] == list(filter_tags(tags, [prefix])), prefix
+    assert codec.filter(codes, None) == codes
+    assert [ codec.to_tag(c)  for c in codec.filter(codes, ["Explicit:Comparison", "Explicit:Expansion.Conjunction:14890"]) ] == list(filter_tags(tags, ["Explicit:Comparison", "Explicit:Expansion.Conjunction:14890"]))
+
+    if np is not None:  # vectorized
+        codes_np = np.frombuffer(word_metas_columnar[doc_id].tags, dtype='int64')
+        for prefix in sorted(prefixes):
+            assert [ codec.to_tag(c)  for c in codec.filter(codes_np, [prefix]) ] == list(filter_tags(tags, [prefix])), prefix
+        assert codec.match(codes_np).all()
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['-s', __file__])
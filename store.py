@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Memory-mapped on-disk format of loaded CoNLL16st/CoNLL15st datasets.
+
+Dataset is exported as flat arrays with offset tables into a single binary file (`data.bin`) described by `index.json`. Readers `mmap` it and expose the same dict-style API without copying, so multiple worker processes share one page-cache copy (Python 3 only).
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+import codecs
+import json
+import mmap
+import os
+import sys
+from array import array
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+
+from .dependencies import DependencyGraph
+from .lazy import LazyDict
+from .instrument import Instrument
+from .load import Conll16stDataset
+from .parsetrees import parse_parsetree
+from .relations import get_relation_tags
+from .vocab import Vocab
+from .words import RELATION_PARTS, WordMetas
+
+
+STORE_VERSION = 1  # increase on incompatible changes of format
+STORE_INDEX = "index.json"
+STORE_DATA = "data.bin"
+
+
+def _dump_parsetree(tree):
+    """Dump parse tree of token ids back to bracketed string (parsable by `parse_parsetree()`)."""
+
+    if len(tree) == 2 and not isinstance(tree[0], tuple) and isinstance(tree[1], int):  # leaf with token id
+        return u"({} {})".format(tree[0], tree[1])
+    return u"({})".format(u" ".join( t if not isinstance(t, tuple) else _dump_parsetree(t)  for t in tree ))
+
+
+def save_store(dataset, store_dir):
+    """Export loaded CoNLL16st dataset to memory-mappable format in `store_dir`."""
+
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    index = {
+        'version': STORE_VERSION,
+        'byteorder': sys.byteorder,
+        'lang': dataset['lang'],
+        'doc_ids': list(dataset['doc_ids']),
+        'arrays': {},
+    }
+    a = dict( (name, array(typecode))  for name, typecode in [
+        ('doc_token_starts', 'q'), ('words_offsets', 'q'), ('pos_ids', 'i'),
+        ('metas_paragraph_ids', 'i'), ('metas_sentence_ids', 'i'), ('metas_sentence_offsets', 'i'), ('metas_sentence_offset_ends', 'i'), ('metas_token_ids', 'i'),
+        ('metas_rel_offsets', 'i'), ('metas_rel_ids', 'i'), ('metas_rel_parts', 'b'), ('doc_metas_rel_starts', 'q'),
+        ('dep_gov_offsets', 'i'), ('dep_gov_deps', 'i'), ('dep_gov_labels', 'i'), ('dep_dep_offsets', 'i'), ('dep_dep_govs', 'i'), ('dep_dep_labels', 'i'), ('doc_dep_edge_starts', 'q'),
+        ('trees_offsets', 'q'), ('trees_token_starts', 'i'), ('doc_sentence_starts', 'q'),
+        ('rel_ids', 'i'), ('rel_token_min', 'i'), ('rel_token_max', 'i'), ('rel_token_count', 'i'),
+        ('gold_rel_ids', 'i'), ('gold_offsets', 'q'),
+    ] )
+    for part in RELATION_PARTS:
+        a['rel_{}_offsets'.format(part)] = array('q', [0])
+        a['rel_{}_tokens'.format(part)] = array('i')
+        a['rel_{}_lens'.format(part)] = array('i')
+    words_blob = []
+    trees_blob = []
+    gold_blob = []
+    m = {'words_len': 0, 'trees_len': 0, 'gold_len': 0}
+    pos_vocab = Vocab(unknown=None)
+    dep_labels = Vocab(unknown=None)
+
+    # data by document id
+    a['doc_token_starts'].append(0)
+    a['words_offsets'].append(0)
+    a['doc_metas_rel_starts'].append(0)
+    a['doc_dep_edge_starts'].append(0)
+    a['trees_offsets'].append(0)
+    a['doc_sentence_starts'].append(0)
+    for doc_id in dataset['doc_ids']:
+        words = dataset['words'][doc_id]
+        a['doc_token_starts'].append(a['doc_token_starts'][-1] + len(words))
+
+        # words and POS tags
+        for word in words:
+            b = word.encode('utf8')
+            words_blob.append(b)
+            m['words_len'] += len(b)
+            a['words_offsets'].append(m['words_len'])
+        a['pos_ids'].extend( pos_vocab.encode(s)  for s in dataset['pos_tags'][doc_id] )
+
+        # word metadata
+        metas = dataset['word_metas'][doc_id]
+        if not isinstance(metas, WordMetas):
+            columnar = WordMetas(doc_id)
+            for meta in metas:
+                columnar.append(meta['Text'], meta['ParagraphID'], meta['SentenceID'], meta['SentenceOffset'], meta['SentenceOffsetEnd'], meta['TokenID'], meta['RelationIDs'], meta['RelationParts'])
+            metas = columnar
+        a['metas_paragraph_ids'].extend(metas.paragraph_ids)
+        a['metas_sentence_ids'].extend(metas.sentence_ids)
+        a['metas_sentence_offsets'].extend(metas.sentence_offsets)
+        a['metas_sentence_offset_ends'].extend(metas.sentence_offset_ends)
+        a['metas_token_ids'].extend(metas.token_ids)
+        a['metas_rel_offsets'].extend(metas.rel_offsets)
+        a['metas_rel_ids'].extend(metas.rel_ids)
+        a['metas_rel_parts'].extend(metas.rel_parts)
+        a['doc_metas_rel_starts'].append(len(a['metas_rel_ids']))
+
+        # dependencies
+        graph = dataset['dependencies'][doc_id]
+        if not isinstance(graph, DependencyGraph):
+            edges = [ (gov, dep, label)  for gov in graph for dep, label in graph[gov].items() ]
+            graph = DependencyGraph.from_edges(len(words), edges, dep_labels)
+        label_map = [ dep_labels.encode(label)  for label in graph.labels.id_to_str ]
+        a['dep_gov_offsets'].extend(graph.gov_offsets)
+        a['dep_gov_deps'].extend(graph.gov_deps)
+        a['dep_gov_labels'].extend( label_map[i]  for i in graph.gov_labels )
+        a['dep_dep_offsets'].extend(graph.dep_offsets)
+        a['dep_dep_govs'].extend(graph.dep_govs)
+        a['dep_dep_labels'].extend( label_map[i]  for i in graph.dep_labels )
+        a['doc_dep_edge_starts'].append(len(a['dep_gov_deps']))
+
+        # parse trees
+        tree_token_id = 0
+        for tree in dataset['parsetrees'][doc_id]:
+            b = _dump_parsetree(tree).encode('utf8')
+            trees_blob.append(b)
+            m['trees_len'] += len(b)
+            a['trees_offsets'].append(m['trees_len'])
+            a['trees_token_starts'].append(tree_token_id)
+            _, tree_token_id = parse_parsetree(b.decode('utf8'), tree_token_id)
+        a['doc_sentence_starts'].append(len(a['trees_token_starts']))
+
+    # data by relation id
+    doc_idx = dict( (doc_id, i)  for i, doc_id in enumerate(dataset['doc_ids']) )
+    punct_types = []
+    rel_docs = []
+    for rel_id in sorted(dataset['rel_parts']):
+        rel = dataset['rel_parts'][rel_id]
+        a['rel_ids'].append(rel_id)
+        rel_docs.append(doc_idx[rel['DocID']])
+        for part in RELATION_PARTS:
+            a['rel_{}_tokens'.format(part)].extend(rel[part])
+            a['rel_{}_offsets'.format(part)].append(len(a['rel_{}_tokens'.format(part)]))
+            a['rel_{}_lens'.format(part)].append(rel['{}Len'.format(part)])
+        punct_types.append(rel['PunctuationType'])
+        a['rel_token_min'].append(rel['TokenMin'])
+        a['rel_token_max'].append(rel['TokenMax'])
+        a['rel_token_count'].append(rel['TokenCount'])
+    a['rel_docs'] = array('i', rel_docs)
+    a['gold_offsets'].append(0)
+    for rel_id in sorted(dataset['relations_gold']):
+        b = json.dumps(dataset['relations_gold'][rel_id], sort_keys=True).encode('utf8')
+        gold_blob.append(b)
+        m['gold_len'] += len(b)
+        a['gold_rel_ids'].append(rel_id)
+        a['gold_offsets'].append(m['gold_len'])
+
+    index['pos_tags'] = pos_vocab.id_to_str
+    index['dep_labels'] = dep_labels.id_to_str
+    index['punct_types'] = punct_types
+    index['rel_types'] = sorted(dataset['rel_types'].items())
+    index['rel_senses'] = sorted(dataset['rel_senses'].items())
+
+    # write flat arrays aligned to 8 bytes
+    with open(os.path.join(store_dir, STORE_DATA), 'wb') as f:
+        pos = 0
+        blobs = [('words_blob', words_blob), ('trees_blob', trees_blob), ('gold_blob', gold_blob)]
+        for name, data in sorted(a.items()) + blobs:
+            f.write(b"\0" * (-pos % 8))
+            pos += -pos % 8
+            if isinstance(data, array):
+                b = data.tobytes()
+                index['arrays'][name] = [pos, data.typecode, len(data)]
+            else:
+                b = b"".join(data)
+                index['arrays'][name] = [pos, 'B', len(b)]
+            f.write(b)
+            pos += len(b)
+    with codecs.open(os.path.join(store_dir, STORE_INDEX), 'w', encoding='utf8') as f:
+        json.dump(index, f, ensure_ascii=False)
+
+
+class _SeqView(Sequence):
+    """Read-only sequence view with items computed by `fn(i)`."""
+
+    def __init__(self, length, fn):
+        self.length = length
+        self.fn = fn
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self.fn(j)  for j in range(*i.indices(self.length)) ]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        return self.fn(i)
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+
+class MappedConll16stDataset(Conll16stDataset):
+    """CoNLL16st dataset holder as dict with data memory-mapped from format written by `save_store()`.
+
+    Data by document id and relation id are read-only dicts built on access over shared memory-mapped arrays (`word_metas` are columnar `WordMetas` and `dependencies` compact `DependencyGraph`).
+    """
+
+    def __init__(self, store_dir, cache_size=None):
+        self.dataset_dir = store_dir
+        self.filter_types = None
+        self.filter_senses = None
+        self.filter_fn = None
+        self.instrument = Instrument()
+
+        with codecs.open(os.path.join(store_dir, STORE_INDEX), 'r', encoding='utf8') as f:
+            index = json.load(f)
+        if index['version'] != STORE_VERSION or index['byteorder'] != sys.byteorder:
+            raise IOError("Incompatible memory-mapped dataset ({})!".format(store_dir))
+        with open(os.path.join(store_dir, STORE_DATA), 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._mmap = b""
+        buf = memoryview(self._mmap)
+
+        a = {}
+        for name, (offset, typecode, count) in index['arrays'].items():
+            itemsize = array(typecode).itemsize
+            a[name] = buf[offset:offset + count * itemsize].cast(typecode)
+        pos_tags_list = index['pos_tags']
+        dep_labels = Vocab(index['dep_labels'], unknown=None)
+        rel_types = dict( (int(k), v)  for k, v in index['rel_types'] )
+        rel_senses = dict( (int(k), v if isinstance(v, str) else tuple(v))  for k, v in index['rel_senses'] )
+        doc_ids = index['doc_ids']
+        doc_idx = dict( (doc_id, i)  for i, doc_id in enumerate(doc_ids) )
+
+        def _words(doc_id):
+            b = a['doc_token_starts'][doc_idx[doc_id]]
+            e = a['doc_token_starts'][doc_idx[doc_id] + 1]
+            return _SeqView(e - b, lambda i: a['words_blob'][a['words_offsets'][b + i]:a['words_offsets'][b + i + 1]].tobytes().decode('utf8'))
+
+        def _pos_tags(doc_id):
+            b = a['doc_token_starts'][doc_idx[doc_id]]
+            e = a['doc_token_starts'][doc_idx[doc_id] + 1]
+            return _SeqView(e - b, lambda i: pos_tags_list[a['pos_ids'][b + i]])
+
+        def _word_metas(doc_id):
+            d = doc_idx[doc_id]
+            b = a['doc_token_starts'][d]
+            e = a['doc_token_starts'][d + 1]
+            rb = a['doc_metas_rel_starts'][d]
+            re_ = a['doc_metas_rel_starts'][d + 1]
+            metas = WordMetas.from_columns(doc_id, _words(doc_id), a['metas_paragraph_ids'][b:e], a['metas_sentence_ids'][b:e], a['metas_sentence_offsets'][b:e], a['metas_sentence_offset_ends'][b:e], a['metas_token_ids'][b:e], a['metas_rel_offsets'][b + d:e + d + 1], a['metas_rel_ids'][rb:re_], a['metas_rel_parts'][rb:re_])
+            metas.set_relation_tags( get_relation_tags(metas.relation_ids(i), metas.relation_parts(i), rel_types, rel_senses)  for i in range(len(metas)) )
+            return metas
+
+        def _dependencies(doc_id):
+            d = doc_idx[doc_id]
+            b = a['doc_token_starts'][d] + 2 * d
+            e = a['doc_token_starts'][d + 1] + 2 * (d + 1)
+            eb = a['doc_dep_edge_starts'][d]
+            ee = a['doc_dep_edge_starts'][d + 1]
+            return DependencyGraph(a['dep_gov_offsets'][b:e], a['dep_gov_deps'][eb:ee], a['dep_gov_labels'][eb:ee], a['dep_dep_offsets'][b:e], a['dep_dep_govs'][eb:ee], a['dep_dep_labels'][eb:ee], dep_labels)
+
+        def _parsetrees(doc_id):
+            d = doc_idx[doc_id]
+            parsetrees = []
+            for s in range(a['doc_sentence_starts'][d], a['doc_sentence_starts'][d + 1]):
+                tree_str = a['trees_blob'][a['trees_offsets'][s]:a['trees_offsets'][s + 1]].tobytes().decode('utf8')
+                parsetrees.append(parse_parsetree(tree_str, a['trees_token_starts'][s])[0])
+            return parsetrees
+
+        rel_ids = list(a['rel_ids'])
+        rel_idx = dict( (rel_id, i)  for i, rel_id in enumerate(rel_ids) )
+
+        def _rel_parts(rel_id):
+            i = rel_idx[rel_id]
+            rel = {
+                'PunctuationType': index['punct_types'][i],
+                'DocID': doc_ids[a['rel_docs'][i]],
+                'ID': rel_id,
+                'TokenMin': a['rel_token_min'][i],
+                'TokenMax': a['rel_token_max'][i],
+                'TokenCount': a['rel_token_count'][i],
+            }
+            for part in RELATION_PARTS:
+                offsets = a['rel_{}_offsets'.format(part)]
+                rel[part] = tuple(a['rel_{}_tokens'.format(part)][offsets[i]:offsets[i + 1]])
+                rel['{}Len'.format(part)] = a['rel_{}_lens'.format(part)][i]
+            return rel
+
+        gold_idx = dict( (rel_id, i)  for i, rel_id in enumerate(a['gold_rel_ids']) )
+
+        def _relations_gold(rel_id):
+            i = gold_idx[rel_id]
+            return json.loads(a['gold_blob'][a['gold_offsets'][i]:a['gold_offsets'][i + 1]].tobytes().decode('utf8'))
+
+        self['lang'] = index['lang']
+        self['doc_ids'] = doc_ids
+        self['words'] = LazyDict(doc_ids, _words, maxsize=cache_size)
+        self['word_metas'] = LazyDict(doc_ids, _word_metas, maxsize=cache_size)
+        self['pos_tags'] = LazyDict(doc_ids, _pos_tags, maxsize=cache_size)
+        self['dependencies'] = LazyDict(doc_ids, _dependencies, maxsize=cache_size)
+        self['parsetrees'] = LazyDict(doc_ids, _parsetrees, maxsize=cache_size)
+        self['rel_ids'] = rel_ids
+        self['rel_parts'] = LazyDict(rel_ids, _rel_parts, maxsize=cache_size)
+        self['rel_types'] = rel_types
+        self['rel_senses'] = rel_senses
+        self['relations_gold'] = LazyDict(sorted(gold_idx), _relations_gold, maxsize=cache_size)
+
+
+### Tests
+
+def test_store():
+    import shutil
+    import tempfile
+
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for columnar in [False, True]:
+            dataset = Conll16stDataset(dataset_dir, lang='en', with_rel_senses_all=columnar, columnar=columnar)
+            save_store(dataset, tmp_dir)
+            mapped = MappedConll16stDataset(tmp_dir)
+
+            assert mapped['lang'] == 'en'
+            for k in ['doc_ids', 'words', 'word_metas', 'pos_tags', 'dependencies', 'parsetrees', 'rel_ids', 'rel_parts', 'rel_types', 'rel_senses', 'relations_gold']:
+                assert mapped[k] == dataset[k], k
+            assert mapped['words'][t_doc_id][-3:] == ["more", "important", "."]
+            assert mapped['word_metas'][t_doc_id][0]['RelationTags'] == dataset['word_metas'][t_doc_id][0]['RelationTags']
+            assert mapped['dependencies'][t_doc_id].label(3, 0) == "nn"
+            assert mapped.summary() == dataset.summary()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
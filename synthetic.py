@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Generate synthetic CoNLL16st datasets in English or Chinese style at configurable scale (eg. for benchmarks).
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+import codecs
+import json
+import os
+import random
+from bisect import bisect_right
+
+from six import unichr
+
+
+# scale of CoNLL16st training datasets (documents, sentences per document, words per sentence, relations per sentence)
+SCALES = {
+    'trial': {'docs': 1, 'sentences': 37, 'words': 24, 'rels': 0.8},
+    'en-train': {'docs': 1756, 'sentences': 25, 'words': 24, 'rels': 0.75},
+    'zh-train': {'docs': 455, 'sentences': 15, 'words': 28, 'rels': 0.7},
+}
+
+EN_TYPES = [('Explicit', 0.45), ('Implicit', 0.4), ('EntRel', 0.13), ('AltLex', 0.02)]
+EN_SENSES = [
+    'Temporal.Asynchronous.Precedence',
+    'Temporal.Asynchronous.Succession',
+    'Temporal.Synchrony',
+    'Contingency.Cause.Reason',
+    'Contingency.Cause.Result',
+    'Contingency.Condition',
+    'Comparison.Contrast',
+    'Comparison.Concession',
+    'Expansion.Conjunction',
+    'Expansion.Instantiation',
+    'Expansion.Restatement',
+    'Expansion.Alternative',
+    'Expansion.Alternative.Chosen alternative',
+    'Expansion.Exception',
+]
+ZH_TYPES = [('Explicit', 0.22), ('Implicit', 0.7), ('EntRel', 0.06), ('AltLex', 0.02)]
+ZH_SENSES = [
+    'Alternative',
+    'Causation',
+    'Conditional',
+    'Conjunction',
+    'Contrast',
+    'Expansion',
+    'Progression',
+    'Purpose',
+    'Temporal',
+]
+
+_en_syllables = ["ka", "re", "mo", "tin", "ser", "vi", "pro", "gram", "tra", "ding", "mar", "ket", "in", "ex", "com", "de", "al", "on", "st", "er"]
+_en_pos_tags = ["NN", "NN", "NN", "NNP", "NNS", "DT", "IN", "IN", "JJ", "VB", "VBD", "VBZ", "VBG", "RB", "PRP", "CC", "CD", "TO", "MD"]
+_zh_pos_tags = ["NN", "NN", "NN", "NR", "VV", "VV", "AD", "P", "DEC", "DEG", "CD", "M", "JJ", "PN", "CC", "VA", "LC", "NT"]
+_dep_labels = ["nsubj", "dobj", "nn", "amod", "det", "prep", "pobj", "advmod", "aux", "conj", "cc", "poss", "num"]
+
+
+def _make_vocab(rng, size, lang):
+    """Make vocabulary of unique words with POS tags (in Zipf order)."""
+
+    vocab = []
+    seen = set()
+    while len(vocab) < size:
+        if lang == 'zh':
+            word = u"".join( unichr(rng.randint(0x4e00, 0x4fff))  for _ in range(rng.randint(1, 3)) )
+            pos_tag = rng.choice(_zh_pos_tags)
+        else:
+            word = u"".join( rng.choice(_en_syllables)  for _ in range(rng.randint(1, 4)) )
+            pos_tag = rng.choice(_en_pos_tags)
+            if pos_tag == "NNP":
+                word = word.capitalize()
+        if word not in seen:
+            seen.add(word)
+            vocab.append((word, pos_tag))
+    return vocab
+
+
+def _weighted_choice(rng, cum_weights):
+    return bisect_right(cum_weights, rng.random() * cum_weights[-1])
+
+
+def _cum_weights(weights):
+    cum = []
+    total = 0.
+    for w in weights:
+        total += w
+        cum.append(total)
+    return cum
+
+
+def _make_parsetree(words, pos_tags, rng, lang):
+    """Make flat bracketed parse tree with phrases of 1-4 words."""
+
+    leaves = [ u"({} {})".format(pos_tag, word)  for word, pos_tag in zip(words, pos_tags) ]
+    phrases = []
+    i = 0
+    while i < len(leaves):
+        n = rng.randint(1, 4)
+        phrases.append(u"({} {})".format(rng.choice(["NP", "VP", "PP"] if lang != 'zh' else ["NP", "VP", "IP"]), u" ".join(leaves[i:i + n])))
+        i += n
+    return u"( ({} {}) )".format("S" if lang != 'zh' else "IP", u" ".join(phrases))
+
+
+def _make_document(doc_id, rng, vocab, vocab_cum, scale, lang):
+    """Make parse and raw text of one document (sentences with words, offsets, dependencies and parse trees)."""
+
+    sep = u"" if lang == 'zh' else u" "
+    punct = [(u"，", "PU"), (u"。", "PU")] if lang == 'zh' else [(u",", ","), (u".", ".")]
+    raw = u"" if lang == 'zh' else u".START \n\n"
+    sentences = []
+    n_sentences = max(2, int(rng.gauss(scale['sentences'], scale['sentences'] / 3.)))
+    paragraph_left = 0
+    for _ in range(n_sentences):
+        # paragraph or sentence separator
+        if paragraph_left == 0:
+            if sentences:
+                raw += u"\n\n"
+            paragraph_left = rng.randint(2, 6)
+        elif sentences:
+            raw += sep
+        paragraph_left -= 1
+
+        # words with POS tags
+        n_words = max(3, int(rng.gauss(scale['words'], scale['words'] / 3.)))
+        tokens = [ vocab[_weighted_choice(rng, vocab_cum)]  for _ in range(n_words - 1) ]
+        for k in range(3, len(tokens), rng.randint(6, 12)):
+            tokens[k] = punct[0]
+        tokens.append(punct[1])
+
+        words = []
+        for k, (word, pos_tag) in enumerate(tokens):
+            if k > 0:
+                raw += sep
+            words.append([word, {'CharacterOffsetBegin': len(raw), 'CharacterOffsetEnd': len(raw) + len(word), 'Linkers': [], 'PartOfSpeech': pos_tag}])
+            raw += word
+
+        # dependency tree (first word is root)
+        dependencies = [[u"root", u"ROOT-0", u"{}-1".format(tokens[0][0])]]
+        for k in range(2, len(tokens) + 1):
+            gov = rng.randint(1, k - 1)
+            dependencies.append([rng.choice(_dep_labels), u"{}-{}".format(tokens[gov - 1][0], gov), u"{}-{}".format(tokens[k - 1][0], k)])
+
+        sentences.append({
+            'dependencies': dependencies,
+            'parsetree': _make_parsetree([ w  for w, _ in tokens ], [ p  for _, p in tokens ], rng, lang),
+            'words': words,
+        })
+    return {'sentences': sentences}, raw + u"\n"
+
+
+def _make_span(raw, parse, tokens):
+    """Make relation span from (sentence id, token id in sentence) pairs."""
+
+    token_offsets = []
+    offset = 0
+    for sentence in parse['sentences']:
+        token_offsets.append(offset)
+        offset += len(sentence['words'])
+
+    token_list = []
+    spans = []
+    for sentence_id, k in tokens:
+        meta = parse['sentences'][sentence_id]['words'][k][1]
+        b, e = meta['CharacterOffsetBegin'], meta['CharacterOffsetEnd']
+        token_list.append([b, e, token_offsets[sentence_id] + k, sentence_id, k])
+        if spans and token_list[-2][2] + 1 == token_list[-1][2]:
+            spans[-1][1] = e  # extend span of consecutive tokens
+        else:
+            spans.append([b, e])
+    return {
+        'CharacterSpanList': spans,
+        'RawText': u" ".join( raw[b:e]  for b, e in spans ),
+        'TokenList': token_list,
+    }
+
+
+def _make_relations(doc_id, rel_id, rng, parse, raw, scale, lang):
+    """Make relations between adjacent sentences and add linkers to their tokens."""
+
+    types = ZH_TYPES if lang == 'zh' else EN_TYPES
+    senses = ZH_SENSES if lang == 'zh' else EN_SENSES
+    types_cum = _cum_weights([ w  for _, w in types ])
+
+    relations = []
+    sentences = parse['sentences']
+    for sentence_id in range(len(sentences) - 1):
+        if rng.random() >= scale['rels']:
+            continue
+        rel_type = types[_weighted_choice(rng, types_cum)][0]
+        arg1 = [ (sentence_id, k)  for k in range(len(sentences[sentence_id]['words']) - 1) ]
+        arg2 = [ (sentence_id + 1, k)  for k in range(len(sentences[sentence_id + 1]['words']) - 1) ]
+        conn = []
+        punc = []
+        punc_type = ""
+        if rel_type == 'Explicit':
+            conn, arg2 = arg2[:1], arg2[1:]
+        if lang == 'zh' and rel_type == 'Implicit':
+            punc = [(sentence_id, len(sentences[sentence_id]['words']) - 1)]
+            punc_type = "Period"
+
+        relation = {
+            'Arg1': _make_span(raw, parse, arg1),
+            'Arg2': _make_span(raw, parse, arg2),
+            'Connective': _make_span(raw, parse, conn),
+            'DocID': doc_id,
+            'ID': rel_id,
+            'Sense': ["EntRel"] if rel_type == 'EntRel' else [rng.choice(senses)],
+            'Type': rel_type,
+        }
+        if lang == 'zh':
+            relation['Punctuation'] = _make_span(raw, parse, punc)
+            relation['Punctuation']['PunctuationType'] = punc_type
+        relations.append(relation)
+
+        # linkers of tokens
+        for part, tokens in [("arg1", arg1), ("arg2", arg2), ("conn", conn), ("punct", punc)]:
+            for s, k in tokens:
+                sentences[s]['words'][k][1]['Linkers'].append(u"{}_{}".format(part, rel_id))
+        rel_id += 1
+    return relations
+
+
+def generate_dataset(dataset_dir, lang='en', scale='trial', seed=0, vocab_size=20000):
+    """Generate synthetic CoNLL16st dataset (`parses.json`, `raw/`, `relations.json`, `relations-no-senses.json`).
+
+    Scale is a name from `SCALES` or a dict with numbers of documents, mean sentences per document, mean words per sentence, and relations per sentence. Returns counts of generated documents, sentences, words, and relations.
+
+        generate_dataset("./synthetic-en-train", lang='en', scale='en-train')
+    """
+    if not isinstance(scale, dict):
+        scale = SCALES[scale]
+    rng = random.Random(seed)
+    vocab = _make_vocab(rng, vocab_size, lang)
+    vocab_cum = _cum_weights([ 1. / (i + 1)  for i in range(len(vocab)) ])
+
+    if not os.path.isdir(os.path.join(dataset_dir, "raw")):
+        os.makedirs(os.path.join(dataset_dir, "raw"))
+    counts = {'docs': 0, 'sentences': 0, 'words': 0, 'rels': 0}
+    rel_id = 10000
+    with codecs.open(os.path.join(dataset_dir, "parses.json"), 'w', encoding='utf8') as f_parses, \
+         codecs.open(os.path.join(dataset_dir, "relations.json"), 'w', encoding='utf8') as f_rels, \
+         codecs.open(os.path.join(dataset_dir, "relations-no-senses.json"), 'w', encoding='utf8') as f_relsnos:
+        f_parses.write(u"{")
+        for i in range(scale['docs']):
+            doc_id = u"{}_{:04d}".format("chtb" if lang == 'zh' else "wsj", i)
+            parse, raw = _make_document(doc_id, rng, vocab, vocab_cum, scale, lang)
+            relations = _make_relations(doc_id, rel_id, rng, parse, raw, scale, lang)
+            rel_id += len(relations)
+
+            # write documents incrementally
+            if i > 0:
+                f_parses.write(u", ")
+            f_parses.write(u"{}: {}".format(json.dumps(doc_id), json.dumps(parse, ensure_ascii=False)))
+            with codecs.open(os.path.join(dataset_dir, "raw", doc_id), 'w', encoding='utf8') as f:
+                f.write(raw)
+            for relation in relations:
+                f_rels.write(json.dumps(relation, sort_keys=True, ensure_ascii=False) + u"\n")
+                relation['Sense'] = []
+                relation['Type'] = ""
+                f_relsnos.write(json.dumps(relation, sort_keys=True, ensure_ascii=False) + u"\n")
+
+            counts['docs'] += 1
+            counts['sentences'] += len(parse['sentences'])
+            counts['words'] += sum( len(s['words'])  for s in parse['sentences'] )
+            counts['rels'] += len(relations)
+        f_parses.write(u"}")
+    return counts
+
+
+### Tests
+
+def test_generate_dataset():
+    import shutil
+    import tempfile
+    from .load import Conll16stDataset
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for lang in ['en', 'zh']:
+            dataset_dir = os.path.join(tmp_dir, lang)
+            counts = generate_dataset(dataset_dir, lang=lang, scale={'docs': 3, 'sentences': 10, 'words': 15, 'rels': 0.8}, vocab_size=200)
+            assert generate_dataset(os.path.join(tmp_dir, lang + "2"), lang=lang, scale={'docs': 3, 'sentences': 10, 'words': 15, 'rels': 0.8}, vocab_size=200) == counts
+
+            dataset = Conll16stDataset(dataset_dir, lang=lang)
+            assert len(dataset['doc_ids']) == counts['docs']
+            assert sum( len(words)  for words in dataset['words'].values() ) == counts['words']
+            assert len(dataset['rel_ids']) == counts['rels'] > 0
+            assert sum( len(trees)  for trees in dataset['parsetrees'].values() ) == counts['sentences']
+            assert set(dataset['rel_types'].values()) <= set( t  for t, _ in (ZH_TYPES if lang == 'zh' else EN_TYPES) )
+            for doc_id in dataset['doc_ids']:
+                assert any( meta['ParagraphID'] > 0  for meta in dataset['word_metas'][doc_id] ) or lang == 'zh'
+                assert len(dataset['dependencies'][doc_id]) == len(dataset['words'][doc_id]) + 1
+            for rel_id in dataset['rel_ids']:
+                rel = dataset['rel_parts'][rel_id]
+                for token_id in rel['Arg1']:
+                    assert rel_id in dataset['word_metas'][rel['DocID']][token_id]['RelationIDs']
+
+            dataset_nos = Conll16stDataset(dataset_dir, lang=lang, filter_types=["Explicit"])
+            assert set(dataset_nos['rel_types'].values()) == set(["Explicit"])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
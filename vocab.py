@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=C0103
+"""
+Interned vocabularies for integer encoding of words/tokens, POS tags, relation types and senses.
+"""
+__author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
+__license__ = "GPLv3+"
+
+from array import array
+
+from six.moves import intern
+
+from .files import load_parses
+from .words import get_words, get_pos_tags
+
+
+class Vocab(object):
+    """Vocabulary of interned strings mapped to consecutive integer ids.
+
+    Id 0 is reserved for unknown strings (if `unknown` is not `None`). Frozen vocabularies are not extended anymore and encode new strings as unknown.
+
+        vocab.encode("Kemper") = 1
+        vocab.decode(1) = "Kemper"
+    """
+
+    def __init__(self, strs=(), unknown="<UNK>", frozen=False):
+        self.unknown = unknown
+        self.frozen = False
+        self.id_to_str = []
+        self.str_to_id = {}
+        if unknown is not None:
+            self.add(unknown)
+        for s in strs:
+            self.add(s)
+        self.frozen = frozen
+
+    def add(self, s):
+        """Add string to vocabulary and return its id."""
+
+        try:
+            return self.str_to_id[s]
+        except KeyError:
+            if self.frozen:
+                raise KeyError("Frozen vocabulary is missing string ({})!".format(s))
+            s = intern(s)
+            i = len(self.id_to_str)
+            self.id_to_str.append(s)
+            self.str_to_id[s] = i
+            return i
+
+    def encode(self, s):
+        """Encode string as id (extending vocabulary unless frozen)."""
+
+        try:
+            return self.str_to_id[s]
+        except KeyError:
+            if self.frozen and self.unknown is not None:
+                return 0
+            return self.add(s)
+
+    def decode(self, i):
+        """Decode id to string."""
+
+        return self.id_to_str[i]
+
+    def encode_seq(self, strs):
+        """Encode sequence of strings as compact integer array."""
+
+        return array('i', [ self.encode(s)  for s in strs ])
+
+    def decode_seq(self, ids):
+        """Decode sequence of ids to list of strings."""
+
+        return [ self.id_to_str[i]  for i in ids ]
+
+    def intern_seq(self, strs):
+        """Replace strings in list in-place with their interned vocabulary instances."""
+
+        for j, s in enumerate(strs):
+            i = self.str_to_id.get(s)
+            if i is not None:
+                strs[j] = self.id_to_str[i]
+        return strs
+
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def __contains__(self, s):
+        return s in self.str_to_id
+
+    def __len__(self):
+        return len(self.id_to_str)
+
+    def __repr__(self):
+        return "{}(size: {}, frozen: {})".format(self.__class__.__name__, len(self), self.frozen)
+
+
+def build_vocabs(words, pos_tags, rel_types, rel_senses, vocabs=None):
+    """Build (or extend not frozen) vocabularies of words/tokens, POS tags, relation types and senses.
+
+        vocabs = {'words': Vocab(...), 'pos_tags': Vocab(...), 'rel_types': Vocab(...), 'rel_senses': Vocab(...)}
+    """
+    if vocabs is None:
+        vocabs = {}
+    for k in ['words', 'pos_tags', 'rel_types', 'rel_senses']:
+        if k not in vocabs:
+            vocabs[k] = Vocab()
+
+    for doc_id in sorted(words):
+        for s in words[doc_id]:
+            vocabs['words'].encode(s)
+    for doc_id in sorted(pos_tags):
+        for s in pos_tags[doc_id]:
+            vocabs['pos_tags'].encode(s)
+    for rel_id in sorted(rel_types):
+        vocabs['rel_types'].encode(rel_types[rel_id])
+    for rel_id in sorted(rel_senses):
+        rel_sense_all = rel_senses[rel_id]
+        if isinstance(rel_sense_all, str):  # only first sense
+            rel_sense_all = (rel_sense_all,)
+        for s in rel_sense_all:
+            vocabs['rel_senses'].encode(s)
+    return vocabs
+
+
+def freeze_vocabs(vocabs):
+    """Freeze all vocabularies (eg. from training dataset before loading validation/test datasets)."""
+
+    for vocab in vocabs.values():
+        vocab.freeze()
+    return vocabs
+
+
+def encode_docs(docs, vocab):
+    """Encode strings by document id and token id as compact integer arrays by document id.
+
+        words_ids["wsj_1000"] = array('i', [1, 2, 3, 4, 5, 6, ...])
+    """
+
+    return { doc_id: vocab.encode_seq(docs[doc_id])  for doc_id in docs }
+
+
+def decode_docs(docs_ids, vocab):
+    """Decode integer arrays by document id back to strings by document id and token id."""
+
+    return { doc_id: vocab.decode_seq(docs_ids[doc_id])  for doc_id in docs_ids }
+
+
+### Tests
+
+def test_vocab():
+    vocab = Vocab(["a", "b"])
+    assert len(vocab) == 3
+    assert vocab.encode("a") == 1
+    assert vocab.encode("c") == 3
+    assert vocab.decode(3) == "c"
+    assert list(vocab.encode_seq(["b", "a", "b"])) == [2, 1, 2]
+    assert vocab.decode_seq([2, 1]) == ["b", "a"]
+
+    vocab.freeze()
+    assert vocab.encode("d") == 0
+    assert "d" not in vocab
+    assert vocab.decode(0) == "<UNK>"
+
+def test_encode_docs():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+    t_words_ids = [1, 2, 3, 4, 5, 6]
+    t_pos_ids = [1, 1, 2, 1, 3, 4]
+
+    parses = load_parses(dataset_dir)
+    words = get_words(parses)
+    pos_tags = get_pos_tags(parses)
+    vocabs = build_vocabs(words, pos_tags, {}, {})
+    words_ids = encode_docs(words, vocabs['words'])
+    pos_ids = encode_docs(pos_tags, vocabs['pos_tags'])
+    assert list(words_ids[t_doc_id][:len(t_words_ids)]) == t_words_ids
+    assert list(pos_ids[t_doc_id][:len(t_pos_ids)]) == t_pos_ids
+    assert decode_docs(words_ids, vocabs['words']) == words
+    assert decode_docs(pos_ids, vocabs['pos_tags']) == pos_tags
+
+    # unknown words with frozen vocabulary
+    freeze_vocabs(vocabs)
+    words_ids = encode_docs({t_doc_id: ["Kemper", "unseen"]}, vocabs['words'])
+    assert list(words_ids[t_doc_id]) == [1, 0]
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main(['-s', __file__])
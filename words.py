@@ -10,6 +10,12 @@ __author__ = "GW [http://gw.tnode.com/] <gw.2016@tnode.com>"
 __license__ = "GPLv3+"
 
 import re
+from array import array
+from bisect import bisect_left, bisect_right
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
 from .files import load_parses, load_raws
 
@@ -45,8 +51,287 @@ def get_pos_tags(parses):
     return pos_tags
 
 
-def get_word_metas(parses, raws):
-    """Extract other metadata of words/tokens by document id and token id from CoNLL16st corpus.
+RELATION_PARTS = ('Arg1', 'Arg2', 'Connective', 'Punctuation')
+
+_paragraph_sep_re = re.compile(r"^\W*\n\n\W*$", flags=re.MULTILINE)  # regex for paragraph separator
+_paragraph_sep_gap_re = re.compile(r"\W*\n\n\W*$", flags=re.MULTILINE)  # same for gap `raw[pos:endpos]` without slicing
+_linker_to_span = {"arg1": 'Arg1', "arg2": 'Arg2', "conn": 'Connective', "punct": 'Punctuation'}
+
+
+def is_paragraph_sep(skipped_str):
+    """Check if skipped characters between two words/tokens are a paragraph separator (cheap substring test before regex)."""
+
+    return "\n\n" in skipped_str and _paragraph_sep_re.match(skipped_str) is not None
+
+
+def get_paragraph_offsets(raw, begins, ends):
+    """First token ids of paragraphs of one document from raw text and `CharacterOffsetBegin/End` of its tokens (same as `is_paragraph_sep()` on each gap between tokens).
+
+    Candidate separators (`"\n\n"`) are located once in the whole raw text and mapped to gaps between tokens by binary search, so the regex only runs on the few gaps containing one and no gap is sliced.
+    """
+
+    paragraph_offsets = array('i', [0])
+    tested = -1  # last tested gap (before token id)
+    p = raw.find("\n\n")
+    while p >= 0:
+        k = bisect_right(begins, p)  # first token after candidate
+        if k < len(begins) and k != tested and (k == 0 or ends[k - 1] <= p) and p + 2 <= begins[k]:
+            tested = k
+            if _paragraph_sep_gap_re.match(raw, ends[k - 1] if k else 0, begins[k]) is not None:
+                paragraph_offsets.append(k)
+        p = raw.find("\n\n", p + 1)
+    return paragraph_offsets
+
+
+def get_paragraph_ids(raw, begins, ends):
+    """Paragraph ids by token id of one document (see `get_paragraph_offsets()`)."""
+
+    paragraph_offsets = get_paragraph_offsets(raw, begins, ends)
+    paragraph_ids = array('i')
+    for paragraph_id, token_begin in enumerate(paragraph_offsets):
+        token_end = paragraph_offsets[paragraph_id + 1] if paragraph_id + 1 < len(paragraph_offsets) else len(begins)
+        paragraph_ids.extend(array('i', [paragraph_id]) * (token_end - token_begin))
+    return paragraph_ids
+
+
+def _token_offsets(parse):
+    """Arrays of `CharacterOffsetBegin` and `CharacterOffsetEnd` by token id of one document."""
+
+    begins = array('i')
+    ends = array('i')
+    for sentence_dict in parse['sentences']:
+        for token in sentence_dict['words']:
+            begins.append(token[1]['CharacterOffsetBegin'])
+            ends.append(token[1]['CharacterOffsetEnd'])
+    return begins, ends
+
+
+def linkers_to_relations(linkers, linker_split="_"):
+    """Convert linkers of word/token (eg. "arg1_14890") to lists of discourse relation ids and parts."""
+
+    rel_ids = []
+    rel_parts = []
+    for linker in linkers:
+        linker_span, rel_id = linker.rsplit(linker_split, 1)
+        rel_ids.append(int(rel_id))
+        rel_parts.append(_linker_to_span[linker_span])
+    return rel_ids, rel_parts
+
+
+class WordMetas(Sequence):
+    """Columnar metadata of words/tokens of one document by token id.
+
+    Numeric fields are stored in compact integer arrays (usable with `numpy.frombuffer`), relation ids, parts and tags in CSR-style arrays with offsets by token id. Indexing returns a newly built metadata dict (changes to it are not stored).
+
+        word_metas['wsj_1000'].sentence_ids = array('i', [0, 0, 0, ...])
+        word_metas['wsj_1000'][0]['SentenceID'] = 0
+    """
+
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+        self.texts = []
+        self.paragraph_ids = array('i')
+        self.sentence_ids = array('i')
+        self.sentence_offsets = array('i')
+        self.sentence_offset_ends = array('i')
+        self.token_ids = array('i')
+        self.rel_offsets = array('i', [0])  # relations of token i are in [rel_offsets[i]:rel_offsets[i + 1]]
+        self.rel_ids = array('i')
+        self.rel_parts = array('b')  # index into RELATION_PARTS
+        self.tag_offsets = None  # relation tags of token i are in [tag_offsets[i]:tag_offsets[i + 1]]
+        self.tags = None
+
+    @classmethod
+    def from_columns(cls, doc_id, texts, paragraph_ids, sentence_ids, sentence_offsets, sentence_offset_ends, token_ids, rel_offsets, rel_ids, rel_parts):
+        """Build from existing columns (any sequences, eg. memory-mapped arrays)."""
+
+        metas = cls(doc_id)
+        metas.texts = texts
+        metas.paragraph_ids = paragraph_ids
+        metas.sentence_ids = sentence_ids
+        metas.sentence_offsets = sentence_offsets
+        metas.sentence_offset_ends = sentence_offset_ends
+        metas.token_ids = token_ids
+        metas.rel_offsets = rel_offsets
+        metas.rel_ids = rel_ids
+        metas.rel_parts = rel_parts
+        return metas
+
+    def append(self, text, paragraph_id, sentence_id, sentence_offset, sentence_offset_end, token_id, rel_ids, rel_parts):
+        self.texts.append(text)
+        self.paragraph_ids.append(paragraph_id)
+        self.sentence_ids.append(sentence_id)
+        self.sentence_offsets.append(sentence_offset)
+        self.sentence_offset_ends.append(sentence_offset_end)
+        self.token_ids.append(token_id)
+        self.rel_ids.extend(rel_ids)
+        self.rel_parts.extend( RELATION_PARTS.index(p)  for p in rel_parts )
+        self.rel_offsets.append(len(self.rel_ids))
+
+    def set_relation_tags(self, tags_by_token, packed=False):
+        """Store relation tags of all tokens in CSR-style arrays (`packed` integer tags in a compact array)."""
+
+        self.tag_offsets = array('i', [0])
+        self.tags = array('q') if packed else []
+        for tags in tags_by_token:
+            self.tags.extend(tags)
+            self.tag_offsets.append(len(self.tags))
+
+    def column(self, name):
+        """Get whole column of metadata field by name."""
+
+        return {
+            'Text': self.texts,
+            'ParagraphID': self.paragraph_ids,
+            'SentenceID': self.sentence_ids,
+            'SentenceOffset': self.sentence_offsets,
+            'SentenceOffsetEnd': self.sentence_offset_ends,
+            'TokenID': self.token_ids,
+        }[name]
+
+    def relation_ids(self, i):
+        return tuple(self.rel_ids[self.rel_offsets[i]:self.rel_offsets[i + 1]])
+
+    def relation_parts(self, i):
+        return tuple( RELATION_PARTS[p]  for p in self.rel_parts[self.rel_offsets[i]:self.rel_offsets[i + 1]] )
+
+    def relation_tags(self, i):
+        return tuple(self.tags[self.tag_offsets[i]:self.tag_offsets[i + 1]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self[j]  for j in range(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        meta = {
+            'Text': self.texts[i],
+            'DocID': self.doc_id,
+            'ParagraphID': self.paragraph_ids[i],
+            'SentenceID': self.sentence_ids[i],
+            'SentenceOffset': self.sentence_offsets[i],
+            'SentenceOffsetEnd': self.sentence_offset_ends[i],
+            'TokenID': self.token_ids[i],
+            'RelationIDs': self.relation_ids(i),
+            'RelationParts': self.relation_parts(i),
+        }
+        if self.tags is not None:
+            meta['RelationTags'] = self.relation_tags(i)
+        return meta
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+
+class CharOffsetIndex(object):
+    """Index of character offsets of words/tokens of one document for mapping character spans to token ids and back.
+
+    Sorted arrays of `CharacterOffsetBegin/End`, sentence ids and token numbers within sentence by token id are built once from parses (with paragraph boundaries if raw text is given), all queries use binary search.
+
+        index.span_to_tokens(4564, 4610) = [879, 880, 881, 882, 883, 884, 885, 886]
+        index.tokens_to_spans([877, 889, 890]) = [[4557, 4560], [4617, 4623]]
+        index.token_list([877]) = [[4557, 4560, 877, 32, 0]]
+    """
+
+    def __init__(self, parse, raw=None):
+        self.begins = array('i')
+        self.ends = array('i')
+        self.sentence_ids = array('i')
+        self.sentence_token_ids = array('i')  # token number within sentence
+        self.paragraph_ids = None
+        self.paragraph_offsets = None  # first token id of each paragraph
+        for sentence_id, sentence_dict in enumerate(parse['sentences']):
+            for sentence_token_id, token in enumerate(sentence_dict['words']):
+                self.begins.append(token[1]['CharacterOffsetBegin'])
+                self.ends.append(token[1]['CharacterOffsetEnd'])
+                self.sentence_ids.append(sentence_id)
+                self.sentence_token_ids.append(sentence_token_id)
+
+        if raw is not None:
+            # precompute paragraph boundaries
+            self.paragraph_ids = get_paragraph_ids(raw, self.begins, self.ends)
+            self.paragraph_offsets = get_paragraph_offsets(raw, self.begins, self.ends)
+
+    def __len__(self):
+        return len(self.begins)
+
+    def token_at(self, offset):
+        """Token id containing given character offset (or `None` if between tokens)."""
+
+        i = bisect_right(self.ends, offset)
+        if i < len(self.begins) and self.begins[i] <= offset:
+            return i
+        return None
+
+    def span_to_tokens(self, begin, end):
+        """Token ids overlapping character span `[begin, end)`."""
+
+        lo = bisect_right(self.ends, begin)
+        hi = bisect_left(self.begins, end)
+        return list(range(lo, hi))
+
+    def spans_to_tokens(self, spans):
+        """Token ids overlapping any of character spans (eg. `CharacterSpanList`)."""
+
+        token_ids = []
+        for begin, end in spans:
+            token_ids.extend(self.span_to_tokens(begin, end))
+        return token_ids
+
+    def tokens_to_spans(self, token_ids):
+        """Character spans of token ids (consecutive token ids are merged into one span)."""
+
+        spans = []
+        prev_token_id = None
+        for token_id in token_ids:
+            if prev_token_id is not None and token_id == prev_token_id + 1:
+                spans[-1][1] = self.ends[token_id]
+            else:
+                spans.append([self.begins[token_id], self.ends[token_id]])
+            prev_token_id = token_id
+        return spans
+
+    def token_list(self, token_ids):
+        """Detailed token list of token ids as in CoNLL16st relations (`[begin, end, token id, sentence id, token number within sentence]`)."""
+
+        return [ [self.begins[i], self.ends[i], i, self.sentence_ids[i], self.sentence_token_ids[i]]  for i in token_ids ]
+
+    def paragraph_span(self, paragraph_id):
+        """Token ids `token_begin..token_end` (inclusive) of given paragraph."""
+
+        if self.paragraph_offsets is None:
+            raise ValueError("Missing raw text for paragraph boundaries!")
+        token_begin = self.paragraph_offsets[paragraph_id]
+        if paragraph_id + 1 < len(self.paragraph_offsets):
+            return token_begin, self.paragraph_offsets[paragraph_id + 1] - 1
+        return token_begin, len(self.begins) - 1
+
+
+def get_char_offset_indexes(parses, raws=None):
+    """Build indexes of character offsets of words/tokens by document id (optionally with paragraph boundaries from raw texts).
+
+        char_indexes["wsj_1000"].span_to_tokens(4564, 4610) = [879, 880, 881, 882, 883, 884, 885, 886]
+    """
+
+    char_indexes = {}
+    for doc_id in parses:
+        raw = raws[doc_id] if raws is not None and doc_id in raws else None
+        char_indexes[doc_id] = CharOffsetIndex(parses[doc_id], raw=raw)
+    return char_indexes
+
+
+def get_word_metas(parses, raws, columnar=False):
+    """Extract other metadata of words/tokens by document id and token id from CoNLL16st corpus (optionally as columnar `WordMetas`).
 
         word_metas['wsj_1000'][0] = {
             'Text': 'Kemper',
@@ -60,54 +345,48 @@ def get_word_metas(parses, raws):
             'RelationParts': ('Arg1',),
         }
     """
-    paragraph_sep="^\W*\n\n\W*$"  # regex for paragraph separator
-    linker_split = "_"
-    linker_to_span = {"arg1": 'Arg1', "arg2": 'Arg2', "conn": 'Connective', "punct": 'Punctuation'}
 
     word_metas = {}
     for doc_id in parses:
-        paragraph_id = 0  # paragraph number within document
         sentence_id = 0  # sentence number within document
         token_id = 0  # token number within document
-        prev_token_end = 0  # previous token last character offset
 
-        word_metas[doc_id] = []
+        # precompute paragraph ids
+        if doc_id not in raws:
+            raise Exception("Missing raw text ({})".format(doc_id))
+        paragraph_ids = get_paragraph_ids(raws[doc_id], *_token_offsets(parses[doc_id]))
+
+        if columnar:
+            word_metas[doc_id] = WordMetas(doc_id)
+        else:
+            word_metas[doc_id] = []
         for sentence_dict in parses[doc_id]['sentences']:
             sentence_offset = token_id  # first token number in sentence
             sentence_offset_end = token_id + len(sentence_dict['words']) - 1  # last token number in sentence
 
             for token in sentence_dict['words']:
                 word = token[0]
-
-                # check for paragraph separator
-                if doc_id not in raws:
-                    raise Exception("Missing raw text ({})".format(doc_id))
-                skipped_str = raws[doc_id][prev_token_end:token[1]['CharacterOffsetBegin']]
-                if re.match(paragraph_sep, skipped_str, flags=re.MULTILINE):
-                    paragraph_id += 1
-                prev_token_end = token[1]['CharacterOffsetEnd']
+                paragraph_id = paragraph_ids[token_id]
 
                 # discourse relations metadata
-                rel_ids = []
-                rel_parts = []
-                for linker in token[1]['Linkers']:
-                    linker_span, rel_id = linker.rsplit(linker_split, 1)
-                    rel_ids.append(int(rel_id))
-                    rel_parts.append(linker_to_span[linker_span])
+                rel_ids, rel_parts = linkers_to_relations(token[1]['Linkers'])
 
                 # save metadata
-                meta = {
-                    'Text': word,
-                    'DocID': doc_id,
-                    'ParagraphID': paragraph_id,
-                    'SentenceID': sentence_id,
-                    'SentenceOffset': sentence_offset,
-                    'SentenceOffsetEnd': sentence_offset_end,
-                    'TokenID': token_id,
-                    'RelationIDs': tuple(rel_ids),
-                    'RelationParts': tuple(rel_parts),
-                }
-                word_metas[doc_id].append(meta)
+                if columnar:
+                    word_metas[doc_id].append(word, paragraph_id, sentence_id, sentence_offset, sentence_offset_end, token_id, rel_ids, rel_parts)
+                else:
+                    meta = {
+                        'Text': word,
+                        'DocID': doc_id,
+                        'ParagraphID': paragraph_id,
+                        'SentenceID': sentence_id,
+                        'SentenceOffset': sentence_offset,
+                        'SentenceOffsetEnd': sentence_offset_end,
+                        'TokenID': token_id,
+                        'RelationIDs': tuple(rel_ids),
+                        'RelationParts': tuple(rel_parts),
+                    }
+                    word_metas[doc_id].append(meta)
                 token_id += 1
             sentence_id += 1
     return word_metas
@@ -181,6 +460,77 @@ def test_word_metas():
     assert word_metas[doc_id][t_meta1['TokenID']] == t_meta1
     assert word_metas[doc_id][t_meta2['TokenID']] == t_meta2
 
+def test_word_metas_columnar():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+    t_sentence_ids = [0] * 30 + [1]
+
+    parses = load_parses(dataset_dir)
+    raws = load_raws(dataset_dir, [doc_id])
+    word_metas = get_word_metas(parses, raws)
+    word_metas_columnar = get_word_metas(parses, raws, columnar=True)
+    metas = word_metas_columnar[doc_id]
+    assert isinstance(metas, WordMetas)
+    assert len(metas) == len(word_metas[doc_id])
+    assert metas[894] == word_metas[doc_id][894]
+    assert metas[-1] == word_metas[doc_id][-1]
+    assert metas[10:20] == word_metas[doc_id][10:20]
+    assert metas == word_metas[doc_id]
+    assert list(metas.column('SentenceID')[:31]) == t_sentence_ids
+    assert metas.column('Text') == [ m['Text']  for m in word_metas[doc_id] ]
+
+def test_paragraph_ids():
+    dataset_dir = "./conll16st-en-trial"
+    t_doc_id = "wsj_1000"
+
+    def _paragraph_ids_sliced(raw, begins, ends):
+        paragraph_ids = []
+        paragraph_id = 0
+        prev_token_end = 0
+        for begin, end in zip(begins, ends):
+            if is_paragraph_sep(raw[prev_token_end:begin]):
+                paragraph_id += 1
+            prev_token_end = end
+            paragraph_ids.append(paragraph_id)
+        return paragraph_ids
+
+    parses = load_parses(dataset_dir)
+    raws = load_raws(dataset_dir, [t_doc_id])
+    begins, ends = _token_offsets(parses[t_doc_id])
+    paragraph_ids = get_paragraph_ids(raws[t_doc_id], begins, ends)
+    assert list(paragraph_ids) == _paragraph_ids_sliced(raws[t_doc_id], begins, ends)
+    assert paragraph_ids[-1] == 13
+    assert len(get_paragraph_offsets(raws[t_doc_id], begins, ends)) == 14
+
+    # separators before first token, inside tokens, and with trailing words
+    raw = " .\n\na b\n\n\nfoo c\n \n d e\n\nf"
+    begins = array('i', [4, 6, 14, 19, 21, 24])
+    ends = array('i', [5, 7, 15, 20, 22, 25])
+    assert list(get_paragraph_ids(raw, begins, ends)) == _paragraph_ids_sliced(raw, begins, ends) == [1, 1, 2, 2, 2, 3]
+    assert list(get_paragraph_offsets(raw, begins, ends)) == [0, 0, 2, 5]
+    assert list(get_paragraph_ids(raw, array('i'), array('i'))) == []
+
+def test_char_offset_index():
+    dataset_dir = "./conll16st-en-trial"
+    doc_id = "wsj_1000"
+
+    parses = load_parses(dataset_dir)
+    raws = load_raws(dataset_dir, [doc_id])
+    word_metas = get_word_metas(parses, raws)
+    index = get_char_offset_indexes(parses, raws)[doc_id]
+    assert len(index) == len(word_metas[doc_id])
+    assert list(index.paragraph_ids) == [ m['ParagraphID']  for m in word_metas[doc_id] ]
+    assert index.paragraph_span(13) == (827, 895)
+
+    assert index.span_to_tokens(4564, 4610) == [879, 880, 881, 882, 883, 884, 885, 886]
+    assert index.spans_to_tokens([[4557, 4560], [4617, 4650]]) == [877, 889, 890, 891, 892, 893, 894]
+    assert index.span_to_tokens(4560, 4561) == []  # only whitespace
+    assert index.tokens_to_spans([877, 889, 890, 891, 892, 893, 894]) == [[4557, 4560], [4617, 4650]]
+    assert index.token_list([877, 889]) == [[4557, 4560, 877, 32, 0], [4617, 4619, 889, 32, 12]]
+    assert index.token_at(4558) == 877
+    assert index.token_at(4560) is None
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['-s', __file__])